@@ -0,0 +1,127 @@
+"""Compare full and delta transfers of partially modified files.
+
+Usage:
+    python benchmarks/bench_delta_sync.py [size_mb]
+
+The source accessor pretends to be remote, so the signature is read
+from the sidecar and the missing blocks are fetched with ranged reads.
+
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+
+from bd.storage import delta, transfer
+from bd.storage.accessor import FileSystemAccessor
+
+
+class RemoteAccessor(FileSystemAccessor):
+    """File system accessor counting the bytes read from it."""
+
+    bytes_read = 0
+
+    def get_filesystem_path(self, rpath):
+        return
+
+    def copy_to(self, target_accessor, src_rpath, dst_rpath):
+        return False
+
+    def open_read(self, rpath, offset=0):
+        f = super(RemoteAccessor, self).open_read(rpath, offset)
+        if f is None:
+            return
+
+        accessor = self
+        read = f.read
+
+        class CountingReader(object):
+            def read(self, size=-1):
+                data = read(size)
+                accessor.bytes_read += len(data)
+                return data
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                f.close()
+
+        return CountingReader()
+
+
+def make_variants(size):
+    base = os.urandom(size)
+    middle = size // 2
+    return base, {
+        "unchanged": base,
+        "appended 5%": base + os.urandom(size // 20),
+        "overwritten 1KB": base[:middle] + os.urandom(1024) + base[middle + 1024 :],
+        "inserted 10B": base[:middle] + os.urandom(10) + base[middle:],
+        "truncated 5%": base[: size - size // 20],
+    }
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+
+    root = tempfile.mkdtemp()
+    try:
+        local_accessor = FileSystemAccessor(os.path.join(root, "local"))
+        source_accessor = FileSystemAccessor(os.path.join(root, "remote"))
+        remote_accessor = RemoteAccessor(os.path.join(root, "remote"))
+
+        base, variants = make_variants(size_mb * 1024 * 1024)
+
+        print(
+            "{:<16} {:>10} {:>12} {:>10} {:>12}".format(
+                "variant", "full, s", "full, MB", "delta, s", "delta, MB"
+            )
+        )
+
+        for name, data in variants.items():
+            source_accessor.write("cache.bin", data)
+            delta.write_signature(
+                source_accessor, "cache.bin", remote_accessor, "cache.bin"
+            )
+
+            local_accessor.write("cache.bin", base)
+            remote_accessor.bytes_read = 0
+            start_time = time.time()
+            transfer.copy(remote_accessor, "cache.bin", local_accessor, "cache.bin")
+            full_time, full_bytes = time.time() - start_time, remote_accessor.bytes_read
+
+            local_accessor.write("cache.bin", base)
+            remote_accessor.bytes_read = 0
+            start_time = time.time()
+            delta.copy(
+                remote_accessor,
+                "cache.bin",
+                local_accessor,
+                "cache.bin",
+                local_accessor.get_filesystem_path("cache.bin"),
+            )
+            delta_time = time.time() - start_time
+            delta_bytes = remote_accessor.bytes_read
+
+            assert local_accessor.read("cache.bin") == data
+
+            print(
+                "{:<16} {:>10.2f} {:>12.2f} {:>10.2f} {:>12.2f}".format(
+                    name,
+                    full_time,
+                    full_bytes / 1048576.0,
+                    delta_time,
+                    delta_bytes / 1048576.0,
+                )
+            )
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
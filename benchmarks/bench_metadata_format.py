@@ -0,0 +1,81 @@
+"""Compare serialization of metadata sidecars in the legacy and current formats.
+
+Usage:
+    python benchmarks/bench_metadata_format.py [count]
+
+The current format is measured with the JSON backend that is
+installed, orjson if available, and with the standard library.
+
+"""
+
+import os
+import sys
+import time
+import getpass
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+
+from bd.storage import utils
+
+
+def make_metadata(index):
+    return {
+        "date": datetime.datetime.now(),
+        "user": getpass.getuser(),
+        "comment": "Frame {} of the lighting pass".format(index),
+        "content": {
+            "md5": "{:032x}".format(index),
+            "size": 1024 * index,
+            "mtime": time.time(),
+        },
+        "status": "approved",
+    }
+
+
+def measure(items, version):
+    start_time = time.time()
+    sidecars = [utils.encode_metadata(metadata, version) for metadata in items]
+    encode_time = time.time() - start_time
+
+    start_time = time.time()
+    for sidecar in sidecars:
+        utils.decode_metadata(sidecar)
+    decode_time = time.time() - start_time
+
+    return encode_time, decode_time, sum(len(sidecar) for sidecar in sidecars)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    items = [make_metadata(i) for i in range(count)]
+
+    print(
+        "{:<16} {:>10} {:>10} {:>12}".format(
+            "format", "encode s", "decode s", "size MB"
+        )
+    )
+
+    backend = "orjson" if utils.orjson else "ujson" if utils.ujson else "json"
+    variants = [("v1 json", 1, None), ("v2 " + backend, 2, None)]
+    if backend != "json":
+        variants.append(("v2 json", 2, "json"))
+
+    for name, version, forced_backend in variants:
+        orjson, ujson = utils.orjson, utils.ujson
+        if forced_backend:
+            utils.orjson = utils.ujson = None
+        try:
+            encode_time, decode_time, size = measure(items, version)
+        finally:
+            utils.orjson, utils.ujson = orjson, ujson
+
+        print(
+            "{:<16} {:>10.3f} {:>10.3f} {:>12.2f}".format(
+                name, encode_time, decode_time, size / 1048576.0
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Measure peak RSS of copying a large file between two file system storages.
+
+Usage:
+    python benchmarks/bench_streaming_rss.py [size_mb]
+
+Every mode runs in a separate process, so the reported peak RSS
+is not affected by the other modes.
+
+"""
+
+import os
+import sys
+import shutil
+import resource
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+
+MODES = ("read_write", "streaming", "pull")
+
+# the schema directory of the project is a part of the path
+SCHEMA_TEMPLATE = "{asset}/{asset}.abc"
+RPATH = "bench/cache/cache.abc"
+
+
+def _peak_rss_mb():
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    if sys.platform == "darwin":
+        peak_rss /= 1024
+    return peak_rss / 1024.0
+
+
+def _create_pool(root):
+    from bd.storage.core import StoragePool
+
+    schema_dir = os.path.join(root, "schemas", "bench", "{project}")
+    os.makedirs(schema_dir)
+    with open(os.path.join(schema_dir, "cache.yml"), "w") as f:
+        f.write('tags: [cache]\ntemplate: "{}"\n'.format(SCHEMA_TEMPLATE))
+    os.environ["BD_STORAGE_SCHEMA_PATH"] = os.path.join(root, "schemas")
+
+    return StoragePool.create(
+        {
+            "project": "bench",
+            "storages": [
+                {
+                    "name": name,
+                    "schema": "bench",
+                    "fields": {
+                        "project": {"regex": "\\w+"},
+                        "asset": {"regex": "\\w+"},
+                    },
+                    "accessor": {
+                        "name": "fs",
+                        "kwargs": {"root": os.path.join(root, name)},
+                    },
+                }
+                # the first storage is the downstream one
+                for name in ("dst", "src")
+            ],
+        }
+    )
+
+
+def run_mode(mode, root):
+    from bd.storage import transfer
+    from bd.storage.accessor import FileSystemAccessor
+
+    src_accessor = FileSystemAccessor(os.path.join(root, "src"))
+    dst_accessor = FileSystemAccessor(os.path.join(root, "dst"))
+
+    if mode == "pull":
+        from bd.storage.core import Identifier
+
+        item = _create_pool(root).get_storage_item(
+            Identifier(["cache"], {"asset": "cache"})
+        )
+
+    baseline_rss = _peak_rss_mb()
+
+    if mode == "read_write":
+        dst_accessor.write(RPATH, src_accessor.read(RPATH))
+    elif mode == "streaming":
+        transfer.copy(src_accessor, RPATH, dst_accessor, RPATH)
+    else:
+        item.pull(force=True)
+
+    print(
+        "{:<12} peak RSS: {:8.1f} MB (+{:.1f} MB)".format(
+            mode, _peak_rss_mb(), _peak_rss_mb() - baseline_rss
+        )
+    )
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+
+    root = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(root, "src", RPATH)
+        os.makedirs(os.path.dirname(filename))
+        with open(filename, "wb") as f:
+            chunk = os.urandom(1024 * 1024)
+            for _ in range(size_mb):
+                f.write(chunk)
+
+        print("Copying {} MB file".format(size_mb))
+        for mode in MODES:
+            subprocess.check_call([sys.executable, __file__, "--run", mode, root])
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--run":
+        run_mode(sys.argv[2], sys.argv[3])
+    else:
+        main()
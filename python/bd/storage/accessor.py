@@ -1,17 +1,448 @@
 import os
 import sys
+import json
 import uuid
 import errno
 import shutil
 import logging
+import collections
 
-from six import b, reraise
+from six import b, reraise, BytesIO
+
+import bd.hooks as bd_hooks
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 from .utils import putils
+from .locks import FileLock
 from .errors import *
+from .enums import LinkMode
+from .concurrency import run_async
 
 log = logging.getLogger(__name__)
 
+AccessorStat = collections.namedtuple("AccessorStat", ["size", "mtime", "etag"])
+
+
+def group_by_directory(rpaths):
+    """Group the relative paths by their parent directories.
+
+    Args:
+        rpaths (list[str]): relative paths.
+
+    Returns:
+        dict: relative paths by parent directory.
+
+    """
+    groups = collections.OrderedDict()
+    for rpath in rpaths:
+        groups.setdefault(putils.dirname(rpath), []).append(rpath)
+    return groups
+
+
+def get_base_accessor(accessor):
+    """Get the accessor wrapped by all the accessor wrappers.
+
+    Args:
+        accessor (BaseAccessor): accessor.
+
+    Returns:
+        BaseAccessor: innermost accessor.
+
+    """
+    while isinstance(accessor, AccessorWrapper):
+        accessor = accessor.accessor
+    return accessor
+
+
+class AccessorWriter(object):
+    """Binary file-like object returned by the "open_write" accessor method.
+
+    The written data becomes visible under the target rpath only
+    after the writer is closed. Leaving the "with" block because of
+    an exception aborts the write.
+
+    """
+
+    def __init__(self):
+        self.closed = False
+
+    def write(self, data):
+        raise NotImplementedError()
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        self._commit()
+
+    def abort(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        try:
+            self._abort()
+        except Exception as e:
+            log.warning("Failed to abort write. {}".format(e))
+
+    def _commit(self):
+        raise NotImplementedError()
+
+    def _abort(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class InvalidatingWriter(AccessorWriter):
+    """Writer calling the function once the data is committed."""
+
+    def __init__(self, writer, on_commit):
+        super(InvalidatingWriter, self).__init__()
+        self._writer = writer
+        self._on_commit = on_commit
+
+    def write(self, data):
+        return self._writer.write(data)
+
+    def _commit(self):
+        try:
+            self._writer.close()
+        finally:
+            self._on_commit()
+
+    def _abort(self):
+        self._writer.abort()
+
+
+class PrefixedReader(object):
+    """Stream which first bytes were already read to detect its format."""
+
+    def __init__(self, prefix, stream):
+        self._prefix = prefix
+        self._stream = stream
+        self.closed = False
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data, self._prefix = self._prefix + self._stream.read(), b""
+            return data
+
+        if self._prefix:
+            data, self._prefix = self._prefix[:size], self._prefix[size:]
+            if len(data) < size:
+                data += self._stream.read(size - len(data))
+            return data
+
+        return self._stream.read(size)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class BufferedWriter(AccessorWriter):
+    """Writer which keeps data in memory and writes it on close."""
+
+    def __init__(self, accessor, rpath):
+        super(BufferedWriter, self).__init__()
+        self._accessor = accessor
+        self._rpath = rpath
+        self._buffer = BytesIO()
+
+    def write(self, data):
+        return self._buffer.write(data)
+
+    def _commit(self):
+        self._accessor.write(self._rpath, self._buffer.getvalue())
+
+
+class FileSystemWriter(AccessorWriter):
+    """Writer to a temporary file which replaces the target on close."""
+
+    def __init__(self, filename):
+        super(FileSystemWriter, self).__init__()
+        self._filename = filename
+
+        try:
+            os.makedirs(putils.dirname(filename))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        self._tmp_filename = "{}__{}".format(filename, uuid.uuid4().hex)
+        self._file = open(self._tmp_filename, "wb")
+
+    @property
+    def file(self):
+        return self._file
+
+    def write(self, data):
+        return self._file.write(data)
+
+    def _commit(self):
+        try:
+            self._file.close()
+            os.replace(self._tmp_filename, self._filename)
+        except:
+            exc_info = sys.exc_info()
+            self._abort()
+            reraise(*exc_info)
+
+    def _abort(self):
+        self._file.close()
+
+        if putils.exists(self._tmp_filename):
+            try:
+                os.remove(self._tmp_filename)
+            except (IOError, OSError):
+                log.warning(
+                    'Unable to remove temporary file "{}"'.format(self._tmp_filename)
+                )
+
+
+class PartialFileWriter(AccessorWriter):
+    """Resumable writer to a hidden partial file next to the target.
+
+    The number of safely written bytes is saved to a checkpoint file
+    together with the source state, so an interrupted transfer of the
+    same source can continue from the "offset". The partial file is
+    kept when the write is aborted and renamed to the target on close.
+
+    The partial file is locked while it's written. When another process
+    holds the lock, the data is written to a fresh temporary file which
+    is neither resumed nor kept.
+
+    """
+
+    def __init__(self, filename, source_stat, checkpoint_interval=64 * 1024 * 1024):
+        super(PartialFileWriter, self).__init__()
+        self._filename = filename
+        self._checkpoint_interval = checkpoint_interval
+        self._source_state = list(source_stat)
+
+        dirname, basename = putils.split(filename)
+        self._partial_filename = putils.join(dirname, ".{}.partial".format(basename))
+        self._checkpoint_filename = self._partial_filename + ".json"
+
+        try:
+            os.makedirs(dirname)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        self._lock = FileLock(self._partial_filename + ".lock", blocking=False)
+        if not self._lock.acquire():
+            log.debug(
+                'Partial file "{}" is in use, not resuming'.format(
+                    self._partial_filename
+                )
+            )
+            self._lock = None
+            self._partial_filename = "{}__{}".format(
+                self._partial_filename, uuid.uuid4().hex
+            )
+            self._checkpoint_filename = None
+
+        try:
+            self.offset = self._load_checkpoint()
+            if self.offset:
+                self._file = open(self._partial_filename, "r+b")
+                self._file.truncate(self.offset)
+                self._file.seek(self.offset)
+                log.debug('Resuming "{}" from byte {}'.format(filename, self.offset))
+            else:
+                self._file = open(self._partial_filename, "wb")
+                self._save_checkpoint()
+        except:
+            self._release()
+            raise
+
+        self._unsaved_bytes = 0
+
+    def _load_checkpoint(self):
+        if not self._lock or not putils.exists(self._partial_filename):
+            return 0
+
+        try:
+            with open(self._checkpoint_filename, "r") as f:
+                checkpoint = json.load(f)
+        except (IOError, OSError, ValueError):
+            return 0
+
+        # the source has changed since the previous attempt
+        if checkpoint.get("source") != self._source_state:
+            return 0
+
+        offset = checkpoint.get("offset", 0)
+        if offset > os.path.getsize(self._partial_filename):
+            return 0
+
+        return offset
+
+    def _save_checkpoint(self):
+        if not self._lock:
+            return
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        tmp_filename = "{}__{}".format(self._checkpoint_filename, uuid.uuid4().hex)
+        with open(tmp_filename, "w") as f:
+            json.dump({"source": self._source_state, "offset": self._file.tell()}, f)
+        os.replace(tmp_filename, self._checkpoint_filename)
+
+        self._unsaved_bytes = 0
+
+    def write(self, data):
+        num_bytes = self._file.write(data)
+
+        self._unsaved_bytes += len(data)
+        if self._unsaved_bytes >= self._checkpoint_interval:
+            self._save_checkpoint()
+
+        return num_bytes
+
+    def _commit(self):
+        try:
+            self._file.close()
+            os.replace(self._partial_filename, self._filename)
+
+            if self._checkpoint_filename:
+                try:
+                    os.remove(self._checkpoint_filename)
+                except OSError:
+                    pass
+        finally:
+            self._release()
+
+    def _abort(self):
+        try:
+            self._save_checkpoint()
+        finally:
+            self._file.close()
+
+            # the temporary file can't be resumed
+            if not self._lock:
+                try:
+                    os.remove(self._partial_filename)
+                except OSError:
+                    pass
+
+            self._release()
+
+    def _release(self):
+        # the lock file is kept, so the processes waiting for it
+        # never lock a file which was replaced in the meantime
+        if self._lock:
+            self._lock.release()
+
+
+# linux ioctl request cloning file extents (reflink)
+_FICLONE = 0x40049409
+
+_COPY_FALLBACK_ERRNOS = (
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EBADF,
+    errno.EOPNOTSUPP,
+    getattr(errno, "ENOTSUP", errno.EOPNOTSUPP),
+)
+
+
+def _copy_file_data(src_file, dst_file):
+    """Copy file contents in kernel space when the platform allows it."""
+    src_fd = src_file.fileno()
+    dst_fd = dst_file.fileno()
+    size = os.fstat(src_fd).st_size
+
+    offset = 0
+    try:
+        if hasattr(os, "copy_file_range"):
+            while offset < size:
+                num_bytes = os.copy_file_range(src_fd, dst_fd, size - offset)
+                if not num_bytes:
+                    break
+                offset += num_bytes
+            return
+
+        if hasattr(os, "sendfile") and sys.platform.startswith("linux"):
+            while offset < size:
+                num_bytes = os.sendfile(dst_fd, src_fd, offset, size - offset)
+                if not num_bytes:
+                    break
+                offset += num_bytes
+            return
+    except OSError as e:
+        if offset or e.errno not in _COPY_FALLBACK_ERRNOS:
+            raise
+
+    src_file.seek(0)
+    shutil.copyfileobj(src_file, dst_file)
+
+
+def copy_file(src_filename, dst_filename, link_mode=None):
+    """Atomically copy a file.
+
+    Args:
+        src_filename (str): source file.
+        dst_filename (str): destination file.
+        link_mode (str): one of the LinkMode values. Hard links and
+            reflinks are used only if both files are on the same device
+            and it supports them, otherwise the data is copied.
+
+    """
+    if link_mode == LinkMode.HARDLINK:
+        dst_dirname = putils.dirname(dst_filename)
+        try:
+            os.makedirs(dst_dirname)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        if os.stat(src_filename).st_dev == os.stat(dst_dirname).st_dev:
+            tmp_filename = "{}__{}".format(dst_filename, uuid.uuid4().hex)
+            try:
+                os.link(src_filename, tmp_filename)
+            except OSError as e:
+                if e.errno not in _COPY_FALLBACK_ERRNOS + (errno.EPERM, errno.EMLINK):
+                    raise
+            else:
+                os.replace(tmp_filename, dst_filename)
+                return
+
+    with open(src_filename, "rb") as src_file:
+        with FileSystemWriter(dst_filename) as writer:
+            if link_mode == LinkMode.REFLINK and fcntl is not None:
+                try:
+                    fcntl.ioctl(writer.file.fileno(), _FICLONE, src_file.fileno())
+                    return
+                except (IOError, OSError) as e:
+                    if e.errno not in _COPY_FALLBACK_ERRNOS + (errno.ENOTTY,):
+                        raise
+
+            _copy_file_data(src_file, writer.file)
+
 
 class BaseAccessor(object):
     def __init__(self, root=None):
@@ -36,12 +467,64 @@ class BaseAccessor(object):
     def write(self, rpath, data):
         raise NotImplementedError()
 
+    def create(self, rpath, data):
+        """Write the data only if there is none at the path yet.
+
+        The check and the write are atomic, so only one
+        of the concurrent writers succeeds.
+
+        Args:
+            rpath (str): relative path.
+            data (bytes): data.
+
+        Returns:
+            bool: True if the data was written, False if it exists.
+
+        Raises:
+            NotImplementedError: if the storage has no atomic way to do it.
+
+        """
+        raise NotImplementedError()
+
     def make_dir(self, rpath, recursive=False):
         raise NotImplementedError()
 
     def exists(self, rpath):
         raise NotImplementedError()
 
+    def exists_many(self, rpaths):
+        """Check which of the paths exist.
+
+        The paths are grouped by directory and every directory
+        is listed only once.
+
+        Args:
+            rpaths (list[str]): relative paths.
+
+        Returns:
+            dict: existence flags by relative path.
+
+        """
+        result = {}
+        for dirname, dir_rpaths in group_by_directory(rpaths).items():
+            try:
+                names = set(self.list(dirname, relative=True, recursive=False))
+            except NotImplementedError:
+                names = None
+            except Exception as e:
+                if isinstance(e, OSError) and e.errno == errno.ENOENT:
+                    names = set()
+                else:
+                    names = None
+
+            for rpath in dir_rpaths:
+                if names is None:
+                    result[rpath] = self.exists(rpath)
+                else:
+                    result[rpath] = putils.basename(rpath) in names
+
+        return result
+
     def list(self, rpath, relative=False, recursive=True):
         raise NotImplementedError()
 
@@ -51,57 +534,220 @@ class BaseAccessor(object):
     def get_filesystem_path(self, rpath):
         return
 
+    def stat(self, rpath):
+        """Get size, modification time and entity tag of the data.
+
+        Args:
+            rpath (str): relative path.
+
+        Returns:
+            AccessorStat: data state or None if there is no data.
+                The fields not supported by the accessor are None.
+
+        """
+        raise NotImplementedError()
+
+    def open_read(self, rpath, offset=0):
+        """Open binary file-like object to read the data from.
+
+        Accessors should override it to avoid holding the whole
+        data in memory.
+
+        Args:
+            rpath (str): relative path.
+            offset (int): number of bytes to skip.
+
+        Returns:
+            file-like object or None if there is no data.
+
+        """
+        data = self.read(rpath)
+        if data is None:
+            return
+
+        data_buffer = BytesIO(data)
+        data_buffer.seek(offset)
+        return data_buffer
+
+    def open_write(self, rpath):
+        """Open binary file-like object to write the data to.
+
+        Accessors should override it to avoid holding the whole
+        data in memory.
+
+        Args:
+            rpath (str): relative path.
+
+        Returns:
+            AccessorWriter: writer committing data on close.
+
+        """
+        return BufferedWriter(self, rpath)
+
+    def copy_to(self, target_accessor, src_rpath, dst_rpath):
+        """Copy data to another accessor using a native mechanism.
+
+        Args:
+            target_accessor (BaseAccessor): accessor to copy the data to.
+            src_rpath (str): source relative path.
+            dst_rpath (str): destination relative path.
+
+        Returns:
+            bool: True if the data was copied, False if there is no
+                native way to copy it to the target accessor.
+
+        """
+        return False
+
+    def copy_from(self, source_accessor, src_rpath, dst_rpath):
+        """Copy data from another accessor using a native mechanism.
+
+        Args:
+            source_accessor (BaseAccessor): accessor to copy the data from.
+            src_rpath (str): source relative path.
+            dst_rpath (str): destination relative path.
+
+        Returns:
+            bool: True if the data was copied, False if there is no
+                native way to copy it from the source accessor.
+
+        """
+        return False
+
+    # Asynchronous API. By default the blocking methods are delegated
+    # to the shared executor, native asynchronous accessors should
+    # override these methods.
+
+    async def read_async(self, rpath):
+        return await run_async(self.read, rpath)
+
+    async def write_async(self, rpath, data):
+        return await run_async(self.write, rpath, data)
+
+    async def make_dir_async(self, rpath, recursive=False):
+        return await run_async(self.make_dir, rpath, recursive)
+
+    async def exists_async(self, rpath):
+        return await run_async(self.exists, rpath)
+
+    async def list_async(self, rpath, relative=True, recursive=True):
+        return await run_async(self.list, rpath, relative, recursive)
+
+    async def rm_async(self, rpath):
+        return await run_async(self.rm, rpath)
+
 
 class FileSystemAccessor(BaseAccessor):
+    def __init__(self, root=None, link_mode=None):
+        super(FileSystemAccessor, self).__init__(root)
+        self._link_mode = link_mode
+
     def resolve(self, rpath):
         if not self._root:
             return rpath
         return putils.join(self._root, rpath)
 
     def read(self, rpath):
-        filename = self.resolve(rpath)
-        if not putils.exists(filename):
-            return
-
-        with open(filename, "rb") as f:
-            data = f.read()
-
-        return data
+        try:
+            with open(self.resolve(rpath), "rb") as f:
+                return f.read()
+        except (IOError, OSError) as e:
+            if e.errno in (errno.ENOENT, errno.EISDIR, errno.ENOTDIR):
+                return
+            raise
 
     def write(self, rpath, data):
         if type(data) is str:
             data = b(data)
 
+        with self.open_write(rpath) as f:
+            f.write(data)
+
+    def create(self, rpath, data):
         filename = self.resolve(rpath)
+
         try:
             os.makedirs(putils.dirname(filename))
         except OSError as e:
             if e.errno != errno.EEXIST:
                 raise
 
-        tmp_filename = "{}__{}".format(filename, uuid.uuid4().hex)
         try:
-            with open(tmp_filename, "wb") as f:
-                f.write(data)
-            os.replace(tmp_filename, filename)
-        except:
-            exc_info = sys.exc_info()
+            fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except OSError as e:
+            if e.errno == errno.EEXIST:
+                return False
+            raise
 
-            if putils.exists(tmp_filename):
-                try:
-                    os.remove(tmp_filename)
-                except IOError:
-                    log.warning(
-                        'Unable to remove temporary file "{}"'.format(tmp_filename)
-                    )
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return True
 
-            reraise(*exc_info)
+    def stat(self, rpath):
+        try:
+            stat = os.stat(self.resolve(rpath))
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return
+            raise
+
+        return AccessorStat(stat.st_size, stat.st_mtime, None)
+
+    def open_read(self, rpath, offset=0):
+        filename = self.resolve(rpath)
+        if not putils.exists(filename):
+            return
+
+        f = open(filename, "rb")
+        if offset:
+            f.seek(offset)
+        return f
+
+    def open_write(self, rpath):
+        return FileSystemWriter(self.resolve(rpath))
+
+    def open_partial_write(self, rpath, source_stat):
+        """Open resumable writer of the data described by the source stat.
+
+        Args:
+            rpath (str): relative path.
+            source_stat (AccessorStat): state of the source data.
+
+        Returns:
+            PartialFileWriter: writer which "offset" attribute tells
+                how many bytes were written by the previous attempts.
+
+        """
+        return PartialFileWriter(self.resolve(rpath), source_stat)
+
+    def copy_to(self, target_accessor, src_rpath, dst_rpath):
+        if not isinstance(target_accessor, FileSystemAccessor):
+            return False
+
+        src_filename = self.resolve(src_rpath)
+        if not putils.isfile(src_filename):
+            return False
+
+        copy_file(
+            src_filename,
+            target_accessor.resolve(dst_rpath),
+            target_accessor._link_mode,
+        )
+        return True
 
     def list(self, rpath, relative=True, recursive=True):
         initial_dir = self.resolve(rpath).rstrip("/")
         if not putils.exists(initial_dir):
             raise OSError(errno.ENOENT, 'No such directory: "{}"'.format(initial_dir))
 
+        if not recursive:
+            # a single directory is listed without walking it
+            with os.scandir(initial_dir) as entries:
+                names = [entry.name for entry in entries]
+            if relative:
+                return names
+            return [putils.join(initial_dir, name) for name in names]
+
         start_index = len(initial_dir)
         paths = []
         for root, dirs, files in putils.walk(initial_dir):
@@ -112,10 +758,6 @@ class FileSystemAccessor(BaseAccessor):
 
             paths.extend([putils.join(dirname, x) for x in files])
 
-            if not recursive:
-                paths.extend([putils.join(dirname, x) for x in dirs])
-                break
-
         return paths
 
     def make_dir(self, rpath, recursive=False):
@@ -139,5 +781,130 @@ class FileSystemAccessor(BaseAccessor):
     def exists(self, rpath):
         return putils.exists(self.resolve(rpath))
 
+    def exists_many(self, rpaths):
+        result = {}
+        for dirname, dir_rpaths in group_by_directory(rpaths).items():
+            try:
+                with os.scandir(self.resolve(dirname)) as entries:
+                    names = set(entry.name for entry in entries)
+            except OSError as e:
+                # the access and I/O errors are not reported as missing data
+                if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+                    raise
+                names = set()
+
+            for rpath in dir_rpaths:
+                result[rpath] = putils.basename(rpath) in names
+
+        return result
+
     def get_filesystem_path(self, rpath):
         return self.resolve(rpath)
+
+
+class AccessorWrapper(BaseAccessor):
+    """Base class of the accessors adding behaviour to another accessor.
+
+    Every method is delegated to the wrapped accessor by default.
+
+    Args:
+        accessor (BaseAccessor|dict): wrapped accessor or its
+            configuration with "name" and "kwargs" keys.
+
+    """
+
+    def __init__(self, accessor):
+        super(AccessorWrapper, self).__init__()
+
+        if isinstance(accessor, dict):
+            accessor = create_accessor(accessor)
+
+        self._accessor = accessor
+
+    @property
+    def accessor(self):
+        return self._accessor
+
+    def root(self):
+        return self._accessor.root()
+
+    def resolve(self, rpath):
+        return self._accessor.resolve(rpath)
+
+    def convert_filename_to_rpath(self, filename):
+        return self._accessor.convert_filename_to_rpath(filename)
+
+    def read(self, rpath):
+        return self._accessor.read(rpath)
+
+    def write(self, rpath, data):
+        return self._accessor.write(rpath, data)
+
+    def create(self, rpath, data):
+        return self._accessor.create(rpath, data)
+
+    def make_dir(self, rpath, recursive=False):
+        return self._accessor.make_dir(rpath, recursive)
+
+    def exists(self, rpath):
+        return self._accessor.exists(rpath)
+
+    def exists_many(self, rpaths):
+        return self._accessor.exists_many(rpaths)
+
+    def list(self, rpath, relative=True, recursive=True):
+        return self._accessor.list(rpath, relative, recursive)
+
+    def rm(self, rpath):
+        return self._accessor.rm(rpath)
+
+    def get_filesystem_path(self, rpath):
+        return self._accessor.get_filesystem_path(rpath)
+
+    def stat(self, rpath):
+        return self._accessor.stat(rpath)
+
+    def open_read(self, rpath, offset=0):
+        return self._accessor.open_read(rpath, offset)
+
+    def open_write(self, rpath):
+        return self._accessor.open_write(rpath)
+
+    def copy_to(self, target_accessor, src_rpath, dst_rpath):
+        return self._accessor.copy_to(target_accessor, src_rpath, dst_rpath)
+
+    def copy_from(self, source_accessor, src_rpath, dst_rpath):
+        return self._accessor.copy_from(source_accessor, src_rpath, dst_rpath)
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, repr(self._accessor))
+
+
+def create_accessor(accessor_config):
+    """Create accessor from provided configuration.
+
+    Args:
+        accessor_config (dict): accessor "name" and "kwargs".
+
+    Returns:
+        BaseAccessor: accessor object.
+
+    """
+    accessor_name = accessor_config.get("name")
+    accessor_kwargs = accessor_config.get("kwargs", {})
+
+    if not accessor_name or accessor_name == "fs":
+        return FileSystemAccessor(**accessor_kwargs)
+
+    try:
+        return bd_hooks.execute(
+            "bd.storage.accessor." + accessor_name, **accessor_kwargs
+        ).one()
+    except bd_hooks.HookError:
+        reraise(
+            AccessorCreationError,
+            AccessorCreationError(
+                'Failed to initialize accessor "{}"'.format(accessor_name)
+            ),
+            sys.exc_info()[2],
+        )
@@ -0,0 +1,399 @@
+import os
+import uuid
+import logging
+import threading
+import collections
+from contextlib import contextmanager
+
+from cachetools import TTLCache
+
+from .cache import get_read_cache, DEFAULT_TTL
+from .locks import FileLock, AccessorLock, get_thread_lock
+from .accessor import get_base_accessor
+from .errors import MetadataConflictError, MetadataSerializationError
+from .utils import (
+    putils,
+    dump_json,
+    load_json,
+    parse_metadata,
+    METADATA_FORMAT_KEY,
+    METADATA_FORMAT_VERSION,
+)
+
+log = logging.getLogger(__name__)
+
+METADATA_INDEX_NAME = ".meta_index"
+
+# suffix of the lock object serializing the writers of all the hosts
+WRITER_LOCK_SUFFIX = ".writer"
+
+MAX_RETRIES = 5
+
+# parsed indices of the recently used directories
+_cache = TTLCache(
+    maxsize=1000, ttl=float(os.environ.get("BD_STORAGE_READ_CACHE_TTL", DEFAULT_TTL))
+)
+_cache_lock = threading.Lock()
+
+# batch the updates of the current thread are collected by
+_local = threading.local()
+
+
+def is_metadata_index(rpath):
+    """Check if the rpath is an index file or its lock file.
+
+    Args:
+        rpath (str): relative path.
+
+    Returns:
+        bool: True if it's not a data file.
+
+    """
+    return putils.basename(rpath).startswith(METADATA_INDEX_NAME)
+
+
+class MetadataBundle(object):
+    """Metadata of all the items of a directory kept in one index file.
+
+    Every change is a read-modify-write of the whole index. The writers
+    of the host are serialized by a lock file next to it on the file
+    systems and by a process lock otherwise, the writers of all the hosts
+    by a lock object created exclusively on the storage. A writer doesn't
+    replace the index once its lock expired, as it could have been broken
+    as stale by another writer. The changes made inside "batch_updates"
+    are written once per index at its end.
+
+    The storages which can't create objects exclusively fall back
+    to verifying every write by reading the index back, so a concurrent
+    write of another host is only detected after the fact.
+
+    Args:
+        accessor (BaseAccessor): accessor of the directory.
+        dirname (str): relative path of the directory.
+
+    """
+
+    def __init__(self, accessor, dirname):
+        self._accessor = accessor
+        self._rpath = METADATA_INDEX_NAME
+        if dirname:
+            self._rpath = putils.join(dirname, METADATA_INDEX_NAME)
+
+    @property
+    def rpath(self):
+        return self._rpath
+
+    @property
+    def key(self):
+        """tuple: accessor and relative path identifying the index."""
+        return self._accessor, self._rpath
+
+    def _read(self, cached=False):
+        key = self.key
+        caching = cached and get_read_cache().enabled
+
+        if caching:
+            with _cache_lock:
+                state = _cache.get(key)
+            if state is not None:
+                return state
+
+        content = self._accessor.read(self._rpath)
+        if content:
+            data = load_json(content)
+            state = (
+                data.get("revision", 0),
+                data.get("writer"),
+                data.get("items", {}),
+                data.get(METADATA_FORMAT_KEY, METADATA_FORMAT_VERSION),
+            )
+        else:
+            state = (0, None, {}, METADATA_FORMAT_VERSION)
+
+        if caching:
+            with _cache_lock:
+                _cache[key] = state
+
+        return state
+
+    def _invalidate(self):
+        with _cache_lock:
+            _cache.pop(self.key, None)
+
+    def _lock(self):
+        filename = self._accessor.get_filesystem_path(self._rpath)
+        if filename:
+            return FileLock(filename + ".lock")
+
+        return get_thread_lock(
+            "{}:{}".format(id(self._accessor), self._rpath.lstrip("/"))
+        )
+
+    def get(self, name):
+        """Get metadata of the item.
+
+        Args:
+            name (str): file name of the item.
+
+        Returns:
+            dict: metadata or None if the item has none in the index.
+
+        """
+        _, _, items, version = self._read(cached=True)
+        entry = items.get(name)
+        if entry is not None:
+            return parse_metadata(dict(entry), version)
+
+    def get_all(self):
+        """Get metadata of all the items at once.
+
+        Returns:
+            dict: metadata by file name of the item.
+
+        """
+        _, _, items, version = self._read(cached=True)
+        return {
+            name: parse_metadata(dict(entry), version) for name, entry in items.items()
+        }
+
+    def update(self, name, metadata):
+        """Set metadata of the item.
+
+        Args:
+            name (str): file name of the item.
+            metadata (dict): metadata.
+
+        Raises:
+            MetadataConflictError: if the index kept being changed
+                concurrently.
+
+        """
+        self.update_many({name: metadata})
+
+    def update_many(self, metadata_by_name):
+        """Set metadata of several items with a single write of the index.
+
+        Args:
+            metadata_by_name (dict): metadata by file name of the item,
+                the metadata of the items mapped to None is removed.
+
+        Raises:
+            MetadataConflictError: if the index kept being changed
+                concurrently.
+
+        """
+        if not metadata_by_name:
+            return
+
+        batch = get_current_batch()
+        if batch is not None:
+            batch.add(self, metadata_by_name)
+            return
+
+        def _update(items):
+            for name, metadata in metadata_by_name.items():
+                if metadata is None:
+                    items.pop(name, None)
+                else:
+                    items[name] = metadata
+
+        self._modify(_update)
+
+    def remove(self, name):
+        """Remove metadata of the item.
+
+        Args:
+            name (str): file name of the item.
+
+        """
+        if get_current_batch() is not None or name in self._read()[2]:
+            self.update_many({name: None})
+
+    def _modify(self, func):
+        with self._lock():
+            writer_lock = AccessorLock(
+                get_base_accessor(self._accessor), self._rpath + WRITER_LOCK_SUFFIX
+            )
+            try:
+                locked = writer_lock.acquire()
+            except NotImplementedError:
+                return self._modify_verified(func)
+
+            if not locked:
+                raise MetadataConflictError(
+                    'Failed to lock "{}" held by another writer'.format(self._rpath)
+                )
+
+            try:
+                revision, _, items, _ = self._read()
+                func(items)
+                content = self._dump(revision, items, uuid.uuid4().hex)
+
+                # the expired lock could have been broken by another writer
+                # which read the index before this write
+                if writer_lock.expired:
+                    raise MetadataConflictError(
+                        'Lock of "{}" expired before the write'.format(self._rpath)
+                    )
+
+                self._replace(revision, items, content)
+            finally:
+                writer_lock.release()
+
+    def _modify_verified(self, func):
+        for _ in range(MAX_RETRIES):
+            revision, _, items, _ = self._read()
+            func(items)
+
+            writer = uuid.uuid4().hex
+            self._replace(revision, items, self._dump(revision, items, writer))
+            if not items:
+                return
+
+            # the index written by another host in the meantime
+            # doesn't have the change, so it's applied again
+            if self._read()[1] == writer:
+                return
+
+            log.debug('Conflicting write of "{}", retrying'.format(self._rpath))
+
+        raise MetadataConflictError(
+            'Failed to update "{}" after {} attempts due to concurrent '
+            "writes".format(self._rpath, MAX_RETRIES)
+        )
+
+    @staticmethod
+    def _dump(revision, items, writer):
+        try:
+            return dump_json(
+                {
+                    METADATA_FORMAT_KEY: METADATA_FORMAT_VERSION,
+                    "revision": revision + 1,
+                    "writer": writer,
+                    "items": items,
+                }
+            )
+        except TypeError as e:
+            raise MetadataSerializationError(e)
+
+    def _replace(self, revision, items, content):
+        try:
+            if items:
+                self._accessor.write(self._rpath, content)
+            elif revision:
+                self._accessor.rm(self._rpath)
+        finally:
+            self._invalidate()
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return "MetadataBundle(rpath='{}')".format(self._rpath)
+
+
+class MetadataBatch(object):
+    """Updates of the metadata indices written once per index.
+
+    The index updates of the threads bound to the batch are collected
+    instead of being written one by one, so a sequence of N items
+    costs one read-modify-write of its index instead of N.
+
+    """
+
+    def __init__(self):
+        self._updates = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def bind(self):
+        """Collect the index updates of the current thread."""
+        previous = getattr(_local, "batch", None)
+        _local.batch = self
+        try:
+            yield self
+        finally:
+            _local.batch = previous
+
+    def add(self, bundle, metadata_by_name):
+        with self._lock:
+            _, updates = self._updates.setdefault(bundle.key, (bundle, {}))
+            updates.update(metadata_by_name)
+
+    def flush(self):
+        """Write the collected updates.
+
+        Returns:
+            dict: errors by key of the index that failed to be written.
+
+        """
+        with self._lock:
+            pending = list(self._updates.values())
+            self._updates.clear()
+
+        errors = {}
+        for bundle, updates in pending:
+            try:
+                bundle.update_many(updates)
+            except Exception as e:
+                log.error('Failed to update "{}". {}'.format(bundle.rpath, e))
+                errors[bundle.key] = e
+
+        return errors
+
+
+def get_current_batch():
+    """Get the batch the index updates of the current thread are collected by.
+
+    Returns:
+        MetadataBatch: batch or None if the updates are written at once.
+
+    """
+    return getattr(_local, "batch", None)
+
+
+def call_in_batch(batch, func, *args, **kwargs):
+    """Call the function collecting its index updates in the batch.
+
+    Args:
+        batch (MetadataBatch): batch or None to write the updates at once.
+        func (callable): function to call with the rest of the arguments.
+
+    """
+    if batch is None:
+        return func(*args, **kwargs)
+
+    with batch.bind():
+        return func(*args, **kwargs)
+
+
+@contextmanager
+def batch_updates():
+    """Write the metadata indices changed in the block once, at its end.
+
+    The changes are not visible to the readers until then. The threads
+    of the block collect their updates only if they call the functions
+    with "call_in_batch".
+
+    Yields:
+        MetadataBatch: batch of the block, the batch of the enclosing
+            block if they are nested.
+
+    Raises:
+        Exception: error of the first index which failed to be written.
+
+    """
+    batch = get_current_batch()
+    if batch is not None:
+        yield batch
+        return
+
+    batch = MetadataBatch()
+    try:
+        with batch.bind():
+            yield batch
+    finally:
+        errors = batch.flush()
+
+    if errors:
+        raise next(iter(errors.values()))
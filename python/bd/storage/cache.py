@@ -0,0 +1,171 @@
+import os
+import threading
+import collections
+
+from cachetools import TTLCache
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+DEFAULT_MAX_ITEM_SIZE = 256 * 1024
+# the data changed by other processes is visible after that long
+DEFAULT_TTL = 5.0
+
+_read_cache = None
+_read_cache_lock = threading.Lock()
+
+
+class CacheStats(collections.namedtuple("CacheStats", ["hits", "misses", "size"])):
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+
+class BytesCache(object):
+    """LRU cache of small files bounded by the total size of the data.
+
+    Entries are keyed by the accessor and the rpath and expire after
+    "ttl" seconds, which bounds how stale they can be when the data is
+    changed by other processes.
+
+    Args:
+        max_size (int): maximum total size of the cached data in bytes,
+            0 disables the cache.
+        max_item_size (int): maximum size of a cached file in bytes.
+        ttl (float): number of seconds the data is valid for.
+
+    """
+
+    def __init__(
+        self,
+        max_size=DEFAULT_MAX_SIZE,
+        max_item_size=DEFAULT_MAX_ITEM_SIZE,
+        ttl=DEFAULT_TTL,
+    ):
+        self._max_size = max_size
+        self._max_item_size = min(max_item_size, max_size)
+        self._cache = TTLCache(maxsize=max(max_size, 1), ttl=ttl, getsizeof=len)
+        self._lock = threading.Lock()
+        # incremented by every invalidation, so the data read
+        # before it isn't cached after it
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def enabled(self):
+        return self._max_size > 0
+
+    def read(self, accessor, rpath):
+        """Read the data through the cache.
+
+        Args:
+            accessor (BaseAccessor): accessor to read from on a miss.
+            rpath (str): relative path.
+
+        Returns:
+            bytes: data or None if there is no data.
+
+        """
+        if not self.enabled:
+            return accessor.read(rpath)
+
+        key = (accessor, rpath)
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._hits += 1
+                return data
+            self._misses += 1
+            generation = self._generation
+
+        data = accessor.read(rpath)
+
+        if data is not None and len(data) <= self._max_item_size:
+            with self._lock:
+                if generation == self._generation:
+                    self._cache[key] = data
+
+        return data
+
+    def invalidate(self, accessor=None, rpath=None, recursive=False):
+        """Drop the cached data.
+
+        Args:
+            accessor (BaseAccessor): accessor to drop the data of,
+                everything is dropped if not provided.
+            rpath (str): relative path to drop the data of, all the
+                data of the accessor is dropped if not provided.
+            recursive (bool): drop the data of the paths
+                under the rpath as well.
+
+        """
+        with self._lock:
+            self._generation += 1
+
+            if accessor is None:
+                self._cache.clear()
+            elif rpath is not None:
+                rpath = rpath.rstrip("/")
+                self._cache.pop((accessor, rpath), None)
+                if recursive:
+                    prefix = rpath + "/"
+                    for key in list(self._cache.keys()):
+                        if key[0] is accessor and key[1].startswith(prefix):
+                            self._cache.pop(key, None)
+            else:
+                for key in list(self._cache.keys()):
+                    if key[0] is accessor:
+                        self._cache.pop(key, None)
+
+    def get_stats(self):
+        """Get the hit statistics of the cache.
+
+        Returns:
+            CacheStats: number of hits, misses and cached bytes.
+
+        """
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._cache.currsize)
+
+
+def get_read_cache():
+    """Get the cache shared by the read cache accessors.
+
+    It's configured with the "BD_STORAGE_READ_CACHE_SIZE",
+    "BD_STORAGE_READ_CACHE_MAX_ITEM_SIZE" and "BD_STORAGE_READ_CACHE_TTL"
+    environment variables, the size of 0 disables it.
+
+    Returns:
+        BytesCache: shared cache.
+
+    """
+    global _read_cache
+
+    if _read_cache is None:
+        with _read_cache_lock:
+            if _read_cache is None:
+                _read_cache = BytesCache(
+                    int(os.environ.get("BD_STORAGE_READ_CACHE_SIZE", DEFAULT_MAX_SIZE)),
+                    int(
+                        os.environ.get(
+                            "BD_STORAGE_READ_CACHE_MAX_ITEM_SIZE",
+                            DEFAULT_MAX_ITEM_SIZE,
+                        )
+                    ),
+                    float(os.environ.get("BD_STORAGE_READ_CACHE_TTL", DEFAULT_TTL)),
+                )
+
+    return _read_cache
+
+
+def set_read_cache(cache):
+    """Replace the cache shared by the read cache accessors.
+
+    Args:
+        cache (BytesCache): new cache.
+
+    """
+    global _read_cache
+
+    with _read_cache_lock:
+        _read_cache = cache
@@ -0,0 +1,406 @@
+import os
+import json
+import sqlite3
+import logging
+import datetime
+import collections
+from contextlib import closing
+
+from .utils import is_network_path
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_DIR = os.path.join(os.path.expanduser("~"), ".bd_storage")
+
+# the dates written by one process are ordered by the microseconds,
+# the catalogs filled before keep the seconds until they're rebuilt
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+# number of the index entries counted to find the most selective
+# condition of a query, the larger lookups are equally unselective
+ESTIMATE_LIMIT = 10000
+
+# metadata keys stored in the columns of the items table,
+# derived from the item itself or describing its data
+_reserved_keys = frozenset(["date", "user", "tags", "fields", "content"])
+
+
+def get_default_catalog_filename(project, storage):
+    """Get the catalog file of the storage.
+
+    The directory can be configured with the
+    "BD_STORAGE_CATALOG_DIR" environment variable. The default one
+    is in the home directory, so the catalog only indexes the items
+    written by the user on the host unless it's rebuilt. The catalogs
+    shared by the users need the "filename" in their configuration.
+
+    Args:
+        project (str): project name.
+        storage (str): storage name.
+
+    Returns:
+        str: catalog file path.
+
+    """
+    catalog_dir = os.environ.get("BD_STORAGE_CATALOG_DIR", DEFAULT_CATALOG_DIR)
+    return os.path.join(catalog_dir, "catalog_{}_{}.db".format(project, storage))
+
+
+class CatalogEntry(
+    collections.namedtuple(
+        "CatalogEntry", ["rpath", "tags", "fields", "user", "date", "metadata"]
+    )
+):
+    pass
+
+
+def _format_date(date):
+    if isinstance(date, datetime.datetime):
+        return date.strftime(DATE_FORMAT)
+    return date
+
+
+def _parse_date(date):
+    if date is None:
+        return
+    # the dates of the older catalogs have no microseconds
+    return datetime.datetime.fromisoformat(date)
+
+
+def _get_indexed_value(value):
+    # numbers and strings are compared as they are,
+    # the rest of the values by their JSON representation
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+class Catalog(object):
+    """SQLite index of the metadata of the items of a storage.
+
+    Tags, fields, user, date and the custom metadata keys are stored
+    in indexed tables, so the items are found without reading the
+    sidecar files. The sidecars stay the source of truth, the catalog
+    can be rebuilt from them at any time.
+
+    Every operation commits its own transaction, so the catalog
+    can be shared by threads and processes. It's meant to be local,
+    on a network share it's slower and relies on the file locking
+    of the share.
+
+    Args:
+        filename (str): database file path.
+        local (bool): the catalog only indexes the items written
+            by the user on the host, not the items of the others.
+
+    """
+
+    def __init__(self, filename, local=False):
+        self._filename = filename
+        self._local = local
+
+        dirname = os.path.dirname(filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        # the write-ahead log needs the memory shared by the processes
+        # of one host, it corrupts the databases on the network shares
+        self._journal_mode = "DELETE" if is_network_path(filename) else "WAL"
+
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS items ("
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                    "rpath TEXT NOT NULL UNIQUE, "
+                    "tags TEXT NOT NULL, "
+                    "fields TEXT NOT NULL, "
+                    "user TEXT, "
+                    "date TEXT, "
+                    "metadata TEXT NOT NULL)"
+                )
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS items_date ON items (date)"
+                )
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS items_user ON items (user, date)"
+                )
+
+                for table, columns in (
+                    ("item_tags", "tag"),
+                    ("item_fields", "name, value"),
+                    ("item_metadata", "key, value"),
+                ):
+                    connection.execute(
+                        "CREATE TABLE IF NOT EXISTS {table} ("
+                        "{columns}, item_id INTEGER NOT NULL, "
+                        "PRIMARY KEY ({columns}, item_id)) "
+                        "WITHOUT ROWID".format(table=table, columns=columns)
+                    )
+                    connection.execute(
+                        "CREATE INDEX IF NOT EXISTS {table}_item "
+                        "ON {table} (item_id)".format(table=table)
+                    )
+
+    @property
+    def filename(self):
+        return self._filename
+
+    @property
+    def local(self):
+        return self._local
+
+    def _connect(self):
+        connection = sqlite3.connect(self._filename, timeout=30.0, isolation_level=None)
+        connection.execute("PRAGMA journal_mode={}".format(self._journal_mode))
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @staticmethod
+    def _delete(connection, rpath):
+        row = connection.execute(
+            "SELECT id FROM items WHERE rpath = ?", (rpath,)
+        ).fetchone()
+        if not row:
+            return False
+
+        for table in ("item_tags", "item_fields", "item_metadata"):
+            connection.execute(
+                "DELETE FROM {} WHERE item_id = ?".format(table), (row[0],)
+            )
+        connection.execute("DELETE FROM items WHERE id = ?", (row[0],))
+        return True
+
+    @classmethod
+    def _insert(cls, connection, rpath, tags, fields, metadata):
+        metadata = dict(metadata or {})
+        custom_metadata = {
+            key: value
+            for key, value in metadata.items()
+            if key not in _reserved_keys and not key.startswith("_")
+        }
+
+        item_id = connection.execute(
+            "INSERT INTO items (rpath, tags, fields, user, date, metadata) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                rpath,
+                json.dumps(sorted(tags)),
+                json.dumps(fields, sort_keys=True),
+                metadata.get("user"),
+                _format_date(metadata.get("date")),
+                json.dumps(custom_metadata, sort_keys=True, default=str),
+            ),
+        ).lastrowid
+
+        connection.executemany(
+            "INSERT OR IGNORE INTO item_tags (tag, item_id) VALUES (?, ?)",
+            [(tag, item_id) for tag in tags],
+        )
+        connection.executemany(
+            "INSERT INTO item_fields (name, value, item_id) VALUES (?, ?, ?)",
+            [
+                (name, _get_indexed_value(value), item_id)
+                for name, value in fields.items()
+            ],
+        )
+        connection.executemany(
+            "INSERT INTO item_metadata (key, value, item_id) VALUES (?, ?, ?)",
+            [
+                (key, _get_indexed_value(value), item_id)
+                for key, value in custom_metadata.items()
+            ],
+        )
+
+    def _transaction(self, func, *args):
+        with closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(connection, *args)
+            except:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+            return result
+
+    def update(self, rpath, tags, fields, metadata):
+        """Add or replace the entry of the item.
+
+        Args:
+            rpath (str): relative path of the item.
+            tags (list): item tags.
+            fields (dict): item fields.
+            metadata (dict): item metadata as written to the sidecar.
+
+        """
+
+        def _update(connection):
+            self._delete(connection, rpath)
+            self._insert(connection, rpath, tags, fields, metadata)
+
+        self._transaction(_update)
+
+    def remove(self, rpath):
+        """Remove the entry of the item.
+
+        Args:
+            rpath (str): relative path of the item.
+
+        Returns:
+            bool: True if the entry was found.
+
+        """
+        return self._transaction(self._delete, rpath)
+
+    def rebuild(self, entries):
+        """Replace all the entries at once.
+
+        Args:
+            entries (iterable): (rpath, tags, fields, metadata) tuples.
+
+        Returns:
+            int: number of added entries.
+
+        """
+
+        def _rebuild(connection):
+            for table in ("item_tags", "item_fields", "item_metadata", "items"):
+                connection.execute("DELETE FROM {}".format(table))
+
+            count = 0
+            for rpath, tags, fields, metadata in entries:
+                self._insert(connection, rpath, tags, fields, metadata)
+                count += 1
+            return count
+
+        count = self._transaction(_rebuild)
+
+        with closing(self._connect()) as connection:
+            connection.execute("ANALYZE")
+
+        return count
+
+    def query(
+        self,
+        tags=None,
+        fields=None,
+        user=None,
+        since=None,
+        until=None,
+        metadata=None,
+        newest_first=False,
+        limit=None,
+    ):
+        """Find the entries matching all the conditions.
+
+        Args:
+            tags (list): tags the items have, among others.
+            fields (dict): field values of the items.
+            user (str): user who wrote the items.
+            since (datetime.datetime): minimum date of the items.
+            until (datetime.datetime): date the items precede.
+            metadata (dict): custom metadata values of the items.
+            newest_first (bool): order the entries by the date descending,
+                otherwise ascending.
+            limit (int): maximum number of entries.
+
+        Returns:
+            list[CatalogEntry]: matching entries.
+
+        """
+        # (table, condition, params) of the conditions of the index tables,
+        # from the usually most selective ones as the estimates are bounded
+        lookups = []
+        for table, column, values in (
+            ("item_fields", "name", fields),
+            ("item_metadata", "key", metadata),
+        ):
+            for name, value in (values or {}).items():
+                lookups.append(
+                    (
+                        table,
+                        "{} = ? AND value = ?".format(column),
+                        [name, _get_indexed_value(value)],
+                    )
+                )
+        lookups.extend(("item_tags", "tag = ?", [tag]) for tag in tags or ())
+
+        conditions = []
+        params = []
+
+        with closing(self._connect()) as connection:
+            if lookups:
+                # the items are taken from the most selective lookup
+                # and checked against the rest of them one by one
+                lookups.sort(key=lambda lookup: self._estimate(connection, *lookup))
+
+                table, condition, lookup_params = lookups[0]
+                conditions.append(
+                    "id IN (SELECT item_id FROM {} WHERE {})".format(table, condition)
+                )
+                params.extend(lookup_params)
+
+                for table, condition, lookup_params in lookups[1:]:
+                    conditions.append(
+                        "EXISTS (SELECT 1 FROM {} WHERE {} "
+                        "AND item_id = items.id)".format(table, condition)
+                    )
+                    params.extend(lookup_params)
+
+            if user is not None:
+                conditions.append("user = ?")
+                params.append(user)
+
+            if since is not None:
+                conditions.append("date >= ?")
+                params.append(_format_date(since))
+
+            if until is not None:
+                conditions.append("date < ?")
+                params.append(_format_date(until))
+
+            query = "SELECT rpath, tags, fields, user, date, metadata FROM items"
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+
+            query += " ORDER BY date {0}, id {0}".format(
+                "DESC" if newest_first else "ASC"
+            )
+
+            if limit is not None:
+                query += " LIMIT ?"
+                params.append(limit)
+
+            rows = connection.execute(query, params).fetchall()
+
+        return [
+            CatalogEntry(
+                rpath,
+                json.loads(tags),
+                json.loads(fields),
+                user,
+                _parse_date(date),
+                json.loads(metadata),
+            )
+            for rpath, tags, fields, user, date, metadata in rows
+        ]
+
+    @staticmethod
+    def _estimate(connection, table, condition, params):
+        # the count is bounded, so it's cheap for the common values
+        return connection.execute(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM {} WHERE {} LIMIT ?)".format(
+                table, condition
+            ),
+            params + [ESTIMATE_LIMIT],
+        ).fetchone()[0]
+
+    def __len__(self):
+        with closing(self._connect()) as connection:
+            return connection.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return "Catalog(filename='{}', local={})".format(self._filename, self._local)
@@ -0,0 +1,160 @@
+"""Command line maintenance tools for storage pools.
+
+Example:
+    python -m bd.storage.cli gc --config pool.yml --storage publish --dry-run
+    python -m bd.storage.cli catalog-rebuild --config pool.yml --storage publish
+
+"""
+
+import argparse
+import json
+import logging
+import sys
+
+import yaml
+
+from .accessor import create_accessor
+from .core import StoragePool
+from .utils import load_hooks
+from .validation import validate_pool_config
+
+log = logging.getLogger(__name__)
+
+
+def load_pool_config(filename):
+    """Load and validate storage pool configuration from YAML or JSON file.
+
+    Args:
+        filename (str): configuration file path.
+
+    Returns:
+        dict: validated pool configuration.
+
+    """
+    with open(filename, "r") as f:
+        if filename.endswith(".json"):
+            config = json.load(f)
+        else:
+            config = yaml.safe_load(f)
+
+    return validate_pool_config(config)
+
+
+def get_storage_config(pool_config, storage_name):
+    for storage_config in pool_config["storages"]:
+        if storage_config["name"] == storage_name:
+            return storage_config
+
+    raise ValueError(
+        "Storage '{}' not found in pool configuration".format(storage_name)
+    )
+
+
+def collect_garbage(args):
+    pool_config = load_pool_config(args.config)
+    storage_config = get_storage_config(pool_config, args.storage)
+
+    accessor = create_accessor(storage_config["accessor"])
+    if not hasattr(accessor, "collect_garbage"):
+        log.error(
+            "Accessor of storage '{}' doesn't support garbage collection".format(
+                args.storage
+            )
+        )
+        return 1
+
+    removed = accessor.collect_garbage(
+        dry_run=args.dry_run, grace_period=args.grace_period
+    )
+
+    for rpath in removed:
+        print(rpath)
+
+    return 0
+
+
+def rebuild_catalog(args):
+    pool = StoragePool.create(load_pool_config(args.config))
+
+    storage = None
+    for pool_storage in pool.storages:
+        if pool_storage.name == args.storage:
+            storage = pool_storage
+            break
+
+    if storage is None:
+        raise ValueError(
+            "Storage '{}' not found in pool configuration".format(args.storage)
+        )
+
+    if storage.catalog is None:
+        log.error("Catalog of storage '{}' is not enabled".format(args.storage))
+        return 1
+
+    count = storage.rebuild_catalog(max_workers=args.max_workers)
+
+    log.info(
+        "Cataloged {} items of storage '{}' in '{}'".format(
+            count, args.storage, storage.catalog.filename
+        )
+    )
+
+    return 0
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(prog="bd.storage")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    gc_parser = subparsers.add_parser(
+        "gc", help="Remove unreferenced blobs of a deduplicating storage."
+    )
+    gc_parser.add_argument(
+        "--config", required=True, help="Storage pool configuration file."
+    )
+    gc_parser.add_argument("--storage", required=True, help="Storage name.")
+    gc_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only print blobs which would be removed.",
+    )
+    gc_parser.add_argument(
+        "--grace-period",
+        type=int,
+        default=3600,
+        help="Keep blobs modified less than this number of seconds ago.",
+    )
+    gc_parser.set_defaults(func=collect_garbage)
+
+    catalog_parser = subparsers.add_parser(
+        "catalog-rebuild",
+        help="Rebuild the metadata catalog of a storage from its sidecar files.",
+    )
+    catalog_parser.add_argument(
+        "--config", required=True, help="Storage pool configuration file."
+    )
+    catalog_parser.add_argument("--storage", required=True, help="Storage name.")
+    catalog_parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=None,
+        help="Maximum number of concurrent sidecar reads.",
+    )
+    catalog_parser.set_defaults(func=rebuild_catalog)
+
+    return parser
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+    args = create_parser().parse_args(argv)
+
+    load_hooks()
+
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
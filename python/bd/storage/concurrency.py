@@ -0,0 +1,64 @@
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_executor = None
+_executor_lock = threading.Lock()
+
+DEFAULT_MAX_WORKERS = 32
+
+
+def get_executor():
+    """Get the executor shared by the asynchronous operations.
+
+    The number of workers can be configured with the
+    "BD_STORAGE_MAX_WORKERS" environment variable.
+
+    Returns:
+        concurrent.futures.Executor: shared executor.
+
+    """
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = int(
+                    os.environ.get("BD_STORAGE_MAX_WORKERS", DEFAULT_MAX_WORKERS)
+                )
+                _executor = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix="bd.storage"
+                )
+
+    return _executor
+
+
+def set_executor(executor):
+    """Replace the shared executor.
+
+    Args:
+        executor (concurrent.futures.Executor): new executor.
+
+    """
+    global _executor
+
+    with _executor_lock:
+        _executor = executor
+
+
+async def run_async(func, *args, **kwargs):
+    """Run a blocking function in the shared executor.
+
+    Args:
+        func (callable): blocking function.
+
+    Returns:
+        object: whatever the function returns.
+
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), functools.partial(func, *args, **kwargs)
+    )
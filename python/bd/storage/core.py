@@ -8,22 +8,52 @@ import json
 import datetime
 import hashlib
 import threading
+import itertools
 import base64
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
 
 import bd.hooks as bd_hooks
 
 from six import reraise
 
-from .accessor import FileSystemAccessor
+from .accessor import FileSystemAccessor, create_accessor
 from .edits import MetadataEdit, TagsEdit, FieldsEdit
 from .formatter import FieldFormatter
 from .mixins import TagsMixin, FieldsMixin, ChainItemMixin
 from .structure import Schema
 from .validation import validate_pool_config
+from .concurrency import run_async
+from .versions import get_version_index
+from .replication import ReplicationQueue, get_default_journal_filename
+from .scheduler import TransferScheduler
+from .catalog import Catalog, get_default_catalog_filename
+from .bundle import (
+    MetadataBundle,
+    METADATA_INDEX_NAME,
+    call_in_batch,
+    get_current_batch,
+)
 from . import utils
-from .utils import putils, json_encoder, load_hooks
+from . import transfer
+from . import delta as delta_transfer
+from .utils import (
+    putils,
+    load_hooks,
+    encode_metadata,
+    decode_metadata,
+    LEGACY_DATE_FORMAT,
+    DEFAULT_METADATA_FORMAT_VERSION,
+)
 from .errors import *
-from .enums import ItemType, ItemTypePrimaryFields
+from .enums import (
+    ItemType,
+    ItemTypePrimaryFields,
+    WritePolicy,
+    TransferStatus,
+    TransferPriority,
+)
+from .report import TransferResult, TransferReport
 
 from cachetools import cachedmethod, LRUCache
 
@@ -31,10 +61,161 @@ log = logging.getLogger(__name__)
 
 _global_instance = None
 
+DEFAULT_PREFETCH_WORKERS = 8
+DEFAULT_METADATA_WORKERS = 8
+
+METADATA_EXTENSIONS = (".meta", ".txt")
+
+
+def load_metadata(items, max_workers=None):
+    """Load metadata of many items at once.
+
+    The sidecars of the items of every accessor are found at once
+    and only the existing ones are read, concurrently.
+
+    The items of the storages bundling metadata cost
+    one read per directory.
+
+    Args:
+        items (list[StorageItem]): items to load metadata of.
+        max_workers (int): maximum number of concurrent reads.
+
+    Returns:
+        dict: metadata by item, None for the items without metadata.
+
+    """
+    result = {}
+
+    bundles = {}
+    for item in items:
+        bundle = item._get_metadata_bundle()
+        if bundle:
+            bundles.setdefault((id(item.accessor), bundle.rpath), bundle)
+
+    if bundles:
+        try:
+            with ThreadPoolExecutor(
+                max_workers=max_workers or DEFAULT_METADATA_WORKERS
+            ) as executor:
+                bundled_metadata = dict(
+                    zip(
+                        bundles,
+                        executor.map(lambda bundle: bundle.get_all(), bundles.values()),
+                    )
+                )
+        except:
+            reraise(
+                AccessorError,
+                AccessorError(
+                    "Failed to load metadata of items. {}".format(sys.exc_info()[1])
+                ),
+                sys.exc_info()[2],
+            )
+
+        sidecar_items = []
+        for item in items:
+            bundle = item._get_metadata_bundle()
+            metadata = None
+            if bundle:
+                metadata = bundled_metadata[(id(item.accessor), bundle.rpath)].get(
+                    putils.basename(item.rpath)
+                )
+
+            if metadata is None:
+                sidecar_items.append(item)
+            else:
+                item.set_metadata_dict(metadata)
+                result[item] = metadata
+
+        # items written before the bundling was enabled
+        items = sidecar_items
+
+    rpaths_by_accessor = {}
+    for item in items:
+        rpaths = rpaths_by_accessor.setdefault(id(item.accessor), (item.accessor, []))[
+            1
+        ]
+        rpaths.extend(item.rpath + extension for extension in METADATA_EXTENSIONS)
+
+    existing_rpaths = set()
+    for accessor, rpaths in rpaths_by_accessor.values():
+        try:
+            flags = accessor.exists_many(rpaths)
+        except:
+            reraise(
+                AccessorError,
+                AccessorError(
+                    "Failed to find metadata of items. {}".format(sys.exc_info()[1])
+                ),
+                sys.exc_info()[2],
+            )
+        existing_rpaths.update(rpath for rpath in rpaths if flags[rpath])
+
+    def _load(item):
+        for extension in METADATA_EXTENSIONS:
+            if item.rpath + extension in existing_rpaths:
+                content = item.accessor.read(item.rpath + extension)
+                if content is not None:
+                    return StorageItem._parse_metadata(content, extension)
+
+    with ThreadPoolExecutor(
+        max_workers=max_workers or DEFAULT_METADATA_WORKERS
+    ) as executor:
+        for item, metadata in zip(items, executor.map(_load, items)):
+            item.set_metadata_dict(metadata)
+            result[item] = metadata
+
+    return result
+
+
+def get_existing_items(items):
+    """Find the items which exist.
+
+    The paths of the items of every accessor are checked at once.
+
+    Args:
+        items (list[StorageItem]): items to check.
+
+    Returns:
+        set: existing items.
+
+    """
+    items_by_accessor = {}
+    for item in items:
+        items_by_accessor.setdefault(id(item.accessor), []).append(item)
+
+    existing_items = set()
+    for accessor_items in items_by_accessor.values():
+        accessor = accessor_items[0].accessor
+        try:
+            flags = accessor.exists_many([item.rpath for item in accessor_items])
+        except:
+            reraise(
+                AccessorError,
+                AccessorError(
+                    "Failed to check if items exist. {}".format(sys.exc_info()[1])
+                ),
+                sys.exc_info()[2],
+            )
+
+        existing_items.update(item for item in accessor_items if flags[item.rpath])
+
+    return existing_items
+
 
 class Storage(object):
     def __init__(
-        self, pool, name, accessor, schema, formatter, adapter=None, tag_mask=None
+        self,
+        pool,
+        name,
+        accessor,
+        schema,
+        formatter,
+        adapter=None,
+        tag_mask=None,
+        catalog=None,
+        bundle_metadata=False,
+        metadata_format=DEFAULT_METADATA_FORMAT_VERSION,
     ):
         self._pool = pool
         self._name = name
@@ -43,6 +224,10 @@ class Storage(object):
         self._formatter = formatter
         self._adapter = adapter
         self._tag_mask = utils.parse_mask(tag_mask) if tag_mask else None
+        self._catalog = catalog
+        self._catalog_warned = False
+        self._bundle_metadata = bundle_metadata
+        self._metadata_format = metadata_format
 
     @classmethod
     def create_storage(cls, pool, storage_name, storage_config):
@@ -61,6 +246,7 @@ class Storage(object):
         formatter = cls._create_formatter(storage_config["fields"])
         schema = cls._create_schema(storage_config["schema"])
         adapter = cls._create_adapter(storage_config.get("adapter"))
+        catalog = cls._create_catalog(pool, storage_name, storage_config.get("catalog"))
 
         return Storage(
             pool,
@@ -70,28 +256,14 @@ class Storage(object):
             formatter,
             adapter,
             storage_config.get("tag_mask"),
+            catalog,
+            storage_config.get("bundle_metadata", False),
+            storage_config.get("metadata_format", DEFAULT_METADATA_FORMAT_VERSION),
         )
 
     @classmethod
     def _create_accessor(cls, accessor_config):
-        accessor_name = accessor_config.get("name")
-        accessor_kwargs = accessor_config.get("kwargs", {})
-
-        if not accessor_name or accessor_name == "fs":
-            return FileSystemAccessor(**accessor_kwargs)
-
-        try:
-            return bd_hooks.execute(
-                "bd.storage.accessor." + accessor_name, **accessor_kwargs
-            ).one()
-        except bd_hooks.HookError as e:
-            reraise(
-                AccessorCreationError,
-                AccessorCreationError(
-                    'Failed to initialize accessor "{}"'.format(accessor_name)
-                ),
-                sys.exc_info()[2],
-            )
+        return create_accessor(accessor_config)
 
     @classmethod
     def _create_formatter(cls, fields_config):
@@ -153,6 +325,19 @@ class Storage(object):
                     sys.exc_info()[2],
                 )
 
+    @classmethod
+    def _create_catalog(cls, pool, storage_name, catalog_config):
+        if catalog_config is None:
+            return
+
+        filename = catalog_config.get("filename")
+        if filename:
+            return Catalog(filename)
+
+        return Catalog(
+            get_default_catalog_filename(pool.project, storage_name), local=True
+        )
+
     @property
     def pool(self):
         return self._pool
@@ -181,6 +366,216 @@ class Storage(object):
     def schema(self):
         return self._schema
 
+    @property
+    def bundle_metadata(self):
+        """bool: metadata of the items is kept in one index file per directory.
+
+        It's enabled by the "bundle_metadata" option of the storage
+        configuration.
+
+        """
+        return self._bundle_metadata
+
+    @property
+    def metadata_format(self):
+        """int: version of the format the metadata sidecars are written in.
+
+        It's set by the "metadata_format" option of the storage
+        configuration, the sidecars of all the versions are read.
+
+        """
+        return self._metadata_format
+
+    @property
+    def catalog(self):
+        """Catalog: metadata index of the storage or None if it's disabled.
+
+        It's enabled by the "catalog" section of the storage configuration.
+
+        """
+        return self._catalog
+
+    def query(
+        self,
+        tags=None,
+        fields=None,
+        user=None,
+        since=None,
+        until=None,
+        metadata=None,
+        newest_first=False,
+        limit=None,
+        as_items=False,
+    ):
+        """Find the items by their metadata using the catalog.
+
+        The catalog without the "filename" configured is local, it only
+        finds the items written by the current user on this host and
+        a warning is logged the first time it's queried.
+
+        Args:
+            tags (list): tags the items have, among others.
+            fields (dict): field values of the items.
+            user (str): user who wrote the items.
+            since (datetime.datetime): minimum date of the items.
+            until (datetime.datetime): date the items precede.
+            metadata (dict): custom metadata values of the items.
+            newest_first (bool): order the items by the date descending,
+                otherwise ascending.
+            limit (int): maximum number of items.
+            as_items (bool): return the storage items of this storage
+                instead of the identifiers.
+
+        Returns:
+            list[Identifier]|list[StorageItem]: matching items.
+
+        Raises:
+            StorageError: if the catalog of the storage is disabled.
+
+        """
+        if self._catalog is None:
+            raise StorageError(
+                'Catalog of storage "{}" is not enabled'.format(self._name)
+            )
+
+        if self._catalog.local and not self._catalog_warned:
+            self._catalog_warned = True
+            log.warning(
+                'Catalog of storage "{}" is local, it only finds the items '
+                "written by the current user on this host. Configure its "
+                '"filename" to share it.'.format(self._name)
+            )
+
+        entries = self._catalog.query(
+            tags, fields, user, since, until, metadata, newest_first, limit
+        )
+
+        identifiers = [Identifier(entry.tags, entry.fields) for entry in entries]
+        if not as_items:
+            return identifiers
+
+        storage_items = []
+        for identifier in identifiers:
+            meta_item = self.get_item(identifier.tags)
+            if not meta_item:
+                continue
+
+            if self._adapter:
+                identifier = self._adapter.input(identifier)
+
+            storage_item = meta_item.get_storage_item(identifier.fields)
+            if storage_item:
+                storage_items.append(storage_item)
+
+        return storage_items
+
+    def rebuild_catalog(self, max_workers=None):
+        """Fill the catalog from the metadata sidecars of the storage.
+
+        Args:
+            max_workers (int): maximum number of concurrent reads.
+
+        Returns:
+            int: number of cataloged items.
+
+        Raises:
+            StorageError: if the catalog of the storage is disabled.
+
+        """
+        if self._catalog is None:
+            raise StorageError(
+                'Catalog of storage "{}" is not enabled'.format(self._name)
+            )
+
+        try:
+            rpaths = set(self._accessor.list("", relative=True, recursive=True))
+        except:
+            reraise(
+                AccessorError,
+                AccessorError(
+                    'Failed to list storage "{}". {}'.format(
+                        self._name, sys.exc_info()[1]
+                    )
+                ),
+                sys.exc_info()[2],
+            )
+
+        def _load_bundle(index_rpath):
+            dirname = putils.dirname(index_rpath)
+            try:
+                return dirname, MetadataBundle(self._accessor, dirname).get_all()
+            except Exception as e:
+                log.warning('Failed to load metadata of "{}". {}'.format(dirname, e))
+                return dirname, {}
+
+        def _load_sidecar(data_rpath):
+            extension = sidecars[data_rpath]
+            try:
+                content = self._accessor.read(data_rpath + extension)
+                if content is not None:
+                    return StorageItem._parse_metadata(content, extension)
+            except Exception as e:
+                log.warning('Failed to load metadata of "{}". {}'.format(data_rpath, e))
+
+        with ThreadPoolExecutor(
+            max_workers=max_workers or DEFAULT_METADATA_WORKERS
+        ) as executor:
+            # bundled metadata takes precedence over the sidecars
+            bundled_metadata = {}
+            index_rpaths = [
+                rpath
+                for rpath in rpaths
+                if putils.basename(rpath) == METADATA_INDEX_NAME
+            ]
+            for dirname, entries in executor.map(_load_bundle, index_rpaths):
+                for name, metadata in entries.items():
+                    data_rpath = putils.join(dirname, name) if dirname else name
+                    if data_rpath in rpaths:
+                        bundled_metadata[data_rpath] = metadata
+
+            # the first found extension takes precedence as when reading
+            sidecars = {}
+            for data_rpath in rpaths:
+                if data_rpath in bundled_metadata:
+                    continue
+
+                for extension in METADATA_EXTENSIONS:
+                    if data_rpath + extension in rpaths:
+                        sidecars[data_rpath] = extension
+                        break
+
+            identifiers = {}
+            for data_rpath in itertools.chain(bundled_metadata, sidecars):
+                identifier = self.get_identifier_from_rpath(data_rpath)
+                if identifier:
+                    identifiers[data_rpath] = identifier
+
+            data_rpaths = sorted(identifiers)
+            loaded_metadata = list(
+                executor.map(
+                    lambda data_rpath: (
+                        bundled_metadata[data_rpath]
+                        if data_rpath in bundled_metadata
+                        else _load_sidecar(data_rpath)
+                    ),
+                    data_rpaths,
+                )
+            )
+
+        # the sidecars are read before the catalog is locked for writing
+        entries = [
+            (
+                data_rpath,
+                identifiers[data_rpath].tags,
+                identifiers[data_rpath].fields,
+                metadata,
+            )
+            for data_rpath, metadata in zip(data_rpaths, loaded_metadata)
+            if metadata is not None
+        ]
+
+        return self._catalog.rebuild(entries)
+
     def get_item(self, tags):
         if not self._is_matching(tags):
             return
@@ -377,9 +772,7 @@ class StorageItem(TagsMixin, FieldsMixin, MetadataEdit, ChainItemMixin):
         ChainItemMixin.__init__(self)
         self._rpath = rpath
         self._meta_item = meta_item
-        self.set_metadata("tags", self.tags)
-        self.set_metadata("fields", self.fields)
-        self.set_metadata("user", getpass.getuser())
+        self._set_metadata_loader(self._get_default_metadata)
 
     @property
     def rpath(self):
@@ -404,6 +797,9 @@ class StorageItem(TagsMixin, FieldsMixin, MetadataEdit, ChainItemMixin):
     def get_identifier(self):
         return Identifier(self.tags, self.fields)
 
+    def _get_default_metadata(self):
+        return {"tags": self.tags, "fields": self.fields, "user": getpass.getuser()}
+
     def exists(self, check_upstream=False):
         try:
             exists = False
@@ -427,7 +823,34 @@ class StorageItem(TagsMixin, FieldsMixin, MetadataEdit, ChainItemMixin):
     def get_filesystem_path(self):
         return self.accessor.get_filesystem_path(self._rpath)
 
-    def read(self, current_item_only=False, upstream=True, with_metadata=False):
+    def read(
+        self,
+        current_item_only=False,
+        upstream=True,
+        with_metadata=False,
+        hedged=False,
+        hedge_delay=0.05,
+        max_workers=None,
+    ):
+        """Read data from the first item in the chain that has it.
+
+        Args:
+            current_item_only (bool): read from this item only.
+            upstream (bool): probe this item first and then its next items,
+                otherwise in the reverse order.
+            with_metadata (bool): load metadata from the sidecar files.
+            hedged (bool): probe several chain members concurrently. A new
+                probe is issued every "hedge_delay" seconds until the
+                highest priority hit is known.
+            hedge_delay (float): delay in seconds before probing the next
+                item while the previous probes are still running.
+            max_workers (int): maximum number of concurrent probes.
+
+        Returns:
+            bytes: data or None if no item in the chain has it.
+
+        """
+
         def _read_self():
             try:
                 data = self.accessor.read(self._rpath)
@@ -443,10 +866,12 @@ class StorageItem(TagsMixin, FieldsMixin, MetadataEdit, ChainItemMixin):
             if data is not None:
                 log.debug('Read data from item "{}"'.format(self))
 
-            if with_metadata:
-                # if .txt or .meta file is found parse it
-                # and use the data as metadata
-                self.set_metadata_dict(self._load_metadata())
+            # metadata of the items without data is replaced
+            # by the metadata of the next items anyway
+            if with_metadata and (data is not None or current_item_only):
+                # if .txt or .meta file is found parse it and use
+                # the data as metadata, once it's actually accessed
+                self._set_metadata_loader(self._load_metadata)
 
             return data
 
@@ -465,6 +890,9 @@ class StorageItem(TagsMixin, FieldsMixin, MetadataEdit, ChainItemMixin):
         if current_item_only:
             return _read_self()
 
+        if hedged:
+            return self._read_hedged(upstream, with_metadata, hedge_delay, max_workers)
+
         if upstream:
             data = _read_self()
             if data is None:
@@ -476,6 +904,56 @@ class StorageItem(TagsMixin, FieldsMixin, MetadataEdit, ChainItemMixin):
                 data = _read_self()
             return data
 
+    def _read_hedged(self, upstream, with_metadata, hedge_delay, max_workers):
+        chain = list(self.iter_chain())
+        candidates = chain if upstream else chain[::-1]
+
+        while candidates:
+            hit_item = self._find_hedged(candidates, hedge_delay, max_workers)
+            if not hit_item:
+                break
+
+            data = hit_item.read(current_item_only=True, with_metadata=with_metadata)
+            if data is not None:
+                if with_metadata:
+                    self._copy_metadata_from(hit_item)
+                return data
+
+            # the data was removed after the probe,
+            # so the lower priority items are probed again
+            candidates = candidates[candidates.index(hit_item) + 1 :]
+
+        if with_metadata:
+            for item in chain:
+                item.set_metadata_dict(None)
+
+    @staticmethod
+    def _find_hedged(candidates, hedge_delay, max_workers):
+        executor = ThreadPoolExecutor(max_workers=max_workers or len(candidates))
+        futures = []
+        try:
+            index = 0
+            while index < len(candidates):
+                if len(futures) < len(candidates):
+                    futures.append(executor.submit(candidates[len(futures)].exists))
+
+                # wait for the highest priority probe which is still unresolved,
+                # but not longer than the hedge delay if there is anything
+                # left to probe
+                timeout = hedge_delay if len(futures) < len(candidates) else None
+                wait([futures[index]], timeout=timeout)
+
+                while index < len(futures) and futures[index].done():
+                    if futures[index].result():
+                        return candidates[index]
+                    index += 1
+        finally:
+            for future in futures:
+                future.cancel()
+
+            # don't wait for the slower probes
+            executor.shutdown(wait=False)
+
     def _dump_metadata(self):
         dump_data = {"date": datetime.datetime.now()}
 
@@ -484,13 +962,32 @@ class StorageItem(TagsMixin, FieldsMixin, MetadataEdit, ChainItemMixin):
             if metadata:
                 dump_data.update(metadata)
 
+        content = dump_data.get("content")
+        if content:
+            # record the state of the data the digest belongs to
+            stat = self._stat()
+            content = dict(content, mtime=stat.mtime if stat else None)
+            dump_data["content"] = content
+
         try:
-            json_data = json.dumps(dump_data, indent=2, default=json_encoder)
+            json_data = encode_metadata(dump_data, self.storage.metadata_format)
         except TypeError as e:
             raise MetadataSerializationError(e)
 
+        bundle = self._get_metadata_bundle()
+
         try:
-            self.accessor.write(self._rpath + ".meta", json_data)
+            if bundle:
+                bundle.update(
+                    putils.basename(self._rpath),
+                    {
+                        key: value
+                        for key, value in dump_data.items()
+                        if key not in ("tags", "fields")
+                    },
+                )
+            else:
+                self.accessor.write(self._rpath + ".meta", json_data)
         except:
             reraise(
                 AccessorError,
@@ -501,23 +998,57 @@ class StorageItem(TagsMixin, FieldsMixin, MetadataEdit, ChainItemMixin):
                 sys.exc_info()[2],
             )
 
-    def _load_metadata(self):
-        data = {}
+        self._update_catalog(dump_data)
 
-        metadata_rpath = self._rpath + ".meta"
-        if not self.accessor.exists(metadata_rpath):
-            metadata_rpath = self._rpath + ".txt"
-            if not self.accessor.exists(metadata_rpath):
-                return
+    def _update_catalog(self, metadata=None):
+        catalog = self.storage.catalog
+        if catalog is None:
+            return
 
-        content = self.accessor.read(metadata_rpath)
+        # the catalog is rebuilt from the sidecars if it gets out of sync,
+        # so it never fails the operations on the data
+        try:
+            if metadata is None:
+                catalog.remove(self._rpath)
+            else:
+                identifier = self.get_identifier()
+                if self.storage.adapter:
+                    identifier = self.storage.adapter.output(identifier)
+                catalog.update(
+                    self._rpath, identifier.tags, identifier.fields, metadata
+                )
+        except Exception as e:
+            log.warning('Failed to update catalog of item "{}". {}'.format(self, e))
+
+    def _get_metadata_bundle(self):
+        if self.storage.bundle_metadata:
+            return MetadataBundle(self.accessor, putils.dirname(self._rpath))
 
-        if metadata_rpath.endswith(".meta"):
-            data = json.loads(content)
-            data["date"] = datetime.datetime.strptime(data["date"], "%m/%d/%Y %H:%M:%S")
+    def _load_metadata(self):
+        bundle = self._get_metadata_bundle()
+        if bundle:
+            metadata = bundle.get(putils.basename(self._rpath))
+            if metadata is not None:
+                return metadata
+
+        # missing sidecars are read as None, so every one
+        # of them costs a single read attempt
+        for extension in METADATA_EXTENSIONS:
+            content = self.accessor.read(self._rpath + extension)
+            if content is not None:
+                return self._parse_metadata(content, extension)
+
+    @staticmethod
+    def _parse_metadata(content, extension):
+        if extension == ".meta":
+            data = decode_metadata(content)
             data.pop("tags", None)
             data.pop("fields", None)
         else:
+            if isinstance(content, bytes):
+                content = content.decode("utf-8")
+
+            data = {}
             active_section = None
             for line in content.splitlines():
                 line = line.strip()
@@ -535,7 +1066,7 @@ class StorageItem(TagsMixin, FieldsMixin, MetadataEdit, ChainItemMixin):
                     text = text.strip()
 
                 if title == "date":
-                    data["date"] = datetime.datetime.strptime(text, "%m/%d/%Y %H:%M:%S")
+                    data["date"] = datetime.datetime.strptime(text, LEGACY_DATE_FORMAT)
                     active_section = "date"
                 elif title == "user":
                     data["user"] = text
@@ -555,24 +1086,78 @@ class StorageItem(TagsMixin, FieldsMixin, MetadataEdit, ChainItemMixin):
         upstream=True,
         with_metadata=False,
         force=False,
+        parallel=False,
+        max_workers=None,
+        policy=WritePolicy.ALL_OR_NOTHING,
+        write_behind=False,
+    ):
+        """Write data to this item and, optionally, to the rest of the chain.
+
+        Args:
+            data (bytes|str): data to write.
+            current_item_only (bool): write to this item only.
+            upstream (bool): write this item first and then its next items,
+                otherwise in the reverse order.
+            with_metadata (bool): dump metadata sidecar files as well.
+            force (bool): overwrite existing items.
+            parallel (bool): write to all chain members concurrently.
+            max_workers (int): maximum number of concurrent writes
+                when "parallel" is enabled.
+            policy (str): one of the WritePolicy values used when "parallel"
+                is enabled. The items overwritten by a rolled back write
+                are restored to their previous data if the storage can
+                keep it aside without transferring it.
+            write_behind (bool): write this item only and queue the
+                replication to its next items in the replication queue
+                of the pool.
+
+        Returns:
+            TransferReport|ReplicationJob: per-target report if "parallel"
+                is enabled or the queued job if "write_behind" is enabled.
+
+        """
+
+        if with_metadata:
+            digest = utils.get_digest(data)
+            self.set_metadata("content", {"md5": digest[0], "size": digest[1]})
+
+        if write_behind and not current_item_only and self.next_item:
+            self._write(data, True, upstream, with_metadata, force, False, None, policy)
+            return self.storage.pool.replication_queue.submit(
+                self, with_metadata, force
+            )
+
+        return self._write(
+            data,
+            current_item_only,
+            upstream,
+            with_metadata,
+            force,
+            parallel,
+            max_workers,
+            policy,
+        )
+
+    def _write(
+        self,
+        data,
+        current_item_only,
+        upstream,
+        with_metadata,
+        force,
+        parallel,
+        max_workers,
+        policy,
     ):
         def _write_self():
-            if not force and self.exists():
+            # the content isn't compared like by "pull" and "push",
+            # so the metadata of the forced writes is always updated
+            if not self._needs_write(force):
                 return
 
             log.debug('Writing to item "{}" ...'.format(self))
 
-            try:
-                self.accessor.write(self._rpath, data)
-            except:
-                reraise(
-                    AccessorError,
-                    AccessorError(
-                        'Failed to write to item "{}". '
-                        "{}".format(self, sys.exc_info()[1])
-                    ),
-                    sys.exc_info()[2],
-                )
+            self._write_data(data)
 
             if with_metadata:
                 self._dump_metadata()
@@ -586,11 +1171,23 @@ class StorageItem(TagsMixin, FieldsMixin, MetadataEdit, ChainItemMixin):
             if with_metadata:
                 self.next_item.copy_metadata(self)
 
-            self.next_item.write(data, upstream=upstream, with_metadata=with_metadata)
+            self.next_item._write(
+                data,
+                False,
+                upstream,
+                with_metadata,
+                False,
+                False,
+                None,
+                policy,
+            )
 
         if current_item_only:
             return _write_self()
 
+        if parallel:
+            return self._write_parallel(data, with_metadata, force, max_workers, policy)
+
         if upstream:
             _write_self()
             _write_next()
@@ -598,34 +1195,724 @@ class StorageItem(TagsMixin, FieldsMixin, MetadataEdit, ChainItemMixin):
             _write_next()
             _write_self()
 
-    def pull(self, with_metadata=False, force=False):
+    def _write_data(self, data):
+        scheduler = self.storage.pool.transfer_scheduler
+        storages = [self.storage.name]
+        try:
+            with scheduler.slot(storages) as throttle:
+                if scheduler.is_throttled(storages):
+                    throttle(len(data))
+
+                self.accessor.write(self._rpath, data)
+        except:
+            reraise(
+                AccessorError,
+                AccessorError(
+                    'Failed to write to item "{}". '
+                    "{}".format(self, sys.exc_info()[1])
+                ),
+                sys.exc_info()[2],
+            )
+
+        self._update_signature()
+        get_version_index().add(self.accessor, self._rpath)
+
+    def _needs_write(self, force, digest=None):
+        if not self.exists():
+            return True
+
+        if not force:
+            return False
+
+        # skip items which already have the same content
+        if digest and self.get_content_digest() == digest:
+            log.debug('Item "{}" has the same content'.format(self))
+            return False
+
+        return True
+
+    def get_content_digest(self):
+        """Get the digest of the item data.
+
+        The digest is taken from the metadata sidecar if it's still
+        valid for the data, otherwise from the entity tag of the
+        accessor if it's a plain MD5 digest.
+
+        Returns:
+            tuple: MD5 hex digest and size or None if unknown.
+
+        """
+        stat = self._stat()
+
+        metadata = self._load_metadata()
+        if metadata:
+            content = self._validate_content(metadata.get("content"), stat)
+            if content:
+                return content["md5"], content["size"]
+
+        if stat and stat.etag:
+            etag = stat.etag.strip('"')
+            if utils.is_md5_digest(etag):
+                return etag, stat.size
+
+    def _stat(self):
+        try:
+            return self.accessor.stat(self._rpath)
+        except NotImplementedError:
+            return
+
+    @staticmethod
+    def _validate_content(content, stat):
+        if not isinstance(content, dict) or "md5" not in content:
+            return
+
+        # the data was modified after the sidecar was written
+        if stat and (
+            (stat.size is not None and content.get("size") != stat.size)
+            or content.get("mtime") != stat.mtime
+        ):
+            return
+
+        return content
+
+    def _write_parallel(self, data, with_metadata, force, max_workers, policy):
+        targets = list(self.iter_chain())
+
+        if with_metadata:
+            for target in targets[1:]:
+                target.copy_metadata(self)
+
+        report = TransferReport()
+        results = {}
+
+        with ThreadPoolExecutor(max_workers=max_workers or len(targets)) as executor:
+            check_futures = [
+                (target, executor.submit(target._needs_write, force))
+                for target in targets
+            ]
+
+            pending_targets = []
+            for target, future in check_futures:
+                try:
+                    needs_write = future.result()
+                except Exception as e:
+                    results[target] = TransferResult(target, TransferStatus.FAILED, e)
+                    continue
+
+                if needs_write:
+                    pending_targets.append(target)
+                else:
+                    results[target] = TransferResult(target, TransferStatus.SKIPPED)
+
+            # the overwritten items are restored from their previous
+            # state, the items which didn't exist are removed
+            backups = {}
+            if policy == WritePolicy.ALL_OR_NOTHING:
+                backup_futures = [
+                    (target, executor.submit(target._backup_write, with_metadata))
+                    for target in pending_targets
+                ]
+                for target, future in backup_futures:
+                    try:
+                        backups[target] = future.result()
+                    except Exception as e:
+                        results[target] = TransferResult(
+                            target, TransferStatus.FAILED, e
+                        )
+
+            # nothing is written yet, so there is nothing to roll back
+            if policy == WritePolicy.ALL_OR_NOTHING and any(
+                not result.ok for result in results.values()
+            ):
+                pending_targets = []
+
+            # metadata sidecars of one item are written alongside
+            # the data of the others, but after its own data
+            # because they record its modification time
+            batch = get_current_batch()
+            write_futures = [
+                (
+                    target,
+                    executor.submit(
+                        call_in_batch,
+                        batch,
+                        target._write_data_and_metadata,
+                        data,
+                        with_metadata,
+                    ),
+                )
+                for target in pending_targets
+            ]
+
+            for target, future in write_futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    log.error(e)
+                    results[target] = TransferResult(target, TransferStatus.FAILED, e)
+                else:
+                    log.debug('Written to item "{}"'.format(target))
+                    results[target] = TransferResult(target, TransferStatus.DONE)
+
+        for target in targets:
+            if target in results:
+                report.add(results[target])
+
+        if report.failed and policy == WritePolicy.ALL_OR_NOTHING:
+            for result in report.done:
+                result.item._rollback_write(with_metadata, backups.pop(result.item))
+                result.status = TransferStatus.ROLLED_BACK
+
+        for target, backup in backups.items():
+            target._discard_backup(backup)
+
+        if report.failed and policy == WritePolicy.ALL_OR_NOTHING:
+            raise TransferError(
+                'Failed to write item "{}" to storages: {}'.format(
+                    self,
+                    ", ".join(result.item.storage.name for result in report.failed),
+                ),
+                report,
+            )
+
+        return report
+
+    def _write_data_and_metadata(self, data, with_metadata):
+        self._write_data(data)
+        if with_metadata:
+            self._dump_metadata()
+
+    def _backup_write(self, with_metadata):
+        # the metadata sidecars are small enough to be kept in memory
+        contents = {}
+        bundle = None
+        if with_metadata:
+            bundle = self._get_metadata_bundle()
+            if not bundle:
+                rpath = self._rpath + ".meta"
+                contents[rpath] = self.accessor.read(rpath)
+
+        bundle_metadata = bundle.get(putils.basename(self._rpath)) if bundle else None
+
+        return self._keep_data_aside(), contents, bundle_metadata
+
+    def _keep_data_aside(self):
+        # the previous data is kept without transferring it, None is
+        # returned if there is none and False if it can't be kept cheaply
+        if not self.accessor.exists(self._rpath):
+            return
+
+        backup_rpath = "{}__backup_{}".format(self._rpath, uuid.uuid4().hex)
+
+        # the file system path of the wrapped accessors might not be
+        # the file of the rpath, like the referenced blob
+        if isinstance(self.accessor, FileSystemAccessor):
+            filename = self.accessor.resolve(self._rpath)
+            try:
+                # the written data replaces the file, the link keeps the old one
+                os.link(filename, self.accessor.resolve(backup_rpath))
+                return backup_rpath
+            except OSError as e:
+                log.debug('Failed to link "{}". {}'.format(filename, e))
+
+        if self.accessor.copy_to(self.accessor, self._rpath, backup_rpath):
+            return backup_rpath
+
+        log.warning(
+            "Previous data of item \"{}\" can't be kept aside, it won't be "
+            "restored if the write is rolled back".format(self)
+        )
+        return False
+
+    def _discard_backup(self, backup):
+        backup_rpath = backup[0]
+        if backup_rpath:
+            try:
+                self.accessor.rm(backup_rpath)
+            except Exception as e:
+                log.warning('Failed to remove "{}". {}'.format(backup_rpath, e))
+
+    def _rollback_write(self, with_metadata, backup):
+        backup_rpath, contents, bundle_metadata = backup
+
+        if with_metadata:
+            bundle = self._get_metadata_bundle()
+            if bundle:
+                name = putils.basename(self._rpath)
+                try:
+                    if bundle_metadata is None:
+                        bundle.remove(name)
+                    else:
+                        bundle.update(name, bundle_metadata)
+                except Exception as e:
+                    log.warning('Failed to roll back "{}". {}'.format(bundle, e))
+
+        for rpath, content in contents.items():
+            try:
+                if content is None:
+                    self.accessor.rm(rpath)
+                else:
+                    self.accessor.write(rpath, content)
+            except Exception as e:
+                log.warning('Failed to roll back "{}". {}'.format(rpath, e))
+
+        try:
+            if backup_rpath is None:
+                self.accessor.rm(self._rpath)
+            elif backup_rpath:
+                self._restore_data(backup_rpath)
+        except Exception as e:
+            log.warning('Failed to roll back "{}". {}'.format(self._rpath, e))
+
+        get_version_index().invalidate(self.accessor, self._rpath)
+
+    def _restore_data(self, backup_rpath):
+        if isinstance(self.accessor, FileSystemAccessor):
+            os.replace(
+                self.accessor.resolve(backup_rpath), self.accessor.resolve(self._rpath)
+            )
+            return
+
+        if not self.accessor.copy_to(self.accessor, backup_rpath, self._rpath):
+            transfer.copy(self.accessor, backup_rpath, self.accessor, self._rpath)
+        self.accessor.rm(backup_rpath)
+
+    def pull(
+        self,
+        with_metadata=False,
+        force=False,
+        progress=None,
+        resume=False,
+        delta=False,
+        base_item=None,
+        priority=TransferPriority.INTERACTIVE,
+        report=None,
+        return_data=False,
+    ):
+        """Copy the data down to the downstream item of the chain.
+
+        The data is streamed in fixed-size chunks from the most
+        upstream item which has it.
+
+        Args:
+            with_metadata (bool): copy metadata as well.
+            force (bool): overwrite existing items.
+            progress (callable): function called with the target item,
+                the number of transferred bytes and the total number
+                of bytes or None if the total is unknown.
+            resume (bool): continue the previous interrupted transfer
+                to the file system storages.
+            delta (bool): read only the blocks of the data which are
+                missing in the older copy of the target item or in the
+                base item if they are available on the file system.
+            base_item (StorageItem): older revision to take the
+                blocks from.
+            priority (str): one of the TransferPriority values the
+                transfer scheduler of the pool starts the transfers by.
+            report (TransferReport): report the results of the targets
+                are added to, with the items the data was copied from.
+            return_data (bool): read the pulled data back, the whole
+                data is held in memory then.
+
+        Returns:
+            StorageItem|bytes: downstream item or its data if return_data
+                is set, None if the downstream item already exists.
+
+        """
         downstream_item = self.get_downstream_item()
         if not force and downstream_item.exists():
             return
 
+        self._pull(
+            downstream_item,
+            with_metadata,
+            force,
+            progress,
+            resume,
+            delta,
+            base_item,
+            priority,
+            report,
+        )
+
+        if return_data:
+            return downstream_item.read(current_item_only=True)
+        return downstream_item
+
+    def _pull(
+        self,
+        downstream_item=None,
+        with_metadata=False,
+        force=False,
+        progress=None,
+        resume=False,
+        delta=False,
+        base_item=None,
+        priority=TransferPriority.INTERACTIVE,
+        report=None,
+    ):
+        if downstream_item is None:
+            downstream_item = self.get_downstream_item()
+
         try:
             bd_hooks.execute("bd.storage.on_item_pull", self).all()
         except:
             pass
 
-        data = self.read(upstream=False, with_metadata=with_metadata)
-        if data is None:
+        source_item = self._find_source_item(
+            upstream=False, with_metadata=with_metadata
+        )
+        if source_item is None:
             raise ItemLoadingError(
                 "There is no data available for item: {}".format(self)
             )
 
-        downstream_item.write(data, with_metadata=with_metadata, force=force)
-        return data
+        self._replicate(
+            source_item,
+            list(downstream_item.iter_chain()),
+            with_metadata,
+            force,
+            progress,
+            resume,
+            delta,
+            base_item,
+            priority,
+            report,
+            relay=True,
+        )
+
+    def push(
+        self,
+        with_metadata=False,
+        force=False,
+        progress=None,
+        resume=False,
+        delta=False,
+        base_item=None,
+        priority=TransferPriority.INTERACTIVE,
+        report=None,
+        return_data=False,
+    ):
+        """Copy the data up to every next item of the chain.
+
+        The data is streamed in fixed-size chunks from the first
+        item which has it.
+
+        Args:
+            with_metadata (bool): copy metadata as well.
+            force (bool): overwrite existing items.
+            progress (callable): function called with the target item,
+                the number of transferred bytes and the total number
+                of bytes or None if the total is unknown.
+            resume (bool): continue the previous interrupted transfer
+                to the file system storages.
+            delta (bool): read only the blocks of the data which are
+                missing in the older copy of the target item or in the
+                base item if they are available on the file system.
+            base_item (StorageItem): older revision to take the
+                blocks from.
+            priority (str): one of the TransferPriority values the
+                transfer scheduler of the pool starts the transfers by.
+            report (TransferReport): report the results of the targets
+                are added to, with the items the data was copied from.
+            return_data (bool): read the pushed data back, the whole
+                data is held in memory then.
+
+        Returns:
+            StorageItem|bytes: item the data was copied from or its data
+                if return_data is set.
+
+        """
+        source_item = self._push(
+            with_metadata,
+            force,
+            progress,
+            resume,
+            delta,
+            base_item,
+            priority,
+            report,
+        )
 
-    def push(self, with_metadata=False, force=False):
-        data = self.read(with_metadata=with_metadata)
-        if data is None:
+        if return_data:
+            return source_item.read(current_item_only=True)
+        return source_item
+
+    def _push(
+        self,
+        with_metadata=False,
+        force=False,
+        progress=None,
+        resume=False,
+        delta=False,
+        base_item=None,
+        priority=TransferPriority.INTERACTIVE,
+        report=None,
+    ):
+        source_item = self._find_source_item(upstream=True, with_metadata=with_metadata)
+        if source_item is None:
             raise ItemLoadingError(
                 "There is no data available for item: {}".format(self)
             )
 
-        self.write(data, with_metadata=with_metadata, force=force)
-        return data
+        self._replicate(
+            source_item,
+            list(self.iter_chain()),
+            with_metadata,
+            force,
+            progress,
+            resume,
+            delta,
+            base_item,
+            priority,
+            report,
+        )
+        return source_item
+
+    def _find_source_item(self, upstream, with_metadata):
+        chain = list(self.iter_chain())
+        for item in chain if upstream else chain[::-1]:
+            if item.exists():
+                break
+        else:
+            return
+
+        if with_metadata:
+            item._set_metadata_loader(item._load_metadata)
+            self._copy_metadata_from(item)
+
+        return item
+
+    def _copy_metadata_from(self, item):
+        # items between this one and the provided one get the same
+        # metadata as if they were visited by the sequential read
+        for chain_item in self.iter_chain():
+            if chain_item is item:
+                break
+            chain_item.copy_metadata(item)
+
+    def _replicate(
+        self,
+        source_item,
+        targets,
+        with_metadata,
+        force,
+        progress=None,
+        resume=False,
+        delta=False,
+        base_item=None,
+        priority=TransferPriority.INTERACTIVE,
+        report=None,
+        relay=False,
+    ):
+        digest = None
+        if with_metadata or force:
+            digest = source_item.get_content_digest()
+
+            if with_metadata:
+                if digest:
+                    self.set_metadata("content", {"md5": digest[0], "size": digest[1]})
+                else:
+                    self.pop_metadata("content")
+
+        for target in targets:
+            if target is source_item:
+                continue
+
+            if not target._needs_write(force, digest):
+                if report is not None:
+                    report.add(
+                        TransferResult(
+                            target, TransferStatus.SKIPPED, source=source_item
+                        )
+                    )
+                continue
+
+            log.debug('Copying item "{}" to "{}" ...'.format(source_item, target))
+
+            try:
+                target._copy_data(
+                    source_item, progress, resume, delta, base_item, priority
+                )
+
+                if with_metadata:
+                    if target is not self:
+                        target.copy_metadata(self)
+                    target._dump_metadata()
+            except Exception as e:
+                if report is not None:
+                    report.add(
+                        TransferResult(
+                            target, TransferStatus.FAILED, e, source=source_item
+                        )
+                    )
+                raise
+
+            if report is not None:
+                report.add(
+                    TransferResult(target, TransferStatus.DONE, source=source_item)
+                )
+
+            # copy to the rest of the targets from the first written one
+            if relay:
+                source_item = target
+                relay = False
+
+            log.debug("Done")
+
+    def _copy_data(
+        self,
+        source_item,
+        progress=None,
+        resume=False,
+        delta=False,
+        base_item=None,
+        priority=TransferPriority.INTERACTIVE,
+    ):
+        scheduler = self.storage.pool.transfer_scheduler
+        storages = [source_item.storage.name, self.storage.name]
+
+        with scheduler.slot(storages, priority) as throttle:
+            self._transfer_data(
+                source_item,
+                progress,
+                resume,
+                delta,
+                base_item,
+                throttle if scheduler.is_throttled(storages) else None,
+            )
+
+        get_version_index().add(self.accessor, self._rpath)
+
+    def _transfer_data(
+        self, source_item, progress, resume, delta, base_item, throttle=None
+    ):
+        if delta:
+            if self._copy_delta(source_item, base_item, throttle):
+                self._update_signature(source_item, delta)
+                return
+
+        last_transferred = [0]
+
+        def report(transferred, total):
+            if throttle:
+                throttle(max(transferred - last_transferred[0], 0))
+                last_transferred[0] = transferred
+
+            if progress:
+                progress(self, transferred, total)
+
+        item_progress = report if progress or throttle else None
+
+        try:
+            copied = transfer.copy(
+                source_item.accessor,
+                source_item.rpath,
+                self.accessor,
+                self._rpath,
+                progress=item_progress,
+                resume=resume,
+                # the native copies report the progress only at the end,
+                # so the limited transfers are streamed chunk by chunk
+                native=throttle is None,
+            )
+        except:
+            reraise(
+                AccessorError,
+                AccessorError(
+                    'Failed to copy item "{}" to "{}". {}'.format(
+                        source_item, self, sys.exc_info()[1]
+                    )
+                ),
+                sys.exc_info()[2],
+            )
+
+        if not copied:
+            raise ItemLoadingError(
+                "There is no data available for item: {}".format(source_item)
+            )
+
+        self._update_signature(source_item, delta)
+
+    def _update_signature(self, source_item=None, delta=False):
+        # the signature of the replaced data would match the blocks
+        # of the older copies, so it's rewritten or removed
+        if not delta:
+            delta_transfer.remove_signature(self.accessor, self._rpath)
+            return
+
+        # let the later transfers from this item be delta transfers
+        try:
+            delta_transfer.write_signature(
+                source_item.accessor,
+                source_item.rpath,
+                self.accessor,
+                self._rpath,
+                compute=not source_item._is_on_network_share(),
+            )
+        except Exception as e:
+            log.warning('Failed to write signature of "{}". {}'.format(self, e))
+            delta_transfer.remove_signature(self.accessor, self._rpath)
+
+    def _is_on_network_share(self):
+        filename = self.get_filesystem_path()
+        return bool(filename) and utils.is_network_path(filename)
+
+    def _copy_delta(self, source_item, base_item=None, throttle=None):
+        basis_filename = (base_item or self).get_filesystem_path()
+        if not basis_filename or not os.path.isfile(basis_filename):
+            return False
+
+        try:
+            stats = delta_transfer.copy(
+                source_item.accessor,
+                source_item.rpath,
+                self.accessor,
+                self._rpath,
+                basis_filename,
+                throttle=throttle,
+                # reading the whole source from a network share to compute
+                # its signature costs more than copying it
+                compute=not source_item._is_on_network_share(),
+            )
+        except Exception as e:
+            log.warning(
+                'Delta transfer of "{}" failed, copying all the data. {}'.format(
+                    source_item, e
+                )
+            )
+            return False
+
+        if stats:
+            log.debug(
+                'Copied "{}" reusing {} of {} bytes'.format(
+                    self, stats.reused, stats.size
+                )
+            )
+
+        return bool(stats)
+
+    # Asynchronous API. The blocking methods run in the shared executor,
+    # so both APIs behave the same.
+
+    async def exists_async(self, check_upstream=False):
+        return await run_async(self.exists, check_upstream)
+
+    async def read_async(self, *args, **kwargs):
+        """Asynchronous version of "read", takes the same arguments."""
+        return await run_async(self.read, *args, **kwargs)
+
+    async def write_async(self, data, *args, **kwargs):
+        """Asynchronous version of "write", takes the same arguments."""
+        return await run_async(self.write, data, *args, **kwargs)
+
+    async def pull_async(self, *args, **kwargs):
+        """Asynchronous version of "pull", takes the same arguments."""
+        return await run_async(self.pull, *args, **kwargs)
+
+    async def push_async(self, *args, **kwargs):
+        """Asynchronous version of "push", takes the same arguments."""
+        return await run_async(self.push, *args, **kwargs)
 
     def make_directories(self):
         try:
@@ -645,6 +1932,11 @@ class StorageItem(TagsMixin, FieldsMixin, MetadataEdit, ChainItemMixin):
         log.debug('Removing item "{}"'.format(self))
         try:
             self.accessor.rm(self._rpath)
+            delta_transfer.remove_signature(self.accessor, self._rpath)
+
+            bundle = self._get_metadata_bundle()
+            if bundle:
+                bundle.remove(putils.basename(self._rpath))
         except:
             reraise(
                 AccessorError,
@@ -653,6 +1945,9 @@ class StorageItem(TagsMixin, FieldsMixin, MetadataEdit, ChainItemMixin):
                 ),
                 sys.exc_info()[2],
             )
+        finally:
+            get_version_index().invalidate(self.accessor, self._rpath)
+        self._update_catalog()
         if propagate and self.next_item:
             self.next_item.remove(propagate)
         log.debug("Done")
@@ -688,8 +1983,16 @@ class StoragePool(object):
         self._pool_config = config
         self._project = self._pool_config["project"]
         self._cache = LRUCache(maxsize=5000)
+        self._replication_queue = None
+        self._replication_lock = threading.Lock()
+        self._transfer_scheduler = TransferScheduler(
+            **self._pool_config.get("scheduler", {})
+        )
         self._init_storages()
 
+        if self._pool_config.get("replication", {}).get("resume"):
+            self.resume_replication()
+
     @property
     def project(self):
         return self._project
@@ -702,6 +2005,54 @@ class StoragePool(object):
     def config(self):
         return self._pool_config
 
+    @property
+    def transfer_scheduler(self):
+        """TransferScheduler: scheduler of the transfers between the storages.
+
+        It's configured by the "scheduler" section of the pool configuration.
+
+        """
+        return self._transfer_scheduler
+
+    @property
+    def replication_queue(self):
+        """ReplicationQueue: queue of the write-behind replications.
+
+        It's created on the first access from the "replication"
+        section of the pool configuration.
+
+        """
+        if self._replication_queue is None:
+            with self._replication_lock:
+                if self._replication_queue is None:
+                    kwargs = dict(self._pool_config.get("replication", {}))
+                    kwargs.pop("resume", None)
+                    self._replication_queue = ReplicationQueue(self, **kwargs)
+        return self._replication_queue
+
+    def resume_replication(self):
+        """Drain the jobs left in the journal by the previous processes.
+
+        It's called by the pool itself if "resume" is enabled in the
+        "replication" section of its configuration, as it's meant to be
+        done by a single long running process rather than by every tool.
+
+        Returns:
+            bool: True if there were unfinished jobs.
+
+        """
+        journal = self._pool_config.get("replication", {}).get(
+            "journal"
+        ) or get_default_journal_filename(self._project)
+        if not os.path.exists(journal):
+            return False
+
+        try:
+            return self.replication_queue.resume()
+        except Exception as e:
+            log.warning("Failed to resume replication. {}".format(e))
+            return False
+
     @cachedmethod(lambda self: self._cache, lock=threading.RLock)
     def get_storage_item_from_filename(self, filename):
         filename = putils.normpath(filename)
@@ -777,6 +2128,174 @@ class StoragePool(object):
         if meta_item:
             return meta_item.get_storage_item(identifier.fields)
 
+    def prefetch(
+        self,
+        identifiers=None,
+        tag_mask=None,
+        fields=None,
+        with_metadata=False,
+        max_workers=None,
+        dry_run=False,
+        order=None,
+        progress=None,
+        priority=TransferPriority.BATCH,
+    ):
+        """Pull the items which are missing downstream in parallel.
+
+        The items are either provided by identifiers or found by
+        the tag mask and the fields. The members of the sequences and
+        the collections and the latest revisions are resolved
+        when their primary fields are not provided.
+
+        Args:
+            identifiers (list[Identifier|StorageItem]): items to prefetch.
+            tag_mask (str): mask of the tags of the items to prefetch.
+            fields (dict): fields of the items found by the tag mask.
+            with_metadata (bool): copy metadata as well.
+            max_workers (int): maximum number of concurrent transfers.
+            dry_run (bool): only report the items which would be pulled.
+            order (callable): function returning the sort key of the
+                item, items with lower keys are pulled first, otherwise
+                they are pulled in the order they were provided.
+            progress (callable): function called with the target item,
+                the number of transferred bytes and the total number
+                of bytes or None if the total is unknown.
+            priority (str): one of the TransferPriority values.
+
+        Returns:
+            TransferReport: per-item report, the results refer
+                to the downstream items.
+
+        """
+        items = self._resolve_items(identifiers, tag_mask, fields)
+        if order:
+            items.sort(key=order)
+
+        report = TransferReport()
+        results = {}
+
+        downstream_items = [item.get_downstream_item() for item in items]
+        max_workers = max_workers or DEFAULT_PREFETCH_WORKERS
+
+        try:
+            existing_items = get_existing_items(downstream_items)
+        except AccessorError as e:
+            for item, downstream_item in zip(items, downstream_items):
+                report.add(TransferResult(downstream_item, TransferStatus.FAILED, e))
+            return report
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pull_futures = []
+            for item, downstream_item in zip(items, downstream_items):
+                if downstream_item in existing_items:
+                    results[item] = TransferResult(
+                        downstream_item, TransferStatus.SKIPPED
+                    )
+                elif dry_run:
+                    results[item] = TransferResult(
+                        downstream_item, TransferStatus.PLANNED
+                    )
+                else:
+                    pull_futures.append(
+                        (
+                            item,
+                            executor.submit(
+                                item._pull,
+                                with_metadata=with_metadata,
+                                progress=progress,
+                                priority=priority,
+                            ),
+                        )
+                    )
+
+            for item, future in pull_futures:
+                downstream_item = item.get_downstream_item()
+                try:
+                    future.result()
+                except Exception as e:
+                    log.error('Failed to prefetch item "{}". {}'.format(item, e))
+                    results[item] = TransferResult(
+                        downstream_item, TransferStatus.FAILED, e
+                    )
+                else:
+                    results[item] = TransferResult(downstream_item, TransferStatus.DONE)
+
+        for item in items:
+            report.add(results[item])
+
+        return report
+
+    def _resolve_items(self, identifiers=None, tag_mask=None, fields=None):
+        from .helpers import UTItemRevision, UTItemSequence, UTItemCollection
+
+        requests = []
+        for identifier in identifiers or []:
+            if isinstance(identifier, StorageItem):
+                identifier = identifier.get_identifier()
+            requests.append((identifier.tags, identifier.fields))
+
+        if tag_mask:
+            mask = utils.parse_mask(tag_mask)
+            tag_sets = []
+            for storage in self._storages:
+                for tags in storage.schema.get_items():
+                    if tags not in tag_sets and utils.match_tags(mask, tags):
+                        tag_sets.append(tags)
+
+            requests.extend((sorted(tags), dict(fields or {})) for tags in tag_sets)
+
+        items = []
+        rpaths = set()
+
+        for tags, item_fields in requests:
+            meta_item = self.get_item(tags)
+            if not meta_item:
+                continue
+
+            item_fields = dict(item_fields)
+            if "project" not in item_fields:
+                item_fields["project"] = self._project
+
+            if meta_item.type == ItemType.SEQUENCE:
+                primary_field, helper_class = (
+                    ItemTypePrimaryFields.SEQUENCE,
+                    UTItemSequence,
+                )
+            elif meta_item.type == ItemType.COLLECTION:
+                primary_field, helper_class = (
+                    ItemTypePrimaryFields.COLLECTION,
+                    UTItemCollection,
+                )
+            else:
+                primary_field, helper_class = (
+                    ItemTypePrimaryFields.REVISION,
+                    UTItemRevision,
+                )
+
+            if primary_field in item_fields or (
+                "{" + primary_field not in meta_item.template
+            ):
+                member_items = [meta_item.get_storage_item(item_fields)]
+            elif helper_class is UTItemRevision:
+                member_items = [
+                    helper_class(meta_item, item_fields).get_latest(from_upstream=True)
+                ]
+            else:
+                member_items = helper_class(meta_item, item_fields).get_items(
+                    from_upstream=True
+                )
+
+            for item in member_items:
+                if item is None:
+                    continue
+
+                key = item.get_downstream_item().rpath
+                if key not in rpaths:
+                    rpaths.add(key)
+                    items.append(item)
+
+        return items
+
     def _init_storages(self):
         """Initialize storages from provided configuration.
 
@@ -0,0 +1,453 @@
+"""Delta transfers between accessors.
+
+The data of the source is described by a block signature which holds
+a weak rolling checksum and a strong digest of every block. Blocks of
+the new data are searched for in an older local copy of it (the basis)
+with the rolling checksum, so only the blocks which are not found
+are read from the source, using ranged reads.
+
+The signature is computed on the fly if the source data is available
+on the file system, otherwise it's loaded from the ".sig" sidecar file
+written next to the data by the previous delta enabled transfers.
+The sidecar records the modification time and the entity tag of the
+data it was written for, and it's ignored once the data changes.
+
+"""
+
+import math
+import mmap
+import zlib
+import struct
+import hashlib
+import logging
+import collections
+
+from .errors import DeltaTransferError
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BLOCK_SIZE = 64 * 1024
+
+SIGNATURE_SUFFIX = ".sig"
+
+_ADLER_MOD = 65521
+_SIGNATURE_MAGIC = b"BDSIG2"
+# magic, block size, data size, data digest, data modification time
+# and entity tag length followed by the entity tag
+_HEADER = struct.Struct("<6sIQ16sdH")
+_BLOCK = struct.Struct("<I16s")
+
+DeltaStats = collections.namedtuple("DeltaStats", ["size", "reused", "fetched"])
+
+
+class Signature(object):
+    def __init__(self, block_size, size, digest, blocks, mtime=None, etag=None):
+        self.block_size = block_size
+        self.size = size
+        self.digest = digest
+        self.blocks = blocks
+        # state of the data the signature was written for
+        self.mtime = mtime
+        self.etag = etag
+
+    def matches(self, stat):
+        """Check if the signature still describes the data.
+
+        Args:
+            stat (AccessorStat): current state of the data.
+
+        Returns:
+            bool: True if the data wasn't changed since
+                the signature was written.
+
+        """
+        if stat is None or stat.size != self.size:
+            return False
+
+        if self.etag is not None and stat.etag is not None:
+            return self.etag == stat.etag
+
+        if self.mtime is not None and stat.mtime is not None:
+            return self.mtime == stat.mtime
+
+        return False
+
+    def get_block_range(self, index):
+        start = index * self.block_size
+        return start, min(start + self.block_size, self.size)
+
+    def dumps(self):
+        etag = (self.etag or "").encode("utf-8")
+        return b"".join(
+            [
+                _HEADER.pack(
+                    _SIGNATURE_MAGIC,
+                    self.block_size,
+                    self.size,
+                    self.digest,
+                    float("nan") if self.mtime is None else self.mtime,
+                    len(etag),
+                ),
+                etag,
+            ]
+            + [_BLOCK.pack(weak, strong) for weak, strong in self.blocks]
+        )
+
+    @classmethod
+    def loads(cls, data):
+        if data[: len(_SIGNATURE_MAGIC)] != _SIGNATURE_MAGIC:
+            raise DeltaTransferError("Invalid signature data")
+
+        _, block_size, size, digest, mtime, etag_size = _HEADER.unpack_from(data)
+
+        blocks_offset = _HEADER.size + etag_size
+        etag = data[_HEADER.size : blocks_offset].decode("utf-8") or None
+
+        blocks = [
+            _BLOCK.unpack_from(data, offset)
+            for offset in range(blocks_offset, len(data), _BLOCK.size)
+        ]
+        return cls(
+            block_size,
+            size,
+            digest,
+            blocks,
+            None if math.isnan(mtime) else mtime,
+            etag,
+        )
+
+    def __repr__(self):
+        return "Signature(block_size={}, size={}, blocks={})".format(
+            self.block_size, self.size, len(self.blocks)
+        )
+
+
+def _read_exactly(stream, size):
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def compute_signature(stream, block_size=DEFAULT_BLOCK_SIZE):
+    """Compute block signature of the data.
+
+    Args:
+        stream (file-like object): data stream.
+        block_size (int): size of the blocks.
+
+    Returns:
+        Signature: block signature.
+
+    """
+    blocks = []
+    digest = hashlib.md5()
+    size = 0
+
+    while True:
+        block = _read_exactly(stream, block_size)
+        if not block:
+            break
+
+        digest.update(block)
+        size += len(block)
+        blocks.append((zlib.adler32(block), hashlib.md5(block).digest()))
+
+    return Signature(block_size, size, digest.digest(), blocks)
+
+
+def get_signature(accessor, rpath, block_size=DEFAULT_BLOCK_SIZE, compute=True):
+    """Get block signature of the data from its sidecar or by computing it
+    if the data is available on the file system.
+
+    Args:
+        accessor (BaseAccessor): data accessor.
+        rpath (str): relative path.
+        block_size (int): size of the blocks of the computed signature.
+        compute (bool): compute the signature if there is no valid sidecar,
+            it reads the whole data.
+
+    Returns:
+        Signature: block signature or None if it's not available.
+
+    """
+    try:
+        stat = accessor.stat(rpath)
+    except NotImplementedError:
+        stat = None
+
+    data = accessor.read(rpath + SIGNATURE_SUFFIX)
+    if data:
+        try:
+            signature = Signature.loads(data)
+        except (struct.error, UnicodeDecodeError, DeltaTransferError) as e:
+            log.warning('Invalid signature of "{}". {}'.format(rpath, e))
+        else:
+            # the data was replaced after the signature was written
+            if signature.matches(stat):
+                return signature
+
+            log.debug('Outdated signature of "{}"'.format(rpath))
+
+    filename = accessor.get_filesystem_path(rpath) if compute else None
+    if filename:
+        try:
+            with open(filename, "rb") as f:
+                return compute_signature(f, block_size)
+        except (IOError, OSError):
+            return
+
+
+def write_signature(src_accessor, src_rpath, dst_accessor, dst_rpath, compute=True):
+    """Write the signature sidecar of the copied data if it's available.
+
+    The sidecar is bound to the current state of the destination data,
+    the outdated sidecar is removed if there is no signature to write.
+
+    Args:
+        compute (bool): compute the signature of the source data
+            if it has no valid sidecar.
+
+    Returns:
+        bool: True if the signature was written, False otherwise.
+
+    """
+    signature = get_signature(src_accessor, src_rpath, compute=compute)
+
+    try:
+        stat = dst_accessor.stat(dst_rpath)
+    except NotImplementedError:
+        stat = None
+
+    # the signature couldn't be validated later
+    if signature is None or stat is None or stat.size != signature.size:
+        remove_signature(dst_accessor, dst_rpath)
+        return False
+
+    signature.mtime = stat.mtime
+    signature.etag = stat.etag
+
+    dst_accessor.write(dst_rpath + SIGNATURE_SUFFIX, signature.dumps())
+    return True
+
+
+def remove_signature(accessor, rpath):
+    """Remove the signature sidecar of the data, if any.
+
+    Args:
+        accessor (BaseAccessor): data accessor.
+        rpath (str): relative path of the data.
+
+    """
+    try:
+        accessor.rm(rpath + SIGNATURE_SUFFIX)
+    except Exception as e:
+        log.debug('Failed to remove signature of "{}". {}'.format(rpath, e))
+
+
+def match_blocks(signature, basis, rolling=True):
+    """Find blocks of the signature in the basis data.
+
+    Blocks at the same offsets are checked first, then the unmatched
+    regions of the basis are scanned with the rolling checksum to find
+    the blocks which were shifted by inserted or removed data.
+
+    Args:
+        signature (Signature): block signature of the new data.
+        basis (bytes|mmap.mmap): old data.
+        rolling (bool): scan the basis with the rolling checksum.
+
+    Returns:
+        dict: block index to basis offset mapping.
+
+    """
+    block_size = signature.block_size
+    basis_size = len(basis)
+    matches = {}
+
+    for index, (weak, strong) in enumerate(signature.blocks):
+        start, end = signature.get_block_range(index)
+        if end > basis_size:
+            break
+
+        chunk = basis[start:end]
+        if zlib.adler32(chunk) == weak and hashlib.md5(chunk).digest() == strong:
+            matches[index] = start
+
+    num_full_blocks = signature.size // block_size
+    if not rolling or basis_size < block_size or len(matches) >= num_full_blocks:
+        return matches
+
+    weak_index = {}
+    for index in range(num_full_blocks):
+        if index not in matches:
+            weak_index.setdefault(signature.blocks[index][0], []).append(index)
+
+    matched_offsets = set(matches.values())
+
+    position = 0
+    a = b = None
+    while position + block_size <= basis_size:
+        if position in matched_offsets:
+            position += block_size
+            a = None
+            continue
+
+        if a is None:
+            checksum = zlib.adler32(basis[position : position + block_size])
+            a, b = checksum & 0xFFFF, checksum >> 16
+
+        candidates = weak_index.get((b << 16) | a)
+        if candidates:
+            strong = hashlib.md5(basis[position : position + block_size]).digest()
+            found = [i for i in candidates if signature.blocks[i][1] == strong]
+            if found:
+                for index in found:
+                    matches[index] = position
+                    candidates.remove(index)
+
+                if not candidates:
+                    del weak_index[(b << 16) | a]
+                    if not weak_index:
+                        break
+
+                position += block_size
+                a = None
+                continue
+
+        if position + block_size == basis_size:
+            break
+
+        # roll the checksum by one byte
+        x_out = basis[position]
+        x_in = basis[position + block_size]
+        a = (a - x_out + x_in) % _ADLER_MOD
+        b = (b - block_size * x_out + a - 1) % _ADLER_MOD
+        position += 1
+
+    return matches
+
+
+def _iter_missing_ranges(signature, matches):
+    index = 0
+    num_blocks = len(signature.blocks)
+
+    while index < num_blocks:
+        if index in matches:
+            index += 1
+            continue
+
+        first_index = index
+        while index < num_blocks and index not in matches:
+            index += 1
+
+        yield first_index, index
+
+
+def copy(
+    src_accessor,
+    src_rpath,
+    dst_accessor,
+    dst_rpath,
+    basis_filename,
+    block_size=DEFAULT_BLOCK_SIZE,
+    rolling=True,
+    throttle=None,
+    compute=True,
+):
+    """Copy data reading from the source only the blocks which are
+    missing in the basis file.
+
+    Args:
+        src_accessor (BaseAccessor): accessor to read the data from.
+        src_rpath (str): source relative path.
+        dst_accessor (BaseAccessor): accessor to write the data to.
+        dst_rpath (str): destination relative path.
+        basis_filename (str): older version of the data on the file system.
+        block_size (int): size of the blocks of the computed signature.
+        rolling (bool): search for the shifted blocks.
+        throttle (callable): function called with the number of bytes
+            read from the source before they are read.
+        compute (bool): compute the signature of the source data if it
+            has no valid sidecar, otherwise the delta transfer isn't done.
+
+    Returns:
+        DeltaStats: transfer statistics or None if the delta
+            transfer is not possible.
+
+    Raises:
+        DeltaTransferError: if the result doesn't match the signature.
+
+    """
+    signature = get_signature(src_accessor, src_rpath, block_size, compute)
+    if signature is None or not signature.size:
+        return
+
+    with open(basis_filename, "rb") as f:
+        try:
+            basis = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty basis
+            return
+
+    try:
+        matches = match_blocks(signature, basis, rolling)
+        if not matches:
+            return
+
+        digest = hashlib.md5()
+        fetched = 0
+
+        with dst_accessor.open_write(dst_rpath) as dst:
+            missing_ranges = dict(_iter_missing_ranges(signature, matches))
+
+            index = 0
+            while index < len(signature.blocks):
+                start, end = signature.get_block_range(index)
+
+                if index in matches:
+                    offset = matches[index]
+                    chunk = basis[offset : offset + end - start]
+                    digest.update(chunk)
+                    dst.write(chunk)
+                    index += 1
+                    continue
+
+                last_index = missing_ranges[index]
+                end = signature.get_block_range(last_index - 1)[1]
+
+                src = src_accessor.open_read(src_rpath, start)
+                if src is None:
+                    raise DeltaTransferError(
+                        'Source data "{}" disappeared'.format(src_rpath)
+                    )
+
+                with src:
+                    remaining = end - start
+                    while remaining > 0:
+                        if throttle:
+                            throttle(min(remaining, block_size))
+
+                        chunk = src.read(min(remaining, block_size))
+                        if not chunk:
+                            break
+                        digest.update(chunk)
+                        dst.write(chunk)
+                        remaining -= len(chunk)
+
+                fetched += end - start
+                index = last_index
+
+            if digest.digest() != signature.digest:
+                raise DeltaTransferError(
+                    'Result of the delta transfer of "{}" doesn\'t match '
+                    "its signature".format(src_rpath)
+                )
+
+        return DeltaStats(signature.size, signature.size - fetched, fetched)
+    finally:
+        basis.close()
@@ -1,35 +1,95 @@
+import threading
+
 from .mixins import TagsMixin, FieldsMixin
 
 
+class _MetadataRef(object):
+    """Metadata shared by the items, optionally loaded on the first access."""
+
+    __slots__ = ("_value", "_loader", "_lock")
+
+    def __init__(self, value=None, loader=None):
+        self._value = value
+        self._loader = loader
+        self._lock = threading.Lock() if loader else None
+
+    def get(self):
+        if self._loader is not None:
+            with self._lock:
+                if self._loader is not None:
+                    self._value = self._loader()
+                    self._loader = None
+        return self._value
+
+
 class MetadataEdit(object):
+    """Metadata of an item.
+
+    The metadata can be loaded lazily and is shared by reference
+    between the items it's copied to until one of them modifies it.
+
+    """
+
     def __init__(self):
-        self._metadata = None
+        self._metadata_ref = None
+        # the items sharing the metadata copy it before modifying
+        self._metadata_owned = False
+
+    @property
+    def _metadata(self):
+        if self._metadata_ref is not None:
+            return self._metadata_ref.get()
+
+    def _set_metadata_loader(self, loader):
+        """Replace the metadata by the result of the loader called on demand.
+
+        Args:
+            loader (callable): function returning the metadata dict or None.
+
+        """
+        self._metadata_ref = _MetadataRef(loader=loader)
+        self._metadata_owned = True
+
+    def _get_own_metadata(self):
+        metadata = self._metadata
+        if metadata is not None and not self._metadata_owned:
+            metadata = metadata.copy()
+            self._metadata_ref = _MetadataRef(metadata)
+            self._metadata_owned = True
+        return metadata
 
     def get_metadata(self, key):
-        if self._metadata:
-            return self._metadata.get(key)
+        metadata = self._metadata
+        if metadata:
+            return metadata.get(key)
 
     def set_metadata(self, key, value):
-        if not self._metadata:
-            self._metadata = {key: value}
+        metadata = self._get_own_metadata()
+        if not metadata:
+            self._metadata_ref = _MetadataRef({key: value})
+            self._metadata_owned = True
         else:
-            self._metadata[key] = value
+            metadata[key] = value
+
+    def pop_metadata(self, key):
+        metadata = self._get_own_metadata()
+        if metadata:
+            return metadata.pop(key, None)
 
     def get_metadata_dict(self):
-        return self._metadata
+        return self._get_own_metadata()
 
     def set_metadata_dict(self, metadata):
         if metadata is None:
-            self._metadata = None
+            self._metadata_ref = None
         else:
-            self._metadata = metadata.copy()
+            self._metadata_ref = _MetadataRef(metadata.copy())
+        self._metadata_owned = True
 
     def copy_metadata(self, item):
-        metadata = item._metadata
-        if metadata is None:
-            self._metadata = None
-        else:
-            self._metadata = metadata.copy()
+        self._metadata_ref = item._metadata_ref
+        self._metadata_owned = False
+        item._metadata_owned = False
 
 
 class TagsEdit(TagsMixin):
@@ -4,3 +4,29 @@ class ItemType:
 
 class ItemTypePrimaryFields:
     REVISION, COLLECTION, SEQUENCE = ("_version_", "_suffix_", "_index_")
+
+
+class WritePolicy:
+    ALL_OR_NOTHING, BEST_EFFORT = ("all_or_nothing", "best_effort")
+
+
+class TransferStatus:
+    DONE, SKIPPED, FAILED, ROLLED_BACK, PLANNED = (
+        "done",
+        "skipped",
+        "failed",
+        "rolled_back",
+        "planned",
+    )
+
+
+class LinkMode:
+    HARDLINK, REFLINK = ("hardlink", "reflink")
+
+
+class ReplicationStatus:
+    PENDING, RUNNING, DONE, FAILED = ("pending", "running", "done", "failed")
+
+
+class TransferPriority:
+    INTERACTIVE, BATCH, BACKGROUND = ("interactive", "batch", "background")
@@ -68,3 +68,17 @@ class AdapterError(StorageError):
 
 class AdapterCreationError(AdapterError):
     pass
+
+
+class TransferError(ItemError):
+    def __init__(self, message, report=None):
+        super(TransferError, self).__init__(message)
+        self.report = report
+
+
+class DeltaTransferError(AccessorError):
+    pass
+
+
+class MetadataConflictError(AccessorError):
+    pass
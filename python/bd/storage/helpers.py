@@ -1,14 +1,29 @@
 import re
 import sys
 import errno
+import asyncio
+import itertools
+import logging
+from concurrent.futures import ThreadPoolExecutor
 
 from six import reraise
 
 from .edits import FieldsEdit
-from .errors import InputError, AccessorError
-from .core import StorageItem
+from .errors import InputError, AccessorError, TransferError
+from .core import StorageItem, get_existing_items, load_metadata
+from .bundle import MetadataBatch, call_in_batch, is_metadata_index
+from .versions import get_version_index
 from .utils import putils
-from .enums import ItemTypePrimaryFields
+from .enums import ItemTypePrimaryFields, TransferStatus, TransferPriority
+from .report import TransferResult, TransferReport
+from .concurrency import run_async
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 8
+
+# number of the lazily built items metadata is loaded for at once
+LAZY_METADATA_CHUNK_SIZE = 100
 
 
 class UTBase(FieldsEdit):
@@ -42,45 +57,265 @@ class UTBase(FieldsEdit):
             fields.set_field(self.primary_field, primary_field_value)
         return self._meta_item.get_storage_item(fields)
 
-    def pull(self, with_metadata=False):
-        for member_item in self.get_items(from_upstream=True):
-            member_item.pull(with_metadata)
-
-    def push(self, with_metadata=False):
-        for member_item in self.get_items(from_upstream=False):
-            member_item.push(with_metadata)
-
-    def get_items(self, from_upstream=False):
-        fields = FieldsEdit(self.fields)
-        fields.set_field(
-            self.primary_field, self.placeholder
-        )  # adding just to detect it later
+    def pull(
+        self,
+        with_metadata=False,
+        force=False,
+        max_workers=None,
+        progress=None,
+        priority=TransferPriority.BATCH,
+    ):
+        """Copy the members down to the downstream storage concurrently.
+
+        Args:
+            with_metadata (bool): copy metadata as well.
+            force (bool): overwrite existing members.
+            max_workers (int): maximum number of concurrent transfers.
+            progress (callable): function called with the target item,
+                the number of transferred bytes and the total number
+                of bytes or None if the total is unknown.
+            priority (str): one of the TransferPriority values.
+
+        Returns:
+            TransferReport: per-member report, the results refer
+                to the downstream items.
+
+        Raises:
+            TransferError: if some of the members failed to transfer,
+                the rest of them are transferred anyway.
+
+        """
+        member_items = self.get_items(from_upstream=True)
+        return self._transfer(
+            member_items,
+            [[item.get_downstream_item()] for item in member_items],
+            "pull",
+            with_metadata,
+            force,
+            max_workers,
+            progress,
+            priority,
+        )
 
-        meta_item = (
-            self._meta_item.get_upstream_item() if from_upstream else self._meta_item
+    def push(
+        self,
+        with_metadata=False,
+        force=False,
+        max_workers=None,
+        progress=None,
+        priority=TransferPriority.BATCH,
+    ):
+        """Copy the members up to the upstream storages concurrently.
+
+        Args:
+            with_metadata (bool): copy metadata as well.
+            force (bool): overwrite existing members.
+            max_workers (int): maximum number of concurrent transfers.
+            progress (callable): function called with the target item,
+                the number of transferred bytes and the total number
+                of bytes or None if the total is unknown.
+            priority (str): one of the TransferPriority values.
+
+        Returns:
+            TransferReport: per-member report.
+
+        Raises:
+            TransferError: if some of the members failed to transfer,
+                the rest of them are transferred anyway.
+
+        """
+        member_items = self.get_items(from_upstream=False)
+        return self._transfer(
+            member_items,
+            [list(item.iter_chain()) for item in member_items],
+            "push",
+            with_metadata,
+            force,
+            max_workers,
+            progress,
+            priority,
         )
 
-        rpath = meta_item.build_rpath(fields)
+    def _transfer(
+        self,
+        member_items,
+        targets,
+        method,
+        with_metadata,
+        force,
+        max_workers,
+        progress,
+        priority,
+    ):
+        report = TransferReport()
+        results = {}
+
+        # the metadata indices of the members are written once at the end
+        batch = MetadataBatch() if with_metadata else None
+
+        existing_items = set()
+        if not force:
+            existing_items = get_existing_items(
+                [target for item_targets in targets for target in item_targets]
+            )
+
+        with ThreadPoolExecutor(
+            max_workers=max_workers or DEFAULT_MAX_WORKERS
+        ) as executor:
+            futures = []
+            for member_item, item_targets in zip(member_items, targets):
+                if all(target in existing_items for target in item_targets):
+                    results[member_item] = TransferResult(
+                        item_targets[0], TransferStatus.SKIPPED
+                    )
+                    continue
+
+                futures.append(
+                    (
+                        member_item,
+                        item_targets[0],
+                        executor.submit(
+                            call_in_batch,
+                            batch,
+                            getattr(member_item, "_" + method),
+                            with_metadata=with_metadata,
+                            force=force,
+                            progress=progress,
+                            priority=priority,
+                        ),
+                    )
+                )
+
+            for member_item, target, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    log.error(e)
+                    results[member_item] = TransferResult(
+                        target, TransferStatus.FAILED, e
+                    )
+                else:
+                    results[member_item] = TransferResult(target, TransferStatus.DONE)
+
+        if batch is not None:
+            self._flush_batch(batch, member_items, targets, results)
+
+        for member_item in member_items:
+            report.add(results[member_item])
+
+        if report.failed:
+            raise TransferError(
+                "Failed to {} {} of {} items".format(
+                    method, len(report.failed), len(report)
+                ),
+                report,
+            )
+
+        return report
+
+    @staticmethod
+    def _flush_batch(batch, member_items, targets, results):
+        errors = batch.flush()
+        if not errors:
+            return
+
+        for member_item, item_targets in zip(member_items, targets):
+            if results[member_item].status != TransferStatus.DONE:
+                continue
+
+            for target in item_targets:
+                bundle = target._get_metadata_bundle()
+                error = errors.get(bundle.key) if bundle else None
+                if error is not None:
+                    results[member_item] = TransferResult(
+                        target, TransferStatus.FAILED, error
+                    )
+                    break
+
+    def get_items(self, from_upstream=False, with_metadata=False, lazy=False):
+        """Get the storage items of the members.
+
+        The members are listed at once, so the listing errors are
+        raised by the call even if the items are built lazily.
+
+        Args:
+            from_upstream (bool): find the members in the upstream storage.
+            with_metadata (bool): load metadata of the members at once,
+                in chunks of LAZY_METADATA_CHUNK_SIZE items if lazy.
+            lazy (bool): build the items as they are iterated.
+
+        Returns:
+            list[StorageItem]: member items, a generator of them if lazy.
+
+        """
+        fields, meta_item, rpath = self._get_listing_context(from_upstream)
         if not rpath:
-            return []
+            return iter(()) if lazy else []
 
         primary_field_values = self._get_primary_field_values(meta_item, rpath)
+        member_items = self._iter_items(fields, meta_item, primary_field_values)
+
+        if lazy:
+            if with_metadata:
+                return self._iter_with_metadata(member_items)
+            return member_items
+
+        member_items = list(member_items)
+        if with_metadata:
+            load_metadata(member_items)
 
-        member_items = []
+        return member_items
 
+    def _iter_items(self, fields, meta_item, primary_field_values):
         for primary_field_value in primary_field_values:
 
             fields.set_field(self.primary_field, primary_field_value)
 
             member_item = meta_item.get_storage_item(fields)
             if member_item:
-                member_items.append(member_item)
+                yield member_item
 
-        return member_items
+    @staticmethod
+    def _iter_with_metadata(member_items):
+        while True:
+            chunk = list(itertools.islice(member_items, LAZY_METADATA_CHUNK_SIZE))
+            if not chunk:
+                return
+
+            load_metadata(chunk)
+            for member_item in chunk:
+                yield member_item
+
+    def _get_listing_context(self, from_upstream):
+        fields = FieldsEdit(self.fields)
+        fields.set_field(
+            self.primary_field, self.placeholder
+        )  # adding just to detect it later
+
+        meta_item = (
+            self._meta_item.get_upstream_item() if from_upstream else self._meta_item
+        )
+
+        return fields, meta_item, meta_item.build_rpath(fields)
 
     def _get_primary_field_values(self, meta_item, rpath):
         raise NotImplementedError()
 
+    async def get_items_async(self, from_upstream=False):
+        return await run_async(self.get_items, from_upstream)
+
+    async def pull_async(self, with_metadata=False):
+        member_items = await self.get_items_async(from_upstream=True)
+        await asyncio.gather(
+            *[member_item.pull_async(with_metadata) for member_item in member_items]
+        )
+
+    async def push_async(self, with_metadata=False):
+        member_items = await self.get_items_async(from_upstream=False)
+        await asyncio.gather(
+            *[member_item.push_async(with_metadata) for member_item in member_items]
+        )
+
 
 class UTItemRevision(UTBase):
 
@@ -88,13 +323,21 @@ class UTItemRevision(UTBase):
     placeholder = 96969696969696
 
     def get_latest(self, from_upstream=False):
-        storage_items = self.get_items(from_upstream)
-        if storage_items:
-            return storage_items[-1]
+        fields, meta_item, rpath = self._get_listing_context(from_upstream)
+        if not rpath:
+            return
 
-    def _get_primary_field_values(self, meta_item, rpath):
-        primary_field_values = set()
+        primary_field_value = self._get_latest_primary_field_value(meta_item, rpath)
+        if primary_field_value is None:
+            return
 
+        fields.set_field(self.primary_field, primary_field_value)
+        return meta_item.get_storage_item(fields)
+
+    async def get_latest_async(self, from_upstream=False):
+        return await run_async(self.get_latest, from_upstream)
+
+    def _get_version_pattern(self, rpath):
         # rpath parts preceding the versioned part
         root_parts = []
         versioned_part = None
@@ -110,27 +353,40 @@ class UTItemRevision(UTBase):
             root_parts.append(uid_part)
 
         if versioned_part is None:
-            return [1]
+            return None, None
 
         uid_root = putils.join(*root_parts)
-        uid_tail_pattern = re.escape(versioned_part).replace(placeholder_str, "(\d+)")
+        uid_tail_pattern = re.escape(versioned_part).replace(placeholder_str, r"(\d+)")
+        return uid_root, uid_tail_pattern
 
+    @staticmethod
+    def _find_versions(method, meta_item, uid_root, uid_tail_pattern):
         try:
-            uid_tails = meta_item.accessor.list(uid_root, recursive=False)
+            return method(meta_item.accessor, uid_root, uid_tail_pattern)
         except Exception as e:
             if isinstance(e, OSError) and e.errno == errno.ENOENT:
-                return []
+                return
 
             reraise(AccessorError, AccessorError(e), sys.exc_info()[2])
 
-        for uid_tail in sorted(uid_tails):
-            match = re.match(uid_tail_pattern, uid_tail)
-            if match:
-                primary_field_values.add(int(match.group(1)))
+    def _get_primary_field_values(self, meta_item, rpath):
+        uid_root, uid_tail_pattern = self._get_version_pattern(rpath)
+        if uid_root is None:
+            return [1]
 
-        primary_field_values = list(primary_field_values)
-        primary_field_values.sort()
-        return primary_field_values
+        primary_field_values = self._find_versions(
+            get_version_index().get_versions, meta_item, uid_root, uid_tail_pattern
+        )
+        return primary_field_values or []
+
+    def _get_latest_primary_field_value(self, meta_item, rpath):
+        uid_root, uid_tail_pattern = self._get_version_pattern(rpath)
+        if uid_root is None:
+            return 1
+
+        return self._find_versions(
+            get_version_index().get_latest, meta_item, uid_root, uid_tail_pattern
+        )
 
 
 class UTItemSequence(UTItemRevision):
@@ -148,7 +404,8 @@ class UTItemCollection(UTBase):
 
         primary_field_values = set()
         for relative_suffix_rpath in relative_suffix_rpaths:
-            primary_field_values.add(relative_suffix_rpath)
+            if not is_metadata_index(relative_suffix_rpath):
+                primary_field_values.add(relative_suffix_rpath)
 
         primary_field_values = list(primary_field_values)
         primary_field_values.sort()
@@ -0,0 +1,273 @@
+import os
+import bz2
+import lzma
+import zlib
+import logging
+
+from bd.storage.accessor import (
+    AccessorWrapper,
+    AccessorWriter,
+    AccessorStat,
+    PrefixedReader,
+)
+
+log = logging.getLogger(__name__)
+
+# compressed data starts with the magic bytes followed by the codec id,
+# so data written without compression is still readable
+MAGIC = b"\x89BDZ"
+HEADER_SIZE = len(MAGIC) + 1
+
+CHUNK_SIZE = 1024 * 1024
+
+DEFAULT_CODECS = {
+    ".json": "zlib",
+    ".meta": "zlib",
+    ".txt": "zlib",
+    ".xml": "zlib",
+    ".yml": "zlib",
+    ".yaml": "zlib",
+    ".ma": "zlib",
+    ".usda": "zlib",
+    ".obj": "zlib",
+    ".nk": "zlib",
+}
+
+
+class Codec(object):
+    def __init__(self, codec_id, compressor, decompressor):
+        self.id = codec_id
+        self._compressor = compressor
+        self._decompressor = decompressor
+
+    def compressor(self, level=None):
+        return self._compressor(level)
+
+    def decompressor(self):
+        return self._decompressor()
+
+
+CODECS = {
+    "zlib": Codec(
+        1,
+        lambda level: zlib.compressobj(6 if level is None else level),
+        zlib.decompressobj,
+    ),
+    "bz2": Codec(
+        2,
+        lambda level: bz2.BZ2Compressor(9 if level is None else level),
+        bz2.BZ2Decompressor,
+    ),
+    "lzma": Codec(
+        3, lambda level: lzma.LZMACompressor(preset=level), lzma.LZMADecompressor
+    ),
+}
+
+CODECS_BY_ID = {codec.id: codec for codec in CODECS.values()}
+
+
+class DecompressingReader(object):
+    """Stream of the data decompressed on the fly."""
+
+    def __init__(self, stream, codec):
+        self._stream = stream
+        self._decompressor = codec.decompressor()
+        self._buffer = bytearray()
+        self._eof = False
+        self.closed = False
+
+    def _fill(self, size):
+        # the output of every step is bounded by the missing size,
+        # so a small chunk of compressed data never expands at once
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            max_length = CHUNK_SIZE if size < 0 else size - len(self._buffer)
+            self._buffer.extend(self._decompress(max_length))
+
+    def _decompress(self, max_length):
+        decompressor = self._decompressor
+
+        # zlib keeps the input it didn't decompress in the unconsumed tail,
+        # bz2 and lzma keep it internally until they need more input
+        if hasattr(decompressor, "unconsumed_tail"):
+            chunk = decompressor.unconsumed_tail or self._stream.read(CHUNK_SIZE)
+            if not chunk:
+                self._eof = True
+                return decompressor.flush()
+            return decompressor.decompress(chunk, max_length)
+
+        if decompressor.eof:
+            self._eof = True
+            return b""
+
+        chunk = b""
+        if decompressor.needs_input:
+            chunk = self._stream.read(CHUNK_SIZE)
+            if not chunk:
+                self._eof = True
+                return b""
+
+        return decompressor.decompress(chunk, max_length)
+
+    def read(self, size=-1):
+        if size is None:
+            size = -1
+
+        self._fill(size)
+
+        if size < 0:
+            size = len(self._buffer)
+
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class CompressingWriter(AccessorWriter):
+    def __init__(self, writer, codec, level=None):
+        super(CompressingWriter, self).__init__()
+        self._writer = writer
+        self._compressor = codec.compressor(level)
+        self._writer.write(MAGIC + bytes(bytearray([codec.id])))
+
+    def write(self, data):
+        compressed = self._compressor.compress(data)
+        if compressed:
+            self._writer.write(compressed)
+        return len(data)
+
+    def _commit(self):
+        try:
+            self._writer.write(self._compressor.flush())
+        except:
+            self._writer.abort()
+            raise
+
+        self._writer.close()
+
+    def _abort(self):
+        self._writer.abort()
+
+
+class CompressedAccessor(AccessorWrapper):
+    """Accessor compressing the data of the wrapped accessor.
+
+    The codec is chosen by the file extension. Data without the
+    compression header is read as is, so the already existing
+    uncompressed files keep working.
+
+    Args:
+        accessor (BaseAccessor|dict): wrapped accessor or its configuration.
+        codecs (dict): file extension to codec name ("zlib", "bz2", "lzma")
+            mapping, None disables compression of the extension.
+        default_codec (str): codec of the extensions not found in "codecs".
+        level (int): compression level.
+
+    """
+
+    def __init__(self, accessor, codecs=None, default_codec=None, level=None):
+        super(CompressedAccessor, self).__init__(accessor)
+
+        self._codecs = dict(DEFAULT_CODECS if codecs is None else codecs)
+        self._default_codec = default_codec
+        self._level = level
+
+        for codec_name in list(self._codecs.values()) + [default_codec]:
+            if codec_name and codec_name not in CODECS:
+                raise ValueError('Unknown codec "{}"'.format(codec_name))
+
+    def _get_codec(self, rpath):
+        extension = os.path.splitext(rpath)[1].lower()
+        codec_name = self._codecs.get(extension, self._default_codec)
+        if codec_name:
+            return CODECS[codec_name]
+
+    def read(self, rpath):
+        stream = self.open_read(rpath)
+        if stream is None:
+            return
+
+        with stream:
+            return stream.read()
+
+    def write(self, rpath, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        with self.open_write(rpath) as f:
+            f.write(data)
+
+    def open_read(self, rpath, offset=0):
+        stream = self._accessor.open_read(rpath)
+        if stream is None:
+            return
+
+        header = stream.read(HEADER_SIZE)
+
+        codec = None
+        if len(header) == HEADER_SIZE and header.startswith(MAGIC):
+            codec = CODECS_BY_ID.get(bytearray(header)[-1])
+
+        if codec:
+            reader = DecompressingReader(stream, codec)
+        else:
+            reader = PrefixedReader(header, stream)
+
+        # skip the data already transferred
+        while offset > 0:
+            chunk = reader.read(min(offset, CHUNK_SIZE))
+            if not chunk:
+                break
+            offset -= len(chunk)
+
+        return reader
+
+    def open_write(self, rpath):
+        writer = self._accessor.open_write(rpath)
+
+        codec = self._get_codec(rpath)
+        if not codec:
+            return writer
+
+        try:
+            return CompressingWriter(writer, codec, self._level)
+        except:
+            writer.abort()
+            raise
+
+    def stat(self, rpath):
+        stat = self._accessor.stat(rpath)
+        if stat is None or not self._get_codec(rpath):
+            return stat
+
+        # neither the size nor the entity tag describe the uncompressed data
+        return AccessorStat(None, stat.mtime, None)
+
+    def get_filesystem_path(self, rpath):
+        # files of the compressed extensions can't be used as they are
+        if not self._get_codec(rpath):
+            return self._accessor.get_filesystem_path(rpath)
+
+    def copy_to(self, target_accessor, src_rpath, dst_rpath):
+        if self._get_codec(src_rpath):
+            return False
+        return self._accessor.copy_to(target_accessor, src_rpath, dst_rpath)
+
+    def copy_from(self, source_accessor, src_rpath, dst_rpath):
+        if self._get_codec(dst_rpath):
+            return False
+        return self._accessor.copy_from(source_accessor, src_rpath, dst_rpath)
+
+
+def register(registry):
+    registry.add_hook("bd.storage.accessor.compressed", CompressedAccessor)
@@ -0,0 +1,315 @@
+import os
+import time
+import errno
+import hashlib
+import logging
+import tempfile
+
+from bd.storage.accessor import (
+    AccessorWrapper,
+    AccessorWriter,
+    AccessorStat,
+    PrefixedReader,
+)
+from bd.storage.transfer import copy_stream
+from bd.storage.utils import putils
+
+log = logging.getLogger(__name__)
+
+# reference files start with the magic bytes followed by
+# the content hash and the size of the data
+MAGIC = b"\x89BDREF\n"
+
+SPOOL_SIZE = 8 * 1024 * 1024
+
+# marker written next to the reused blobs on the accessors
+# which can't update the modification time of the blob itself
+TOUCH_SUFFIX = ".touch"
+
+
+class DedupWriter(AccessorWriter):
+    """Writer hashing the data while spooling it to a temporary file."""
+
+    def __init__(self, accessor, rpath):
+        super(DedupWriter, self).__init__()
+        self._accessor = accessor
+        self._rpath = rpath
+        self._hash = hashlib.sha256()
+        self._size = 0
+        self._file = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+
+    def write(self, data):
+        self._hash.update(data)
+        self._size += len(data)
+        return self._file.write(data)
+
+    def _commit(self):
+        try:
+            self._file.seek(0)
+            self._accessor._store(
+                self._rpath, self._file, self._hash.hexdigest(), self._size
+            )
+        finally:
+            self._file.close()
+
+    def _abort(self):
+        self._file.close()
+
+
+class DedupAccessor(AccessorWrapper):
+    """Accessor storing every unique content only once.
+
+    The data is stored in the blob named after its SHA-256 hash, while
+    the file at the requested rpath only references the blob. Files
+    without the reference header are read as is. Blobs which are not
+    referenced anymore are removed by "collect_garbage". The file system
+    path of the data is the path of its blob, it must only be read.
+
+    Args:
+        accessor (BaseAccessor|dict): wrapped accessor or its configuration.
+        blobs_dir (str): rpath of the directory the blobs are stored in.
+
+    """
+
+    def __init__(self, accessor, blobs_dir=".blobs"):
+        super(DedupAccessor, self).__init__(accessor)
+        self._blobs_dir = blobs_dir.strip("/")
+
+    def _get_blob_rpath(self, content_hash):
+        return "{}/{}/{}/{}".format(
+            self._blobs_dir, content_hash[:2], content_hash[2:4], content_hash
+        )
+
+    def _is_blob_rpath(self, rpath):
+        rpath = rpath.strip("/")
+        return rpath == self._blobs_dir or rpath.startswith(self._blobs_dir + "/")
+
+    def _reuse_blob(self, blob_rpath):
+        """Refresh the modification time of the existing blob, so it's
+        not collected as unreferenced before its new reference is written.
+
+        Returns:
+            bool: True if the blob exists.
+
+        """
+        filename = self._accessor.get_filesystem_path(blob_rpath)
+        if filename:
+            try:
+                os.utime(filename, None)
+            except OSError as e:
+                if e.errno == errno.ENOENT:
+                    return False
+                raise
+            return True
+
+        if not self._accessor.exists(blob_rpath):
+            return False
+
+        self._accessor.write(blob_rpath + TOUCH_SUFFIX, b"")
+
+        # the blob might have been collected in the meantime
+        return self._accessor.exists(blob_rpath)
+
+    @staticmethod
+    def _dump_reference(content_hash, size):
+        return MAGIC + "sha256:{}\n{}\n".format(content_hash, size).encode()
+
+    @staticmethod
+    def _parse_reference(data):
+        if not data.startswith(MAGIC):
+            return
+
+        content_hash, size = data[len(MAGIC) :].decode().split()
+        return content_hash.split(":", 1)[1], int(size)
+
+    def get_reference(self, rpath):
+        """Get content hash and size of the data referenced by the rpath.
+
+        Args:
+            rpath (str): relative path.
+
+        Returns:
+            tuple: hex hash and size or None if the rpath doesn't exist
+                or it's not a reference.
+
+        """
+        stream = self._accessor.open_read(rpath)
+        if stream is None:
+            return
+
+        with stream:
+            header = stream.read(len(MAGIC))
+            if header != MAGIC:
+                return
+
+            return self._parse_reference(header + stream.read())
+
+    def _store(self, rpath, stream, content_hash, size):
+        blob_rpath = self._get_blob_rpath(content_hash)
+
+        if self._reuse_blob(blob_rpath):
+            log.debug('Content of "{}" is already stored'.format(rpath))
+        else:
+            with self._accessor.open_write(blob_rpath) as writer:
+                copy_stream(stream, writer)
+
+        self._accessor.write(rpath, self._dump_reference(content_hash, size))
+
+    def read(self, rpath):
+        stream = self.open_read(rpath)
+        if stream is None:
+            return
+
+        with stream:
+            return stream.read()
+
+    def write(self, rpath, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        content_hash = hashlib.sha256(data).hexdigest()
+        blob_rpath = self._get_blob_rpath(content_hash)
+
+        if not self._reuse_blob(blob_rpath):
+            self._accessor.write(blob_rpath, data)
+
+        self._accessor.write(rpath, self._dump_reference(content_hash, len(data)))
+
+    def open_read(self, rpath, offset=0):
+        stream = self._accessor.open_read(rpath)
+        if stream is None:
+            return
+
+        header = stream.read(len(MAGIC))
+        if header != MAGIC:
+            if not offset:
+                return PrefixedReader(header, stream)
+
+            stream.close()
+            return self._accessor.open_read(rpath, offset)
+
+        with stream:
+            content_hash, _ = self._parse_reference(header + stream.read())
+
+        return self._accessor.open_read(self._get_blob_rpath(content_hash), offset)
+
+    def open_write(self, rpath):
+        return DedupWriter(self, rpath)
+
+    def list(self, rpath, relative=True, recursive=True):
+        paths = []
+        for path in self._accessor.list(rpath, relative, recursive):
+            if relative:
+                path_rpath = putils.join(rpath, path) if rpath else path
+            else:
+                path_rpath = self._accessor.convert_filename_to_rpath(path) or path
+
+            if not self._is_blob_rpath(path_rpath):
+                paths.append(path)
+
+        return paths
+
+    def stat(self, rpath):
+        stat = self._accessor.stat(rpath)
+        if stat is None:
+            return
+
+        reference = self.get_reference(rpath)
+        if reference is None:
+            return stat
+
+        return AccessorStat(reference[1], stat.mtime, None)
+
+    def get_filesystem_path(self, rpath):
+        # the blobs are never modified, so the referenced one
+        # is read in place instead of the reference
+        try:
+            reference = self.get_reference(rpath)
+        except (IOError, OSError):
+            reference = None
+
+        if reference is not None:
+            rpath = self._get_blob_rpath(reference[0])
+        return self._accessor.get_filesystem_path(rpath)
+
+    def copy_to(self, target_accessor, src_rpath, dst_rpath):
+        return False
+
+    def copy_from(self, source_accessor, src_rpath, dst_rpath):
+        return False
+
+    def collect_garbage(self, dry_run=False, grace_period=3600):
+        """Remove blobs which are not referenced by any rpath.
+
+        Args:
+            dry_run (bool): only report the unreferenced blobs.
+            grace_period (int): number of seconds the recently written
+                or reused blobs are kept, because their references might
+                still be being written.
+
+        Returns:
+            list[str]: rpaths of the removed blobs.
+
+        """
+        referenced_hashes = set()
+        for rpath in self._accessor.list("", relative=True, recursive=True):
+            if self._is_blob_rpath(rpath):
+                continue
+
+            reference = self.get_reference(rpath)
+            if reference:
+                referenced_hashes.add(reference[0])
+
+        try:
+            rpaths = set(
+                "{}/{}".format(self._blobs_dir, path)
+                for path in self._accessor.list(
+                    self._blobs_dir, relative=True, recursive=True
+                )
+            )
+        except OSError:
+            rpaths = set()
+
+        removed_rpaths = []
+        min_mtime = time.time() - grace_period
+
+        for blob_rpath in sorted(rpaths):
+            if blob_rpath.endswith(TOUCH_SUFFIX):
+                continue
+
+            content_hash = blob_rpath.rsplit("/", 1)[-1]
+            if content_hash in referenced_hashes:
+                continue
+
+            touch_rpath = blob_rpath + TOUCH_SUFFIX
+            if self._is_recent(blob_rpath, min_mtime) or (
+                touch_rpath in rpaths and self._is_recent(touch_rpath, min_mtime)
+            ):
+                continue
+
+            if not dry_run:
+                self._accessor.rm(blob_rpath)
+                if touch_rpath in rpaths:
+                    self._accessor.rm(touch_rpath)
+
+            removed_rpaths.append(blob_rpath)
+
+        log.info(
+            "{} {} unreferenced blobs".format(
+                "Found" if dry_run else "Removed", len(removed_rpaths)
+            )
+        )
+
+        return removed_rpaths
+
+    def _is_recent(self, rpath, min_mtime):
+        try:
+            stat = self._accessor.stat(rpath)
+        except NotImplementedError:
+            return False
+
+        return bool(stat and stat.mtime and stat.mtime > min_mtime)
+
+
+def register(registry):
+    registry.add_hook("bd.storage.accessor.dedup", DedupAccessor)
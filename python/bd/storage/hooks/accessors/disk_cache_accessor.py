@@ -0,0 +1,419 @@
+import os
+import re
+import json
+import uuid
+import shutil
+import logging
+import hashlib
+import threading
+
+from bd.storage.accessor import (
+    AccessorWrapper,
+    FileSystemAccessor,
+    FileSystemWriter,
+    InvalidatingWriter,
+    get_base_accessor,
+)
+from bd.storage.errors import AccessorCreationError
+from bd.storage.locks import FileLock
+from bd.storage.utils import putils
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".bd_storage", "cache")
+DEFAULT_MAX_SIZE = 10 * 1024**3
+
+CHUNK_SIZE = 1024 * 1024
+
+# eviction removes the least recently used entries until the cache
+# is that much smaller than its maximum size, so it doesn't run
+# after every population of the full cache
+LOW_WATERMARK = 0.9
+
+LOCK_STRIPES = 64
+
+_tmp_file_regex = re.compile(r"__[0-9a-f]{32}$")
+
+# attributes telling apart the storages of the same accessor class
+_identifying_attributes = ("_endpoint_url", "_bucket_name", "_host")
+
+
+class DiskCacheAccessor(AccessorWrapper):
+    """Accessor keeping the data read from the wrapped one on the local disk.
+
+    The cached data is revalidated against the size, the modification
+    time and the entity tag reported by the wrapped accessor, so the
+    cache never returns outdated data when the accessor supports "stat".
+    Entries are populated atomically and the least recently used ones
+    are evicted once the cache exceeds its maximum size. The cache
+    directory can be shared by several processes of the host.
+
+    Args:
+        accessor (BaseAccessor|dict): wrapped accessor or its configuration.
+        cache_dir (str): cache directory, by default a directory under
+            "BD_STORAGE_DISK_CACHE_DIR" or "~/.bd_storage/cache" unique
+            for the wrapped accessor configuration or for its root,
+            endpoint and bucket. It's required for the accessors which
+            have none of them.
+        max_size (int): maximum size of the cached data in bytes.
+        revalidate (bool): check the cached data is still valid
+            on every read.
+
+    """
+
+    def __init__(
+        self, accessor, cache_dir=None, max_size=DEFAULT_MAX_SIZE, revalidate=True
+    ):
+        if cache_dir is None:
+            cache_dir = os.path.join(
+                os.environ.get("BD_STORAGE_DISK_CACHE_DIR", DEFAULT_CACHE_DIR),
+                self._get_namespace(accessor),
+            )
+
+        super(DiskCacheAccessor, self).__init__(accessor)
+
+        self._cache_dir = putils.normpath(cache_dir)
+        self._data_dir = putils.join(self._cache_dir, "data")
+        self._meta_dir = putils.join(self._cache_dir, "meta")
+        self._locks_dir = putils.join(self._cache_dir, "locks")
+        self._max_size = max_size
+        self._revalidate = revalidate
+
+        for dirname in (self._data_dir, self._meta_dir, self._locks_dir):
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname, exist_ok=True)
+
+        self._populated_size = 0
+        self._populated_size_lock = threading.Lock()
+
+    @staticmethod
+    def _get_namespace(accessor):
+        if isinstance(accessor, dict):
+            config = accessor
+        else:
+            base_accessor = get_base_accessor(accessor)
+            config = {
+                key: getattr(base_accessor, key)
+                for key in _identifying_attributes
+                if getattr(base_accessor, key, None)
+            }
+            if accessor.root():
+                config["root"] = accessor.root()
+
+            # the storages would share the cached data
+            if not config:
+                raise AccessorCreationError(
+                    'Unable to tell the storage of accessor "{}" apart, '
+                    'provide "cache_dir"'.format(accessor)
+                )
+
+            config["class"] = "{}.{}".format(
+                type(accessor).__module__, type(accessor).__name__
+            )
+
+        config = json.dumps(config, sort_keys=True, default=str)
+        return hashlib.md5(config.encode("utf-8")).hexdigest()
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    def _get_data_filename(self, rpath):
+        return putils.join(self._data_dir, rpath.lstrip("/"))
+
+    def _get_meta_filename(self, rpath):
+        return putils.join(self._meta_dir, rpath.lstrip("/") + ".json")
+
+    def _get_lock(self, rpath):
+        stripe = int(hashlib.md5(rpath.encode("utf-8")).hexdigest(), 16) % LOCK_STRIPES
+        return FileLock(putils.join(self._locks_dir, "{:02d}.lock".format(stripe)))
+
+    def _stat_source(self, rpath):
+        try:
+            return True, self._accessor.stat(rpath)
+        except NotImplementedError:
+            return False, None
+
+    def _load_entry(self, rpath):
+        try:
+            with open(self._get_meta_filename(rpath), "r") as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+
+    @staticmethod
+    def _is_valid(entry, stat):
+        if entry is None:
+            return False
+
+        if stat is None:
+            return True
+
+        for field in ("size", "mtime", "etag"):
+            value = getattr(stat, field)
+            if value is not None and entry.get(field) != value:
+                return False
+
+        return True
+
+    def _open_cached(self, rpath, offset):
+        try:
+            f = open(self._get_data_filename(rpath), "rb")
+        except (IOError, OSError):
+            return
+
+        # mark the entry as recently used
+        try:
+            os.utime(f.name, None)
+        except OSError:
+            pass
+
+        if offset:
+            f.seek(offset)
+        return f
+
+    def _get_pending_filename(self, rpath):
+        return self._get_meta_filename(rpath) + ".pending"
+
+    def _read_pending(self, rpath):
+        try:
+            with open(self._get_pending_filename(rpath), "r") as f:
+                return f.read()
+        except (IOError, OSError):
+            return
+
+    def _populate(self, rpath, stat, offset=0):
+        """Download the data and add it to the cache.
+
+        The data is downloaded without holding the lock of the entry,
+        so the reads of the other entries of the same lock stripe don't
+        wait for it. The pending token tells if the entry was invalidated
+        or populated by another reader in the meantime, the downloaded
+        data is then returned to this reader only.
+
+        Returns:
+            file: opened data or None if there is no data.
+
+        """
+        token = uuid.uuid4().hex
+        with self._get_lock(rpath):
+            with FileSystemWriter(self._get_pending_filename(rpath)) as writer:
+                writer.write(token.encode("utf-8"))
+
+        stream = self._accessor.open_read(rpath)
+        if stream is None:
+            with self._get_lock(rpath):
+                if self._read_pending(rpath) == token:
+                    self._remove_entry(rpath)
+            return
+
+        data_filename = self._get_data_filename(rpath)
+        tmp_filename = "{}__{}".format(data_filename, uuid.uuid4().hex)
+
+        try:
+            size = 0
+            with stream:
+                with FileSystemWriter(tmp_filename) as writer:
+                    while True:
+                        chunk = stream.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        size += writer.write(chunk)
+
+            entry = {"size": size, "mtime": None, "etag": None}
+            if stat is not None:
+                entry.update(mtime=stat.mtime, etag=stat.etag)
+                if stat.size is not None:
+                    entry["size"] = stat.size
+
+            with self._get_lock(rpath):
+                if self._read_pending(rpath) == token:
+                    # readers treat the data without the entry as invalid,
+                    # so the entry is written only after the data is in place
+                    self._remove_entry(rpath)
+                    os.replace(tmp_filename, data_filename)
+
+                    with FileSystemWriter(self._get_meta_filename(rpath)) as writer:
+                        writer.write(json.dumps(entry).encode("utf-8"))
+
+                    f = self._open_cached(rpath, offset)
+                    if f is not None:
+                        return f
+
+            # the entry was invalidated during the download
+            f = open(tmp_filename, "rb")
+        finally:
+            if os.path.isfile(tmp_filename):
+                try:
+                    os.remove(tmp_filename)
+                except OSError:
+                    pass
+
+        if offset:
+            f.seek(offset)
+        return f
+
+    def _add_populated_size(self, size):
+        with self._populated_size_lock:
+            self._populated_size += size
+            if self._populated_size < self._max_size * (1 - LOW_WATERMARK):
+                return False
+
+            self._populated_size = 0
+            return True
+
+    def _remove_entry(self, rpath):
+        rpath = rpath.strip("/")
+        for filename in (
+            self._get_meta_filename(rpath),
+            self._get_pending_filename(rpath),
+            putils.join(self._meta_dir, rpath),
+            self._get_data_filename(rpath),
+        ):
+            if os.path.isdir(filename):
+                shutil.rmtree(filename, ignore_errors=True)
+            elif os.path.isfile(filename):
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+
+    def invalidate(self, rpath):
+        """Remove the cached data of the rpath or of the directory.
+
+        Args:
+            rpath (str): relative path.
+
+        """
+        with self._get_lock(rpath):
+            self._remove_entry(rpath)
+
+    def evict(self, max_size=None):
+        """Remove the least recently used entries exceeding the size.
+
+        Args:
+            max_size (int): size to shrink the cache to, by default
+                a fraction of the maximum size of the cache.
+
+        Returns:
+            int: number of removed bytes.
+
+        """
+        if max_size is None:
+            max_size = int(self._max_size * LOW_WATERMARK)
+
+        lock = FileLock(putils.join(self._locks_dir, "evict.lock"), blocking=False)
+        if not lock.acquire():
+            # another process is already evicting
+            return 0
+
+        try:
+            entries = []
+            total_size = 0
+            for root, _, filenames in putils.walk(self._data_dir):
+                for filename in filenames:
+                    if _tmp_file_regex.search(filename):
+                        continue
+
+                    path = putils.join(root, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total_size += stat.st_size
+
+            removed_size = 0
+            for _, size, path in sorted(entries):
+                if total_size - removed_size <= max_size:
+                    break
+
+                rpath = path[len(self._data_dir) + 1 :]
+                with self._get_lock(rpath):
+                    self._remove_entry(rpath)
+                removed_size += size
+
+            if removed_size:
+                log.debug(
+                    'Evicted {} bytes from cache "{}"'.format(
+                        removed_size, self._cache_dir
+                    )
+                )
+
+            return removed_size
+        finally:
+            lock.release()
+
+    def read(self, rpath):
+        stream = self.open_read(rpath)
+        if stream is None:
+            return
+
+        with stream:
+            return stream.read()
+
+    def open_read(self, rpath, offset=0):
+        has_stat, stat = False, None
+        if self._revalidate:
+            has_stat, stat = self._stat_source(rpath)
+            if has_stat and stat is None:
+                self.invalidate(rpath)
+                return
+
+        with self._get_lock(rpath):
+            if self._is_valid(self._load_entry(rpath), stat):
+                f = self._open_cached(rpath, offset)
+                if f is not None:
+                    return f
+
+        try:
+            f = self._populate(rpath, stat, offset)
+        except Exception as e:
+            log.warning('Failed to cache "{}". {}'.format(rpath, e))
+            self.invalidate(rpath)
+            return self._accessor.open_read(rpath, offset)
+
+        if f is None:
+            return
+
+        # evicted entries are locked one by one, so it's done
+        # after the lock of this one is released
+        if self._add_populated_size(os.fstat(f.fileno()).st_size):
+            self.evict()
+
+        return f
+
+    def write(self, rpath, data):
+        try:
+            return self._accessor.write(rpath, data)
+        finally:
+            self.invalidate(rpath)
+
+    def open_write(self, rpath):
+        self.invalidate(rpath)
+        return InvalidatingWriter(
+            self._accessor.open_write(rpath), lambda: self.invalidate(rpath)
+        )
+
+    def rm(self, rpath):
+        try:
+            return self._accessor.rm(rpath)
+        finally:
+            self.invalidate(rpath)
+
+    def copy_to(self, target_accessor, src_rpath, dst_rpath):
+        # local targets are populated from the cache by streaming
+        if isinstance(target_accessor, FileSystemAccessor):
+            return False
+        return self._accessor.copy_to(target_accessor, src_rpath, dst_rpath)
+
+    def copy_from(self, source_accessor, src_rpath, dst_rpath):
+        try:
+            return self._accessor.copy_from(source_accessor, src_rpath, dst_rpath)
+        finally:
+            self.invalidate(dst_rpath)
+
+
+def register(registry):
+    registry.add_hook("bd.storage.accessor.disk_cache", DiskCacheAccessor)
@@ -1,6 +1,9 @@
 import sys
+import time
 import uuid
 import ftplib
+import threading
+import calendar
 import logging
 
 try:
@@ -10,13 +13,121 @@ except ImportError:
 
 from six import BytesIO, reraise
 
-from bd.storage.accessor import BaseAccessor, FileSystemAccessor
+from bd.storage.accessor import (
+    BaseAccessor,
+    FileSystemAccessor,
+    AccessorWriter,
+    AccessorStat,
+    FileSystemWriter,
+    group_by_directory,
+)
 from bd.storage.utils import putils
 from bd.storage.errors import *
 
 log = logging.getLogger(__name__)
 
 
+class FTPReader(object):
+    """Stream of the file data received over a dedicated FTP connection."""
+
+    def __init__(self, ftp, rpath, offset=0):
+        self._ftp = ftp
+        self._conn = ftp.transfercmd("RETR {}".format(rpath), rest=offset or None)
+        self._file = self._conn.makefile("rb")
+        self._finished = False
+        self.closed = False
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        if size < 0 or not data:
+            self._finished = True
+        return data
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        try:
+            self._file.close()
+            self._conn.close()
+
+            if self._finished:
+                self._ftp.voidresp()
+            else:
+                self._ftp.abort()
+        except ftplib.all_errors:
+            pass
+        finally:
+            try:
+                self._ftp.quit()
+            except ftplib.all_errors:
+                self._ftp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class FTPWriter(AccessorWriter):
+    """Writer streaming data to a transit file over a dedicated
+    FTP connection. The transit file is renamed to the target on close.
+
+    """
+
+    def __init__(self, accessor, ftp, rpath):
+        super(FTPWriter, self).__init__()
+        self._accessor = accessor
+        self._ftp = ftp
+        self._rpath = rpath
+        self._transit_path = accessor._get_transit_path(rpath)
+        self._conn = ftp.transfercmd("STOR {}".format(self._transit_path))
+
+    def write(self, data):
+        self._conn.sendall(data)
+        return len(data)
+
+    def send_file(self, src_file):
+        """Send the whole file with "sendfile" system call where available."""
+        self._conn.sendfile(src_file)
+
+    def _commit(self):
+        try:
+            self._conn.close()
+            self._ftp.voidresp()
+            self._accessor._finalize_transit_file(
+                self._ftp, self._transit_path, self._rpath
+            )
+        except:
+            exc_info = sys.exc_info()
+            self._abort()
+            reraise(*exc_info)
+        else:
+            self._disconnect()
+
+    def _abort(self):
+        try:
+            self._conn.close()
+            self._ftp.voidresp()
+        except ftplib.all_errors:
+            pass
+
+        try:
+            self._ftp.delete(self._transit_path)
+        except ftplib.all_errors:
+            pass
+        finally:
+            self._disconnect()
+
+    def _disconnect(self):
+        try:
+            self._ftp.quit()
+        except ftplib.all_errors:
+            self._ftp.close()
+
+
 class FTPAccessor(BaseAccessor):
     def __init__(
         self,
@@ -40,22 +151,64 @@ class FTPAccessor(BaseAccessor):
             self._fs_accessor = FileSystemAccessor(root)
 
         self._write_mode = write_mode
-        self._ftp = None
+
+        # ftplib connections can't be shared by the threads,
+        # every thread gets its own control connection
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    @property
+    def _ftp(self):
+        return getattr(self._local, "ftp", None)
+
+    @_ftp.setter
+    def _ftp(self, ftp):
+        self._local.ftp = ftp
+        with self._connections_lock:
+            self._connections.append(ftp)
+
+    def _create_connection(self):
+        ftp = ftplib.FTP()
+        ftp.debug(0)
+        ftp.set_pasv(True)
+        return ftp
+
+    def _login(self, ftp):
+        ftp.connect(self._host, timeout=self._timeout)
+        ftp.login(
+            self._username,
+            self._password,
+        )
 
     def _ensure_connected(self):
         if self._ftp is None:
-            self._ftp = ftplib.FTP()
-            self._ftp.debug(0)
-            self._ftp.set_pasv(True)
+            self._ftp = self._create_connection()
 
         try:
             self._ftp.voidcmd("NOOP")  # check ftp connection
         except:
-            self._ftp.connect(self._host, timeout=self._timeout)
-            self._ftp.login(
-                self._username,
-                self._password,
-            )
+            self._login(self._ftp)
+
+    def _connect(self):
+        """Open a new connection for a single data transfer."""
+        ftp = self._create_connection()
+        self._login(ftp)
+        ftp.voidcmd("TYPE I")
+        return ftp
+
+    def _finalize_transit_file(self, ftp, transit_path, rpath):
+        # set permissions on transit file
+        try:
+            ftp.sendcmd("SITE CHMOD {} {}".format(str(self._write_mode), transit_path))
+        except ftplib.error_perm as e:
+            # CHMODE command is not implemented
+            # if the server is running on windows
+            if str(e)[:3] != "504":
+                raise
+
+        # rename transit path to the final path
+        ftp.rename(transit_path, rpath)
 
     def _get_transit_path(self, target_path):
         return "{}__{}".format("/.".join(putils.split(target_path)), uuid.uuid1().hex)
@@ -107,19 +260,7 @@ class FTPAccessor(BaseAccessor):
             # write to transit file
             self._ftp.storbinary("STOR {}".format(transit_path), data_buffer)
 
-            # set permissions on transit file
-            try:
-                self._ftp.sendcmd(
-                    "SITE CHMOD {} {}".format(str(self._write_mode), transit_path)
-                )
-            except ftplib.error_perm as e:
-                # CHMODE command is not implemented
-                # if the server is running on windows
-                if str(e)[:3] != "504":
-                    raise
-
-            # rename transit path to the final path
-            self._ftp.rename(transit_path, rpath)
+            self._finalize_transit_file(self._ftp, transit_path, rpath)
         finally:
             try:
                 if self.exists(transit_path):
@@ -127,6 +268,97 @@ class FTPAccessor(BaseAccessor):
             except:
                 pass
 
+    def stat(self, rpath):
+        if self._fs_accessor:
+            return self._fs_accessor.stat(rpath)
+
+        self._ensure_connected()
+
+        try:
+            self._ftp.voidcmd("TYPE I")
+            size = self._ftp.size(rpath)
+        except ftplib.error_perm as e:
+            # if file doesn't exist
+            if str(e)[:3] == "550":
+                return
+            raise
+
+        mtime = None
+        try:
+            response = self._ftp.sendcmd("MDTM {}".format(rpath))
+            mtime = calendar.timegm(
+                time.strptime(response.split()[-1][:14], "%Y%m%d%H%M%S")
+            )
+        except (ftplib.error_perm, ValueError):
+            pass
+
+        return AccessorStat(size, mtime, None)
+
+    def open_read(self, rpath, offset=0):
+        if self._fs_accessor:
+            return self._fs_accessor.open_read(rpath, offset)
+
+        ftp = self._connect()
+        try:
+            return FTPReader(ftp, rpath, offset)
+        except ftplib.error_perm as e:
+            ftp.close()
+
+            # if file doesn't exist
+            if str(e)[:3] == "550":
+                return
+
+            raise
+        except:
+            ftp.close()
+            raise
+
+    def open_write(self, rpath):
+        self._ensure_connected()
+
+        parent_dir = putils.dirname(rpath)
+        if not self.exists(parent_dir):
+            self.make_dir(parent_dir, recursive=True)
+
+        ftp = self._connect()
+        try:
+            return FTPWriter(self, ftp, rpath)
+        except:
+            ftp.close()
+            raise
+
+    def copy_to(self, target_accessor, src_rpath, dst_rpath):
+        if self._fs_accessor:
+            return self._fs_accessor.copy_to(target_accessor, src_rpath, dst_rpath)
+
+        if not isinstance(target_accessor, FileSystemAccessor):
+            return False
+
+        ftp = self._connect()
+        try:
+            with FileSystemWriter(target_accessor.resolve(dst_rpath)) as writer:
+                ftp.retrbinary("RETR {}".format(src_rpath), writer.file.write)
+        except ftplib.error_perm as e:
+            # if file doesn't exist
+            if str(e)[:3] == "550":
+                return False
+            raise
+        finally:
+            ftp.close()
+
+        return True
+
+    def copy_from(self, source_accessor, src_rpath, dst_rpath):
+        src_filename = source_accessor.get_filesystem_path(src_rpath)
+        if not src_filename or not putils.isfile(src_filename):
+            return False
+
+        with open(src_filename, "rb") as src_file:
+            with self.open_write(dst_rpath) as writer:
+                writer.send_file(src_file)
+
+        return True
+
     def _is_dir(self, rpath):
         pwd = self._ftp.pwd()
         try:
@@ -256,16 +488,38 @@ class FTPAccessor(BaseAccessor):
 
                 return False
 
+    def exists_many(self, rpaths):
+        if self._fs_accessor:
+            return self._fs_accessor.exists_many(rpaths)
+
+        self._ensure_connected()
+
+        result = {}
+        for dirname, dir_rpaths in group_by_directory(rpaths).items():
+            try:
+                names = set(self._ftp.nlst(dirname))
+            except ftplib.error_perm as e:
+                if str(e)[:3] != "550":
+                    raise
+                names = set()
+
+            # servers return either the names or the paths of the entries
+            for rpath in dir_rpaths:
+                result[rpath] = rpath in names or putils.basename(rpath) in names
+
+        return result
+
     def get_filesystem_path(self, rpath):
         return (
             self._fs_accessor.get_filesystem_path(rpath) if self._fs_accessor else None
         )
 
     def __del__(self):
-        try:
-            self._ftp.close()
-        except:
-            pass
+        for ftp in self._connections:
+            try:
+                ftp.close()
+            except:
+                pass
 
 
 def register(registry):
@@ -0,0 +1,197 @@
+import logging
+import threading
+
+from cachetools import TTLCache
+
+from bd.storage.accessor import AccessorWrapper, InvalidatingWriter
+from bd.storage.cache import CacheStats
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TTL = 30.0
+DEFAULT_MAXSIZE = 10000
+
+
+class ListingCacheAccessor(AccessorWrapper):
+    """Accessor caching the existence, stat and listing results.
+
+    The results expire after "ttl" seconds, which bounds how stale
+    they can be when the data is changed by other processes. The
+    changes made through this accessor invalidate them immediately.
+
+    Args:
+        accessor (BaseAccessor|dict): wrapped accessor or its configuration.
+        ttl (float): number of seconds the results are valid for.
+        maxsize (int): maximum number of cached results of each kind.
+
+    """
+
+    _kinds = ("exists", "stat", "list")
+
+    def __init__(self, accessor, ttl=DEFAULT_TTL, maxsize=DEFAULT_MAXSIZE):
+        super(ListingCacheAccessor, self).__init__(accessor)
+
+        self._caches = {
+            kind: TTLCache(maxsize=maxsize, ttl=ttl) for kind in self._kinds
+        }
+        self._hits = dict.fromkeys(self._kinds, 0)
+        self._misses = dict.fromkeys(self._kinds, 0)
+        self._lock = threading.RLock()
+        # incremented by every invalidation, so the results computed
+        # before it aren't cached after it
+        self._generation = 0
+
+    def _get(self, kind, key):
+        with self._lock:
+            try:
+                value = self._caches[kind][key]
+            except KeyError:
+                self._misses[kind] += 1
+                raise
+
+            self._hits[kind] += 1
+            return value
+
+    def _set(self, kind, key, value, generation):
+        with self._lock:
+            if generation == self._generation:
+                self._caches[kind][key] = value
+
+    def _cached(self, kind, key, func, *args):
+        with self._lock:
+            generation = self._generation
+            try:
+                return self._get(kind, key)
+            except KeyError:
+                pass
+
+        value = func(*args)
+        self._set(kind, key, value, generation)
+        return value
+
+    def invalidate(self, rpath=None, recursive=True):
+        """Drop the cached results affected by the change of the rpath.
+
+        Args:
+            rpath (str): changed relative path, everything
+                is dropped if not provided.
+            recursive (bool): drop the results of the paths
+                under the rpath as well.
+
+        """
+        with self._lock:
+            self._generation += 1
+
+            if rpath is None:
+                for cache in self._caches.values():
+                    cache.clear()
+                return
+
+            rpath = rpath.rstrip("/")
+            prefix = rpath + "/"
+
+            # the rpath itself and, if it's a directory, its content
+            for kind in ("exists", "stat"):
+                cache = self._caches[kind]
+                cache.pop(rpath, None)
+                if recursive:
+                    for key in list(cache.keys()):
+                        if key.startswith(prefix):
+                            cache.pop(key, None)
+
+            # listings of the directory and of its parents
+            cache = self._caches["list"]
+            for key in list(cache.keys()):
+                dirname = key[0].rstrip("/")
+                if (
+                    not dirname
+                    or dirname == rpath
+                    or rpath.startswith(dirname + "/")
+                    or dirname.startswith(prefix)
+                ):
+                    cache.pop(key, None)
+
+    def get_stats(self):
+        """Get the hit statistics of the cache.
+
+        Returns:
+            dict: CacheStats by kind ("exists", "stat" and "list").
+
+        """
+        with self._lock:
+            return {
+                kind: CacheStats(
+                    self._hits[kind], self._misses[kind], len(self._caches[kind])
+                )
+                for kind in self._kinds
+            }
+
+    def exists(self, rpath):
+        return self._cached("exists", rpath, self._accessor.exists, rpath)
+
+    def exists_many(self, rpaths):
+        result = {}
+        missing = []
+        with self._lock:
+            generation = self._generation
+            for rpath in rpaths:
+                try:
+                    result[rpath] = self._get("exists", rpath)
+                except KeyError:
+                    missing.append(rpath)
+
+        if missing:
+            flags = self._accessor.exists_many(missing)
+            for rpath in missing:
+                self._set("exists", rpath, flags[rpath], generation)
+            result.update(flags)
+
+        return result
+
+    def stat(self, rpath):
+        return self._cached("stat", rpath, self._accessor.stat, rpath)
+
+    def list(self, rpath, relative=True, recursive=True):
+        paths = self._cached(
+            "list",
+            (rpath, relative, recursive),
+            self._accessor.list,
+            rpath,
+            relative,
+            recursive,
+        )
+        return list(paths)
+
+    def write(self, rpath, data):
+        try:
+            return self._accessor.write(rpath, data)
+        finally:
+            self.invalidate(rpath, recursive=False)
+
+    def open_write(self, rpath):
+        return InvalidatingWriter(
+            self._accessor.open_write(rpath),
+            lambda: self.invalidate(rpath, recursive=False),
+        )
+
+    def make_dir(self, rpath, recursive=False):
+        try:
+            return self._accessor.make_dir(rpath, recursive)
+        finally:
+            self.invalidate(rpath)
+
+    def rm(self, rpath):
+        try:
+            return self._accessor.rm(rpath)
+        finally:
+            self.invalidate(rpath)
+
+    def copy_from(self, source_accessor, src_rpath, dst_rpath):
+        try:
+            return self._accessor.copy_from(source_accessor, src_rpath, dst_rpath)
+        finally:
+            self.invalidate(dst_rpath, recursive=False)
+
+
+def register(registry):
+    registry.add_hook("bd.storage.accessor.listing_cache", ListingCacheAccessor)
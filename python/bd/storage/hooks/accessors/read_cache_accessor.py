@@ -0,0 +1,108 @@
+from bd.storage.accessor import AccessorWrapper, InvalidatingWriter
+from bd.storage.bundle import is_metadata_index
+from bd.storage.cache import (
+    BytesCache,
+    get_read_cache,
+    DEFAULT_MAX_SIZE,
+    DEFAULT_MAX_ITEM_SIZE,
+    DEFAULT_TTL,
+)
+
+
+class ReadCacheAccessor(AccessorWrapper):
+    """Accessor keeping the data of the small files in memory.
+
+    The data is read through the shared read cache unless any of its
+    limits is configured. The changes made through this accessor
+    invalidate it immediately, the changes made by other processes are
+    visible after "ttl" seconds. The metadata indices are never cached,
+    as they are modified by reading them first.
+
+    Args:
+        accessor (BaseAccessor|dict): wrapped accessor or its configuration.
+        max_size (int): maximum total size of the cached data in bytes.
+        max_item_size (int): maximum size of a cached file in bytes.
+        ttl (float): number of seconds the data is valid for.
+
+    """
+
+    def __init__(self, accessor, max_size=None, max_item_size=None, ttl=None):
+        super(ReadCacheAccessor, self).__init__(accessor)
+
+        if max_size is None and max_item_size is None and ttl is None:
+            self._cache = get_read_cache()
+        else:
+            self._cache = BytesCache(
+                DEFAULT_MAX_SIZE if max_size is None else max_size,
+                DEFAULT_MAX_ITEM_SIZE if max_item_size is None else max_item_size,
+                DEFAULT_TTL if ttl is None else ttl,
+            )
+
+    def invalidate(self, rpath=None, recursive=True):
+        """Drop the cached data affected by the change of the rpath.
+
+        Args:
+            rpath (str): changed relative path, all the data
+                is dropped if not provided.
+            recursive (bool): drop the data of the paths
+                under the rpath as well.
+
+        """
+        self._cache.invalidate(self._accessor, rpath, recursive)
+
+    def get_stats(self):
+        """Get the hit statistics of the cache.
+
+        Returns:
+            CacheStats: number of hits, misses and cached bytes.
+
+        """
+        return self._cache.get_stats()
+
+    def read(self, rpath):
+        if is_metadata_index(rpath):
+            return self._accessor.read(rpath)
+
+        return self._cache.read(self._accessor, rpath)
+
+    def write(self, rpath, data):
+        try:
+            return self._accessor.write(rpath, data)
+        finally:
+            # invalidated after the write, so the concurrent reads
+            # don't cache the replaced data again
+            self.invalidate(rpath, recursive=False)
+
+    def create(self, rpath, data):
+        try:
+            return self._accessor.create(rpath, data)
+        finally:
+            self.invalidate(rpath, recursive=False)
+
+    def open_write(self, rpath):
+        return InvalidatingWriter(
+            self._accessor.open_write(rpath),
+            lambda: self.invalidate(rpath, recursive=False),
+        )
+
+    def make_dir(self, rpath, recursive=False):
+        try:
+            return self._accessor.make_dir(rpath, recursive)
+        finally:
+            self.invalidate(rpath)
+
+    def rm(self, rpath):
+        try:
+            return self._accessor.rm(rpath)
+        finally:
+            self.invalidate(rpath)
+
+    def copy_from(self, source_accessor, src_rpath, dst_rpath):
+        try:
+            return self._accessor.copy_from(source_accessor, src_rpath, dst_rpath)
+        finally:
+            self.invalidate(dst_rpath, recursive=False)
+
+
+def register(registry):
+    registry.add_hook("bd.storage.accessor.read_cache", ReadCacheAccessor)
@@ -1,15 +1,25 @@
+import os
+import calendar
+import threading
 import warnings
 import logging
 
 from six import BytesIO
 
-from bd.storage.accessor import BaseAccessor
+from bd.storage.accessor import (
+    BaseAccessor,
+    AccessorWriter,
+    AccessorStat,
+    FileSystemAccessor,
+    FileSystemWriter,
+    group_by_directory,
+)
 
 _is_boto3_found = True
 try:
     import boto3
     from botocore.client import Config
-    from botocore.exceptions import ClientError
+    from botocore.exceptions import ClientError, ParamValidationError
 except ModuleNotFoundError:
     _is_boto3_found = False
 
@@ -17,24 +27,134 @@ except ModuleNotFoundError:
 log = logging.getLogger(__name__)
 
 
+# minimal size of a multipart upload part allowed by S3
+MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+
+# number of keys of one prefix worth listing instead of checking them one by one
+MIN_LISTED_KEYS = 4
+
+
+class S3Reader(object):
+    """Stream of the object data returned by the GetObject request."""
+
+    def __init__(self, body):
+        self._body = body
+        self.closed = False
+
+    def read(self, size=-1):
+        return self._body.read(None if size is None or size < 0 else size)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._body.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class S3Writer(AccessorWriter):
+    """Writer uploading data in parts of a multipart upload.
+
+    Small objects which fit into a single part are uploaded
+    with one PutObject request on close.
+
+    """
+
+    def __init__(self, bucket, rpath, chunk_size=MULTIPART_CHUNK_SIZE):
+        super(S3Writer, self).__init__()
+        self._bucket = bucket
+        self._client = bucket.meta.client
+        self._rpath = rpath
+        self._chunk_size = chunk_size
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+
+    def write(self, data):
+        self._buffer.extend(data)
+        while len(self._buffer) >= self._chunk_size:
+            self._upload_part(bytes(self._buffer[: self._chunk_size]))
+            del self._buffer[: self._chunk_size]
+        return len(data)
+
+    def _upload_part(self, data):
+        if self._upload_id is None:
+            self._upload_id = self._client.create_multipart_upload(
+                Bucket=self._bucket.name, Key=self._rpath
+            )["UploadId"]
+
+        part_number = len(self._parts) + 1
+        response = self._client.upload_part(
+            Bucket=self._bucket.name,
+            Key=self._rpath,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        self._parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+    def _commit(self):
+        if self._upload_id is None:
+            self._bucket.put_object(Key=self._rpath, Body=bytes(self._buffer))
+            return
+
+        try:
+            if self._buffer:
+                self._upload_part(bytes(self._buffer))
+
+            self._client.complete_multipart_upload(
+                Bucket=self._bucket.name,
+                Key=self._rpath,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": self._parts},
+            )
+        except:
+            self._abort()
+            raise
+
+    def _abort(self):
+        if self._upload_id is not None:
+            self._client.abort_multipart_upload(
+                Bucket=self._bucket.name, Key=self._rpath, UploadId=self._upload_id
+            )
+
+
 class S3Accessor(BaseAccessor):
     def __init__(
         self, endpoint_url=None, bucket=None, access_key_id=None, secret_access_key=None
     ):
         super(S3Accessor, self).__init__()
 
-        with warnings.catch_warnings(record=True):
-            warnings.filterwarnings("ignore")
+        self._endpoint_url = endpoint_url
+        self._bucket_name = bucket
+        self._access_key_id = access_key_id
+        self._secret_access_key = secret_access_key
 
-            self._s3 = boto3.resource(
-                "s3",
-                endpoint_url=endpoint_url,
-                aws_access_key_id=access_key_id,
-                aws_secret_access_key=secret_access_key,
-                config=Config(signature_version="s3v4"),
-            )
+        # boto3 resources can't be shared by the threads,
+        # every thread gets its own session
+        self._local = threading.local()
 
-        self._bucket = self._s3.Bucket(bucket)
+    @property
+    def _bucket(self):
+        bucket = getattr(self._local, "bucket", None)
+        if bucket is None:
+            with warnings.catch_warnings(record=True):
+                warnings.filterwarnings("ignore")
+
+                s3 = boto3.session.Session().resource(
+                    "s3",
+                    endpoint_url=self._endpoint_url,
+                    aws_access_key_id=self._access_key_id,
+                    aws_secret_access_key=self._secret_access_key,
+                    config=Config(signature_version="s3v4"),
+                )
+
+            bucket = self._local.bucket = s3.Bucket(self._bucket_name)
+        return bucket
 
     def read(self, rpath):
         data_buffer = BytesIO()
@@ -50,8 +170,85 @@ class S3Accessor(BaseAccessor):
         data_buffer = BytesIO(data)
         self._bucket.put_object(Key=rpath, Body=data_buffer)
 
+    def create(self, rpath, data):
+        try:
+            self._bucket.put_object(Key=rpath, Body=BytesIO(data), IfNoneMatch="*")
+        except ParamValidationError:
+            # botocore released before the conditional writes
+            raise NotImplementedError()
+        except ClientError as e:
+            if e.response["Error"]["Code"] in (
+                "PreconditionFailed",
+                "ConditionalRequestConflict",
+            ):
+                return False
+            raise
+        return True
+
+    def stat(self, rpath):
+        obj = self._bucket.Object(rpath)
+        try:
+            obj.load()
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return
+            raise
+
+        return AccessorStat(
+            obj.content_length,
+            calendar.timegm(obj.last_modified.utctimetuple()),
+            obj.e_tag,
+        )
+
+    def open_read(self, rpath, offset=0):
+        kwargs = {"Range": "bytes={}-".format(offset)} if offset else {}
+        try:
+            response = self._bucket.Object(rpath).get(**kwargs)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return
+            raise
+
+        return S3Reader(response["Body"])
+
+    def open_write(self, rpath):
+        return S3Writer(self._bucket, rpath)
+
+    def copy_to(self, target_accessor, src_rpath, dst_rpath):
+        try:
+            if isinstance(target_accessor, S3Accessor):
+                if target_accessor._endpoint_url != self._endpoint_url:
+                    return False
+
+                # server-side copy, multipart for large objects
+                target_accessor._bucket.copy(
+                    {"Bucket": self._bucket.name, "Key": src_rpath}, dst_rpath
+                )
+                return True
+
+            if isinstance(target_accessor, FileSystemAccessor):
+                with FileSystemWriter(target_accessor.resolve(dst_rpath)) as writer:
+                    self._bucket.download_fileobj(src_rpath, writer.file)
+                return True
+
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return False
+            raise
+
+        return False
+
+    def copy_from(self, source_accessor, src_rpath, dst_rpath):
+        src_filename = source_accessor.get_filesystem_path(src_rpath)
+        if not src_filename or not os.path.isfile(src_filename):
+            return False
+
+        # multipart upload directly from the file
+        self._bucket.upload_file(src_filename, dst_rpath)
+        return True
+
     def list(self, rpath, relative=True, recursive=True):
-        if not rpath.endswith("/"):
+        if rpath and not rpath.endswith("/"):
             rpath += "/"
 
         start_index = len(rpath)
@@ -97,6 +294,34 @@ class S3Accessor(BaseAccessor):
         else:
             return True
 
+    def exists_many(self, rpaths):
+        result = {}
+        for dirname, dir_rpaths in group_by_directory(rpaths).items():
+            # a few HEAD requests are cheaper than listing a large prefix
+            if len(dir_rpaths) < MIN_LISTED_KEYS:
+                for rpath in dir_rpaths:
+                    result[rpath] = self.exists(rpath)
+                continue
+
+            prefix = dirname + "/" if dirname else ""
+            paginator = self._bucket.meta.client.get_paginator("list_objects_v2")
+
+            keys = set()
+            for page in paginator.paginate(
+                Bucket=self._bucket.name, Delimiter="/", Prefix=prefix
+            ):
+                keys.update(entry["Key"] for entry in page.get("Contents", []))
+                # the nested "directories" exist as well
+                keys.update(
+                    entry["Prefix"].rstrip("/")
+                    for entry in page.get("CommonPrefixes", [])
+                )
+
+            for rpath in dir_rpaths:
+                result[rpath] = rpath in keys
+
+        return result
+
     def get_filesystem_path(self, rpath):
         return
 
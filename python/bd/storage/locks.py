@@ -0,0 +1,183 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+DEFAULT_LOCK_TIMEOUT = 30.0
+
+# the lock objects of the crashed owners are broken after this time,
+# it's much longer than any operation holding them
+STALE_LOCK_TIMEOUT = 120.0
+
+LOCK_POLL_INTERVAL = 0.05
+
+
+class FileLock(object):
+    """Lock shared by the processes of the host, no-op without fcntl."""
+
+    def __init__(self, filename, blocking=True):
+        self._filename = filename
+        self._blocking = blocking
+        self._file = None
+        self._thread_lock = get_thread_lock(filename)
+
+    def acquire(self):
+        if not self._thread_lock.acquire(self._blocking):
+            return False
+
+        if fcntl is None:
+            return True
+
+        try:
+            self._file = open(self._filename, "a")
+            flags = fcntl.LOCK_EX if self._blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            fcntl.flock(self._file.fileno(), flags)
+        except (IOError, OSError):
+            if self._file:
+                self._file.close()
+                self._file = None
+            self._thread_lock.release()
+
+            if self._blocking:
+                raise
+            return False
+
+        return True
+
+    def release(self):
+        if self._file:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+_thread_locks = {}
+_thread_locks_lock = threading.Lock()
+
+
+def get_thread_lock(key):
+    """Get the lock of the process shared by all the users of the key.
+
+    flock doesn't exclude the threads of the same process,
+    so the file locks are combined with these.
+
+    Args:
+        key (str): lock name, usually a file path.
+
+    Returns:
+        threading.Lock: lock.
+
+    """
+    with _thread_locks_lock:
+        return _thread_locks.setdefault(key, threading.Lock())
+
+
+class AccessorLock(object):
+    """Lock shared by the hosts, an object created exclusively on the storage.
+
+    Args:
+        accessor (BaseAccessor): accessor of the storage.
+        rpath (str): relative path of the lock object.
+        timeout (float): maximum number of seconds to wait for the lock.
+        stale_timeout (float): age in seconds the lock object of another
+            owner is considered abandoned at.
+
+    """
+
+    def __init__(
+        self,
+        accessor,
+        rpath,
+        timeout=DEFAULT_LOCK_TIMEOUT,
+        stale_timeout=STALE_LOCK_TIMEOUT,
+    ):
+        self._accessor = accessor
+        self._rpath = rpath
+        self._timeout = timeout
+        self._stale_timeout = stale_timeout
+        self._owner = None
+        self._acquired_time = None
+
+    @property
+    def expired(self):
+        """bool: the lock is held long enough to be broken by the others."""
+        return (
+            self._owner is not None
+            and time.time() - self._acquired_time > self._stale_timeout
+        )
+
+    def acquire(self):
+        """Wait for the lock.
+
+        Returns:
+            bool: False if the lock wasn't released in time.
+
+        Raises:
+            NotImplementedError: if the accessor can't create
+                the objects exclusively.
+
+        """
+        owner = "{}:{}:{}".format(socket.gethostname(), os.getpid(), uuid.uuid4().hex)
+        deadline = time.time() + self._timeout
+
+        while True:
+            if self._accessor.create(self._rpath, owner.encode("utf-8")):
+                self._owner = owner
+                self._acquired_time = time.time()
+                return True
+
+            self._break_stale()
+
+            if time.time() >= deadline:
+                return False
+            time.sleep(LOCK_POLL_INTERVAL)
+
+    def _break_stale(self):
+        # the owner is read before the age, so the age of a lock taken
+        # over in the meantime is the age of the new one
+        owner = self._accessor.read(self._rpath)
+        stat = self._accessor.stat(self._rpath)
+        if owner is None or stat is None or stat.mtime is None:
+            return
+
+        if time.time() - stat.mtime <= self._stale_timeout:
+            return
+
+        # another owner could have broken and taken the lock since
+        if self._accessor.read(self._rpath) != owner:
+            return
+
+        log.warning(
+            'Breaking stale lock "{}" of "{}"'.format(
+                self._rpath, owner.decode("utf-8", "replace")
+            )
+        )
+        self._accessor.rm(self._rpath)
+
+    def release(self):
+        if self._owner is None:
+            return
+
+        # the expired lock could have been broken and taken by another owner
+        if not self.expired or (
+            self._accessor.read(self._rpath) == self._owner.encode("utf-8")
+        ):
+            self._accessor.rm(self._rpath)
+        self._owner = None
@@ -0,0 +1,724 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import sqlite3
+import threading
+from contextlib import closing
+
+from .enums import ReplicationStatus, TransferPriority
+from .utils import is_network_path
+
+log = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".bd_storage")
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_RETRY_DELAY = 5.0
+
+# running jobs are abandoned by a dead process when they
+# weren't touched for several heartbeat intervals
+HEARTBEAT_INTERVAL = 30.0
+STALE_HEARTBEATS = 4
+
+# how often the heartbeat checks if the main thread exited
+EXIT_CHECK_INTERVAL = 0.5
+
+
+def get_default_journal_filename(project):
+    """Get the journal file of the project.
+
+    The directory can be configured with the
+    "BD_STORAGE_REPLICATION_JOURNAL_DIR" environment variable.
+
+    Args:
+        project (str): project name.
+
+    Returns:
+        str: journal file path.
+
+    """
+    journal_dir = os.environ.get(
+        "BD_STORAGE_REPLICATION_JOURNAL_DIR", DEFAULT_JOURNAL_DIR
+    )
+    return os.path.join(journal_dir, "replication_{}.db".format(project))
+
+
+class ReplicationJob(object):
+    def __init__(
+        self,
+        id,
+        identifier,
+        storage,
+        with_metadata,
+        status,
+        attempts=0,
+        error=None,
+        force=False,
+    ):
+        self.id = id
+        self.identifier = identifier
+        self.storage = storage
+        self.with_metadata = with_metadata
+        self.status = status
+        self.attempts = attempts
+        self.error = error
+        self.force = force
+
+    @property
+    def pending(self):
+        return self.status in (ReplicationStatus.PENDING, ReplicationStatus.RUNNING)
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return "ReplicationJob(id={}, storage='{}', status='{}', attempts={})".format(
+            self.id, self.storage, self.status, self.attempts
+        )
+
+
+class ReplicationJournal(object):
+    """SQLite journal of the replication jobs.
+
+    Every operation commits its own transaction, so the journal
+    can be shared by threads and processes and survives crashes.
+    It's meant to be local, on a network share it's slower and
+    relies on the file locking of the share.
+
+    Args:
+        filename (str): database file path.
+
+    """
+
+    _columns = "id, identifier, storage, with_metadata, status, attempts, error, force"
+
+    def __init__(self, filename):
+        self._filename = filename
+
+        dirname = os.path.dirname(filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        # the write-ahead log needs the memory shared by the processes
+        # of one host, it corrupts the databases on the network shares
+        self._journal_mode = "DELETE" if is_network_path(filename) else "WAL"
+
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS jobs ("
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                    "identifier TEXT NOT NULL, "
+                    "storage TEXT NOT NULL, "
+                    "with_metadata INTEGER NOT NULL, "
+                    "status TEXT NOT NULL, "
+                    "attempts INTEGER NOT NULL DEFAULT 0, "
+                    "error TEXT, "
+                    "force INTEGER NOT NULL DEFAULT 0, "
+                    "owner TEXT, "
+                    "next_attempt REAL NOT NULL, "
+                    "updated REAL NOT NULL)"
+                )
+                # journals created before the forced replications
+                columns = [
+                    row[1] for row in connection.execute("PRAGMA table_info(jobs)")
+                ]
+                if "force" not in columns:
+                    connection.execute(
+                        "ALTER TABLE jobs ADD COLUMN force INTEGER NOT NULL DEFAULT 0"
+                    )
+
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS jobs_status "
+                    "ON jobs (status, next_attempt)"
+                )
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS jobs_identifier ON jobs (identifier)"
+                )
+
+    @property
+    def filename(self):
+        return self._filename
+
+    def _connect(self):
+        connection = sqlite3.connect(self._filename, timeout=30.0, isolation_level=None)
+        connection.execute("PRAGMA journal_mode={}".format(self._journal_mode))
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _execute(self, query, params=()):
+        with closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = connection.execute(query, params)
+                result = cursor.lastrowid, cursor.rowcount
+            except:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+            return result
+
+    def add(self, identifier, storage, with_metadata=False, force=False):
+        """Add a pending job.
+
+        Args:
+            identifier (str): encoded identifier of the item.
+            storage (str): name of the storage to replicate from.
+            with_metadata (bool): replicate metadata as well.
+            force (bool): overwrite the existing upstream items.
+
+        Returns:
+            ReplicationJob: added job.
+
+        """
+        now = time.time()
+        job_id, _ = self._execute(
+            "INSERT INTO jobs (identifier, storage, with_metadata, force, status, "
+            "next_attempt, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                identifier,
+                storage,
+                int(with_metadata),
+                int(force),
+                ReplicationStatus.PENDING,
+                now,
+                now,
+            ),
+        )
+        return ReplicationJob(
+            job_id,
+            identifier,
+            storage,
+            with_metadata,
+            ReplicationStatus.PENDING,
+            force=force,
+        )
+
+    def claim(self, owner):
+        """Mark the next due pending job as running.
+
+        Args:
+            owner (str): identifier of the claiming queue.
+
+        Returns:
+            ReplicationJob: claimed job or None if there are no due jobs.
+
+        """
+        now = time.time()
+        with closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute(
+                    "SELECT {} FROM jobs WHERE status = ? AND next_attempt <= ? "
+                    "ORDER BY next_attempt, id LIMIT 1".format(self._columns),
+                    (ReplicationStatus.PENDING, now),
+                ).fetchone()
+
+                if row:
+                    connection.execute(
+                        "UPDATE jobs SET status = ?, owner = ?, updated = ? "
+                        "WHERE id = ?",
+                        (ReplicationStatus.RUNNING, owner, now, row[0]),
+                    )
+            except:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+        if row:
+            job = self._create_job(row)
+            job.status = ReplicationStatus.RUNNING
+            return job
+
+    def get_next_attempt_time(self):
+        """Get the time the earliest pending job is due.
+
+        Returns:
+            float: timestamp or None if there are no pending jobs.
+
+        """
+        with closing(self._connect()) as connection:
+            return connection.execute(
+                "SELECT MIN(next_attempt) FROM jobs WHERE status = ?",
+                (ReplicationStatus.PENDING,),
+            ).fetchone()[0]
+
+    def complete(self, job):
+        self._execute("DELETE FROM jobs WHERE id = ?", (job.id,))
+
+    def fail(self, job, error, retry_at=None):
+        """Record a failed attempt of the job.
+
+        Args:
+            job (ReplicationJob): failed job.
+            error (str): error message.
+            retry_at (float): time of the next attempt, the job
+                fails permanently if not provided.
+
+        """
+        job.attempts += 1
+        job.error = error
+        job.status = ReplicationStatus.PENDING if retry_at else ReplicationStatus.FAILED
+        self._execute(
+            "UPDATE jobs SET status = ?, attempts = ?, error = ?, owner = NULL, "
+            "next_attempt = ?, updated = ? WHERE id = ?",
+            (
+                job.status,
+                job.attempts,
+                error,
+                retry_at or time.time(),
+                time.time(),
+                job.id,
+            ),
+        )
+
+    def touch(self, owner):
+        """Refresh the running jobs of the owner."""
+        self._execute(
+            "UPDATE jobs SET updated = ? WHERE status = ? AND owner = ?",
+            (time.time(), ReplicationStatus.RUNNING, owner),
+        )
+
+    def reclaim(self, stale_before):
+        """Return the abandoned running jobs to the pending ones.
+
+        Args:
+            stale_before (float): jobs not refreshed since then
+                are considered abandoned.
+
+        Returns:
+            int: number of reclaimed jobs.
+
+        """
+        _, count = self._execute(
+            "UPDATE jobs SET status = ?, owner = NULL "
+            "WHERE status = ? AND updated < ?",
+            (ReplicationStatus.PENDING, ReplicationStatus.RUNNING, stale_before),
+        )
+        return count
+
+    def retry_failed(self, identifier=None):
+        """Return the failed jobs to the pending ones.
+
+        Args:
+            identifier (str): encoded identifier to retry jobs of.
+
+        Returns:
+            int: number of jobs to retry.
+
+        """
+        query = (
+            "UPDATE jobs SET status = ?, attempts = 0, next_attempt = ? "
+            "WHERE status = ?"
+        )
+        params = [ReplicationStatus.PENDING, time.time(), ReplicationStatus.FAILED]
+        if identifier:
+            query += " AND identifier = ?"
+            params.append(identifier)
+
+        _, count = self._execute(query, params)
+        return count
+
+    def get_jobs(self, identifier=None, statuses=None):
+        """Get the jobs of the journal.
+
+        Args:
+            identifier (str): encoded identifier to get jobs of.
+            statuses (list): statuses to filter the jobs by.
+
+        Returns:
+            list[ReplicationJob]: jobs in the order they were added.
+
+        """
+        conditions = []
+        params = []
+        if identifier:
+            conditions.append("identifier = ?")
+            params.append(identifier)
+
+        if statuses:
+            conditions.append("status IN ({})".format(", ".join("?" * len(statuses))))
+            params.extend(statuses)
+
+        query = "SELECT {} FROM jobs".format(self._columns)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+
+        with closing(self._connect()) as connection:
+            return [
+                self._create_job(row)
+                for row in connection.execute(query + " ORDER BY id", params)
+            ]
+
+    @staticmethod
+    def _create_job(row):
+        (
+            job_id,
+            identifier,
+            storage,
+            with_metadata,
+            status,
+            attempts,
+            error,
+            force,
+        ) = row
+        return ReplicationJob(
+            job_id,
+            identifier,
+            storage,
+            bool(with_metadata),
+            status,
+            attempts,
+            error,
+            bool(force),
+        )
+
+
+class ReplicationQueue(object):
+    """Queue replicating written items to the upstream storages.
+
+    The jobs are journaled before the write returns and are drained
+    by a pool of background workers, retrying failed attempts with an
+    exponential backoff. Once the main thread exits, the workers finish
+    the due jobs and stop, the jobs waiting for a retry stay in the
+    journal. Jobs left behind by a process are picked up once "resume"
+    is called by a queue using the same journal.
+
+    Args:
+        pool (StoragePool): pool to resolve the items with.
+        journal (ReplicationJournal|str): journal or its file path.
+        max_workers (int): number of background workers.
+        max_retries (int): number of attempts before the job fails.
+        retry_delay (float): delay before the first retry in seconds.
+
+    """
+
+    def __init__(
+        self,
+        pool,
+        journal=None,
+        max_workers=DEFAULT_MAX_WORKERS,
+        max_retries=DEFAULT_MAX_RETRIES,
+        retry_delay=DEFAULT_RETRY_DELAY,
+    ):
+        if journal is None:
+            journal = get_default_journal_filename(pool.project)
+
+        if not isinstance(journal, ReplicationJournal):
+            journal = ReplicationJournal(journal)
+
+        self._pool = pool
+        self._journal = journal
+        self._max_workers = max_workers
+        self._max_retries = max_retries
+        self._retry_delay = retry_delay
+
+        self._owner = "{}:{}:{}".format(socket.gethostname(), os.getpid(), uuid.uuid4())
+        self._condition = threading.Condition()
+        self._threads = []
+        self._stopped = True
+        # set once the main thread exited, the idle workers stop then
+        self._draining = False
+        self._active_workers = 0
+
+    @property
+    def journal(self):
+        return self._journal
+
+    @property
+    def running(self):
+        return not self._stopped
+
+    def start(self):
+        """Start the background workers."""
+        with self._condition:
+            if not self._stopped:
+                return
+            self._stopped = False
+            self._draining = False
+            self._active_workers = self._max_workers
+
+        self._reclaim()
+
+        self._threads = [
+            threading.Thread(
+                target=self._heartbeat, name="bd.storage.replication.heartbeat"
+            )
+        ] + [
+            threading.Thread(
+                target=self._work, name="bd.storage.replication_{}".format(i)
+            )
+            for i in range(self._max_workers)
+        ]
+
+        # not daemonic, so the process doesn't exit in the middle of a job
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, wait=True):
+        """Stop the background workers.
+
+        The jobs which are not finished stay in the journal.
+
+        Args:
+            wait (bool): wait for the running jobs to finish.
+
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+        self._threads = []
+
+    def submit(self, item, with_metadata=False, force=False):
+        """Queue the replication of the item to its next items.
+
+        Args:
+            item (StorageItem): item which data was written.
+            with_metadata (bool): replicate metadata as well.
+            force (bool): overwrite the existing next items.
+
+        Returns:
+            ReplicationJob: queued job.
+
+        """
+        job = self._journal.add(
+            item.get_identifier().encode(), item.storage.name, with_metadata, force
+        )
+
+        log.debug('Queued replication of item "{}"'.format(item))
+
+        self.start()
+
+        with self._condition:
+            self._condition.notify_all()
+
+        return job
+
+    def resume(self):
+        """Start the background workers if the journal has unfinished jobs.
+
+        The jobs abandoned by the crashed processes are pending again,
+        as well as the jobs left behind by the processes which exited
+        before draining the queue.
+
+        Returns:
+            bool: True if the workers were started.
+
+        """
+        self._reclaim()
+
+        if not self.get_pending():
+            return False
+
+        self.start()
+        return True
+
+    def get_jobs(self, item=None, status=None):
+        """Get the unfinished jobs.
+
+        Args:
+            item (StorageItem): item to get jobs of.
+            status (str): one of the ReplicationStatus values.
+
+        Returns:
+            list[ReplicationJob]: jobs in the order they were queued.
+
+        """
+        return self._journal.get_jobs(
+            item.get_identifier().encode() if item else None,
+            [status] if status else None,
+        )
+
+    def get_pending(self, item=None):
+        """Get the jobs which are queued or running.
+
+        Args:
+            item (StorageItem): item to get jobs of.
+
+        Returns:
+            list[ReplicationJob]: pending jobs.
+
+        """
+        return self._journal.get_jobs(
+            item.get_identifier().encode() if item else None,
+            [ReplicationStatus.PENDING, ReplicationStatus.RUNNING],
+        )
+
+    def get_failed(self, item=None):
+        return self.get_jobs(item, ReplicationStatus.FAILED)
+
+    def retry_failed(self, item=None):
+        """Queue the failed jobs again.
+
+        Args:
+            item (StorageItem): item to retry jobs of.
+
+        Returns:
+            int: number of queued jobs.
+
+        """
+        count = self._journal.retry_failed(
+            item.get_identifier().encode() if item else None
+        )
+        if count:
+            self.start()
+            with self._condition:
+                self._condition.notify_all()
+        return count
+
+    def wait(self, item=None, timeout=None):
+        """Wait until the pending jobs are finished.
+
+        Args:
+            item (StorageItem): item to wait for.
+            timeout (float): maximum time to wait in seconds.
+
+        Returns:
+            bool: True if there are no pending jobs left.
+
+        """
+        deadline = None if timeout is None else time.time() + timeout
+
+        while True:
+            if not self.get_pending(item):
+                return True
+
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                return False
+
+            with self._condition:
+                self._condition.wait(
+                    HEARTBEAT_INTERVAL if remaining is None else remaining
+                )
+
+    def _reclaim(self):
+        count = self._journal.reclaim(
+            time.time() - HEARTBEAT_INTERVAL * STALE_HEARTBEATS
+        )
+        if count:
+            log.info("Reclaimed {} abandoned replication job(s)".format(count))
+
+    def _heartbeat(self):
+        last_beat = time.time()
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                self._condition.wait(EXIT_CHECK_INTERVAL)
+                if self._stopped:
+                    return
+
+                if not self._draining and not threading.main_thread().is_alive():
+                    log.debug("Draining replication queue before exit")
+                    self._draining = True
+                    self._condition.notify_all()
+
+            # the running jobs are refreshed while draining as well
+            if time.time() - last_beat < HEARTBEAT_INTERVAL:
+                continue
+            last_beat = time.time()
+
+            try:
+                self._journal.touch(self._owner)
+                self._reclaim()
+            except Exception as e:
+                log.warning("Failed to refresh replication journal. {}".format(e))
+
+            with self._condition:
+                self._condition.notify_all()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+
+            try:
+                job = self._journal.claim(self._owner)
+            except Exception as e:
+                log.error("Failed to claim replication job. {}".format(e))
+                job = None
+
+            if job is None:
+                with self._condition:
+                    if self._draining:
+                        self._active_workers -= 1
+                        if not self._active_workers:
+                            self._stopped = True
+                            self._condition.notify_all()
+                        return
+
+                self._wait_for_jobs()
+                continue
+
+            self._process(job)
+
+            with self._condition:
+                self._condition.notify_all()
+
+    def _wait_for_jobs(self):
+        timeout = HEARTBEAT_INTERVAL
+        try:
+            next_attempt = self._journal.get_next_attempt_time()
+        except Exception:
+            next_attempt = None
+
+        if next_attempt is not None:
+            timeout = min(timeout, max(next_attempt - time.time(), 0.01))
+
+        with self._condition:
+            if not self._stopped and not self._draining:
+                self._condition.wait(timeout)
+
+    def _process(self, job):
+        from .core import Identifier
+
+        try:
+            item = self._pool.get_storage_item(Identifier.decode(job.identifier))
+
+            source_item = None
+            for chain_item in item.iter_chain() if item else []:
+                if chain_item.storage.name == job.storage:
+                    source_item = chain_item
+                    break
+
+            if source_item is None:
+                self._journal.fail(
+                    job,
+                    "Storage '{}' is not in the chain of the item".format(job.storage),
+                )
+                log.error("Failed to replicate {}. {}".format(job, job.error))
+                return
+
+            # the data isn't read back like by "push"
+            source_item._push(
+                with_metadata=job.with_metadata,
+                force=job.force,
+                priority=TransferPriority.BACKGROUND,
+            )
+        except Exception as e:
+            retry_at = None
+            if job.attempts + 1 < self._max_retries:
+                retry_at = time.time() + self._retry_delay * 2**job.attempts
+
+            self._journal.fail(job, str(e), retry_at)
+
+            if retry_at:
+                log.warning("Failed to replicate {}, retrying. {}".format(job, e))
+            else:
+                log.error("Failed to replicate {}. {}".format(job, e))
+            return
+
+        self._journal.complete(job)
+        job.status = ReplicationStatus.DONE
+
+        log.debug('Replicated item "{}"'.format(source_item))
@@ -0,0 +1,78 @@
+from .enums import TransferStatus
+
+
+class TransferResult(object):
+    def __init__(self, item, status, error=None, source=None):
+        self.item = item
+        self.status = status
+        self.error = error
+        # item the data was copied from
+        self.source = source
+
+    @property
+    def ok(self):
+        return self.status in (
+            TransferStatus.DONE,
+            TransferStatus.SKIPPED,
+            TransferStatus.PLANNED,
+        )
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return "TransferResult(item={}, status='{}', error={})".format(
+            self.item, self.status, repr(self.error)
+        )
+
+
+class TransferReport(object):
+    """Per-target outcome of an operation spanning several storage items."""
+
+    def __init__(self, results=None):
+        self._results = list(results) if results else []
+
+    def add(self, result):
+        self._results.append(result)
+        return result
+
+    @property
+    def results(self):
+        return self._results
+
+    @property
+    def ok(self):
+        return all(result.ok for result in self._results)
+
+    def get_results(self, status):
+        return [result for result in self._results if result.status == status]
+
+    @property
+    def done(self):
+        return self.get_results(TransferStatus.DONE)
+
+    @property
+    def skipped(self):
+        return self.get_results(TransferStatus.SKIPPED)
+
+    @property
+    def failed(self):
+        return self.get_results(TransferStatus.FAILED)
+
+    @property
+    def planned(self):
+        return self.get_results(TransferStatus.PLANNED)
+
+    def __iter__(self):
+        return iter(self._results)
+
+    def __len__(self):
+        return len(self._results)
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return "TransferReport(done={}, skipped={}, failed={}, planned={})".format(
+            len(self.done), len(self.skipped), len(self.failed), len(self.planned)
+        )
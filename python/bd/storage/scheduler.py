@@ -0,0 +1,227 @@
+import time
+import logging
+import itertools
+import threading
+import collections
+from contextlib import contextmanager
+
+from .enums import TransferPriority
+
+log = logging.getLogger(__name__)
+
+_ranks = {
+    TransferPriority.INTERACTIVE: 0,
+    TransferPriority.BATCH: 1,
+    TransferPriority.BACKGROUND: 2,
+}
+
+# waiting requests are promoted by one priority class per interval,
+# so the lower priority transfers are never starved
+DEFAULT_AGING_INTERVAL = 60.0
+
+
+class WaitStats(collections.namedtuple("WaitStats", ["count", "total", "max"])):
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class TokenBucket(object):
+    """Bandwidth limit shared by the transfers of a storage.
+
+    Args:
+        rate (float): number of bytes per second.
+        burst (float): maximum number of bytes transferred at once,
+            one second worth of bytes by default.
+
+    """
+
+    def __init__(self, rate, burst=None):
+        self._rate = float(rate)
+        self._capacity = float(burst or rate)
+        self._tokens = self._capacity
+        self._timestamp = time.time()
+        self._lock = threading.Lock()
+
+    def consume(self, size):
+        """Take the tokens for the bytes, waiting until they are available.
+
+        Args:
+            size (int): number of transferred bytes.
+
+        """
+        with self._lock:
+            now = time.time()
+            self._tokens = min(
+                self._capacity, self._tokens + (now - self._timestamp) * self._rate
+            )
+            self._timestamp = now
+
+            # the debt is paid off by the following transfers
+            self._tokens -= size
+            delay = -self._tokens / self._rate if self._tokens < 0 else 0
+
+        if delay:
+            time.sleep(delay)
+
+
+class _Request(object):
+    def __init__(self, storages, priority, ticket):
+        self.storages = storages
+        self.priority = priority
+        self.ticket = ticket
+        self.timestamp = time.time()
+
+    def get_key(self, now, aging_interval):
+        rank = _ranks[self.priority]
+        if aging_interval:
+            rank -= int((now - self.timestamp) / aging_interval)
+        return rank, self.ticket
+
+
+class TransferScheduler(object):
+    """Scheduler limiting the concurrent transfers of every storage.
+
+    Each transfer holds a slot of its source and target storages.
+    When the storage has no free slots, the waiting transfers start in
+    the order of their priority classes and, within the same class, in
+    the order they were requested. The waiting requests are promoted
+    over time, so the background transfers progress even when the
+    interactive ones keep coming.
+
+    The limits apply to the current process only.
+
+    Args:
+        limits (dict): maximum number of concurrent transfers by storage name.
+        default_limit (int): limit of the storages not found in "limits",
+            unlimited if not provided.
+        bandwidth (dict): maximum number of bytes per second by storage name.
+        aging_interval (float): number of seconds after which a waiting
+            request is promoted to the next priority class.
+
+    """
+
+    def __init__(
+        self,
+        limits=None,
+        default_limit=None,
+        bandwidth=None,
+        aging_interval=DEFAULT_AGING_INTERVAL,
+    ):
+        self._limits = dict(limits or {})
+        self._default_limit = default_limit
+        self._buckets = {
+            storage: TokenBucket(rate) for storage, rate in (bandwidth or {}).items()
+        }
+        self._aging_interval = aging_interval
+
+        self._condition = threading.Condition()
+        self._tickets = itertools.count()
+        self._requests = []
+        self._active = collections.Counter()
+        self._wait_stats = {priority: WaitStats(0, 0.0, 0.0) for priority in _ranks}
+
+    def get_limit(self, storage):
+        return self._limits.get(storage, self._default_limit)
+
+    def _can_start(self, request):
+        now = time.time()
+        key = request.get_key(now, self._aging_interval)
+
+        # the slots are reserved for the earlier requests of the storage
+        earlier_requests = [
+            other
+            for other in self._requests
+            if other is not request and other.get_key(now, self._aging_interval) < key
+        ]
+
+        for storage in request.storages:
+            limit = self.get_limit(storage)
+            if limit is None:
+                continue
+
+            reserved = sum(1 for other in earlier_requests if storage in other.storages)
+            if self._active[storage] + reserved >= limit:
+                return False
+
+        return True
+
+    @contextmanager
+    def slot(self, storages, priority=TransferPriority.INTERACTIVE):
+        """Wait for the slots of the storages and hold them.
+
+        Args:
+            storages (list[str]): names of the storages the data is
+                transferred between.
+            priority (str): one of the TransferPriority values.
+
+        Yields:
+            callable: function to call with the number of transferred
+                bytes, it waits when the bandwidth limit is exceeded.
+
+        """
+        if priority not in _ranks:
+            raise ValueError('Unknown transfer priority "{}"'.format(priority))
+
+        storages = tuple(sorted(set(storages)))
+        request = _Request(storages, priority, next(self._tickets))
+
+        with self._condition:
+            self._requests.append(request)
+            try:
+                while not self._can_start(request):
+                    # wake up regularly as the waiting requests age
+                    self._condition.wait(self._aging_interval or None)
+            finally:
+                self._requests.remove(request)
+                self._condition.notify_all()
+
+            for storage in storages:
+                self._active[storage] += 1
+
+            self._record_wait(priority, time.time() - request.timestamp)
+
+        buckets = [self._buckets[s] for s in storages if s in self._buckets]
+
+        def throttle(size):
+            for bucket in buckets:
+                bucket.consume(size)
+
+        try:
+            yield throttle
+        finally:
+            with self._condition:
+                for storage in storages:
+                    self._active[storage] -= 1
+                self._condition.notify_all()
+
+    def is_throttled(self, storages):
+        return any(storage in self._buckets for storage in storages)
+
+    def _record_wait(self, priority, wait_time):
+        stats = self._wait_stats[priority]
+        self._wait_stats[priority] = WaitStats(
+            stats.count + 1, stats.total + wait_time, max(stats.max, wait_time)
+        )
+
+    def get_stats(self):
+        """Get the state of the scheduler.
+
+        Returns:
+            dict: number of the waiting requests by priority ("queued"),
+                number of the running transfers by storage ("active") and
+                WaitStats of the started transfers by priority ("wait").
+
+        """
+        with self._condition:
+            queued = dict.fromkeys(_ranks, 0)
+            for request in self._requests:
+                queued[request.priority] += 1
+
+            return {
+                "queued": queued,
+                "active": {
+                    storage: count for storage, count in self._active.items() if count
+                },
+                "wait": dict(self._wait_stats),
+            }
@@ -0,0 +1,198 @@
+import os
+import logging
+import collections
+
+from .accessor import FileSystemAccessor
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+TransferProgress = collections.namedtuple("TransferProgress", ["transferred", "total"])
+
+
+def copy_stream(src, dst, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Copy data between file-like objects in fixed-size chunks.
+
+    Args:
+        src (file-like object): source stream.
+        dst (file-like object): destination stream.
+        chunk_size (int): maximum number of bytes held in memory.
+
+    Returns:
+        int: number of copied bytes.
+
+    """
+    num_bytes = 0
+    for num_bytes in _iter_copy_stream(src, dst, chunk_size):
+        pass
+    return num_bytes
+
+
+def _iter_copy_stream(src, dst, chunk_size, num_bytes=0):
+    while True:
+        chunk = src.read(chunk_size)
+        if not chunk:
+            break
+
+        dst.write(chunk)
+        num_bytes += len(chunk)
+
+        yield num_bytes
+
+
+def _get_stream_size(stream):
+    try:
+        return os.fstat(stream.fileno()).st_size
+    except Exception:
+        return getattr(stream, "size", None)
+
+
+def _get_size(accessor, rpath):
+    try:
+        stat = accessor.stat(rpath)
+    except NotImplementedError:
+        return
+
+    if stat:
+        return stat.size
+
+
+def copy(
+    src_accessor,
+    src_rpath,
+    dst_accessor,
+    dst_rpath,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    progress=None,
+    resume=False,
+    native=True,
+):
+    """Copy data between accessors without holding it in memory.
+
+    The native copy mechanisms of the accessors are tried first,
+    then the data is streamed in fixed-size chunks.
+
+    Args:
+        src_accessor (BaseAccessor): accessor to read the data from.
+        src_rpath (str): source relative path.
+        dst_accessor (BaseAccessor): accessor to write the data to.
+        dst_rpath (str): destination relative path.
+        chunk_size (int): maximum number of bytes held in memory.
+        progress (callable): function called with the number of
+            transferred bytes and the total number of bytes or None
+            if the total is unknown.
+        resume (bool): continue the previous interrupted transfer
+            if the destination is a file system accessor.
+        native (bool): use the native copy mechanisms, they report
+            the progress only once the whole data is copied.
+
+    Returns:
+        bool: False if there is no source data, True otherwise.
+
+    """
+    copied = False
+    for transferred, total in iter_copy(
+        src_accessor, src_rpath, dst_accessor, dst_rpath, chunk_size, resume, native
+    ):
+        copied = True
+        if progress:
+            progress(transferred, total)
+
+    return copied
+
+
+def iter_copy(
+    src_accessor,
+    src_rpath,
+    dst_accessor,
+    dst_rpath,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    resume=False,
+    native=True,
+):
+    """Copy data between accessors yielding the progress.
+
+    Nothing is yielded if there is no source data. Closing the
+    generator before it's exhausted aborts the copy, a resumable
+    copy can be continued later.
+
+    Args:
+        src_accessor (BaseAccessor): accessor to read the data from.
+        src_rpath (str): source relative path.
+        dst_accessor (BaseAccessor): accessor to write the data to.
+        dst_rpath (str): destination relative path.
+        chunk_size (int): maximum number of bytes held in memory.
+        resume (bool): continue the previous interrupted transfer
+            if the destination is a file system accessor.
+        native (bool): use the native copy mechanisms, they yield
+            the progress only once the whole data is copied.
+
+    Yields:
+        TransferProgress: number of transferred and total bytes.
+
+    """
+    if resume and isinstance(dst_accessor, FileSystemAccessor):
+        try:
+            source_stat = src_accessor.stat(src_rpath)
+        except NotImplementedError:
+            log.debug('Resuming is not supported for "{}"'.format(src_accessor))
+        else:
+            if source_stat is None:
+                return
+
+            for transfer_progress in _iter_copy_resumable(
+                src_accessor,
+                src_rpath,
+                dst_accessor,
+                dst_rpath,
+                chunk_size,
+                source_stat,
+            ):
+                yield transfer_progress
+            return
+
+    if native and src_accessor.copy_to(dst_accessor, src_rpath, dst_rpath):
+        log.debug('Copied "{}" using native copy of the source'.format(src_rpath))
+    elif native and dst_accessor.copy_from(src_accessor, src_rpath, dst_rpath):
+        log.debug('Copied "{}" using native copy of the target'.format(src_rpath))
+    else:
+        src = src_accessor.open_read(src_rpath)
+        if src is None:
+            return
+
+        with src:
+            total = _get_stream_size(src)
+            transferred = 0
+
+            with dst_accessor.open_write(dst_rpath) as dst:
+                for transferred in _iter_copy_stream(src, dst, chunk_size):
+                    yield TransferProgress(transferred, total)
+
+            if not transferred:
+                yield TransferProgress(0, total)
+        return
+
+    size = _get_size(dst_accessor, dst_rpath)
+    yield TransferProgress(size, size)
+
+
+def _iter_copy_resumable(
+    src_accessor, src_rpath, dst_accessor, dst_rpath, chunk_size, source_stat
+):
+    total = source_stat.size
+
+    with dst_accessor.open_partial_write(dst_rpath, source_stat) as dst:
+        transferred = dst.offset
+
+        if total is None or transferred < total:
+            src = src_accessor.open_read(src_rpath, transferred)
+            if src is None:
+                dst.abort()
+                return
+
+            with src:
+                for transferred in _iter_copy_stream(src, dst, chunk_size, transferred):
+                    yield TransferProgress(transferred, total)
+
+    yield TransferProgress(transferred, total)
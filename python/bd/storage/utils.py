@@ -1,13 +1,56 @@
 import datetime
 import os
 import re
+import json
 import hashlib
 import posixpath
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
 from bd import hooks as bd_hooks
 
 from .edits import FieldsEdit, TagsEdit
 
+_md5_regex = re.compile(r"^[0-9a-fA-F]{32}$")
+
+_network_fs_types = frozenset(
+    [
+        "nfs",
+        "nfs4",
+        "cifs",
+        "smb",
+        "smb2",
+        "smb3",
+        "smbfs",
+        "afs",
+        "ceph",
+        "glusterfs",
+        "lustre",
+        "gpfs",
+        "9p",
+        "fuse.sshfs",
+    ]
+)
+
+LEGACY_DATE_FORMAT = "%m/%d/%Y %H:%M:%S"
+
+# sidecars of the version 1 have no version key, indented JSON
+# and dates in the legacy format
+METADATA_FORMAT_KEY = "_format"
+METADATA_FORMAT_VERSION = 2
+
+# the older versions of the package only read the version 1,
+# the storages opt in to the current one with the "metadata_format" option
+DEFAULT_METADATA_FORMAT_VERSION = 1
+
 
 def create_uid(tags, fields):
     return hashlib.md5(
@@ -15,6 +58,66 @@ def create_uid(tags, fields):
     ).hexdigest()
 
 
+def is_network_path(path):
+    """Check if the path is on a network file system.
+
+    The UNC paths and the paths of the network mount points listed
+    in "/proc/mounts" are recognized, the rest are considered local.
+
+    Args:
+        path (str): file or directory path, it doesn't need to exist.
+
+    Returns:
+        bool
+
+    """
+    path = os.path.realpath(path)
+    if path.startswith("\\\\"):
+        return True
+
+    try:
+        with open("/proc/mounts") as f:
+            mounts = f.readlines()
+    except (IOError, OSError):
+        return False
+
+    # the most nested mount point containing the path
+    mount_point, fs_type = "", None
+    for line in mounts:
+        parts = line.split()
+        if len(parts) < 3:
+            continue
+
+        point = parts[1].replace("\\040", " ")
+        if path != point and not path.startswith(point.rstrip("/") + "/"):
+            continue
+
+        if len(point) >= len(mount_point):
+            mount_point, fs_type = point, parts[2]
+
+    return fs_type in _network_fs_types
+
+
+def get_digest(data):
+    """Get MD5 hex digest and size of the data.
+
+    Args:
+        data (bytes|str): data.
+
+    Returns:
+        tuple: hex digest and size.
+
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    return hashlib.md5(data).hexdigest(), len(data)
+
+
+def is_md5_digest(value):
+    return bool(_md5_regex.match(value))
+
+
 def remove_extra_fields(fields):
     return FieldsEdit(fields).remove_extra_fields().fields
 
@@ -97,10 +200,136 @@ putils = PathUtils()
 
 def json_encoder(obj):
     if isinstance(obj, (datetime.datetime, datetime.date)):
-        return obj.strftime("%m/%d/%Y %H:%M:%S")
+        return obj.strftime(LEGACY_DATE_FORMAT)
     raise TypeError("Type {} not serializable".format(type(obj)))
 
 
+def _iso_json_encoder(obj):
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    raise TypeError("Type {} not serializable".format(type(obj)))
+
+
+def encode_metadata(metadata, version=DEFAULT_METADATA_FORMAT_VERSION):
+    """Serialize metadata to the sidecar format.
+
+    The current format is compact JSON with ISO 8601 dates, written
+    with orjson when it's installed.
+
+    Args:
+        metadata (dict): metadata.
+        version (int): format version.
+
+    Returns:
+        bytes: serialized metadata.
+
+    Raises:
+        TypeError: if the metadata is not serializable.
+
+    """
+    if version == 1:
+        return json.dumps(metadata, indent=2, default=json_encoder).encode("utf-8")
+
+    if version != METADATA_FORMAT_VERSION:
+        raise ValueError("Unsupported metadata format version {}".format(version))
+
+    data = dict(metadata)
+    data[METADATA_FORMAT_KEY] = version
+    return dump_json(data)
+
+
+def decode_metadata(content):
+    """Deserialize metadata of any version of the sidecar format.
+
+    Args:
+        content (bytes|str): serialized metadata.
+
+    Returns:
+        dict: metadata with the "date" parsed to datetime.
+
+    Raises:
+        ValueError: if the content is not valid or its version is unsupported.
+
+    """
+    data = load_json(content)
+    return parse_metadata(data, data.pop(METADATA_FORMAT_KEY, 1))
+
+
+def parse_metadata(data, version):
+    """Parse the values of deserialized metadata in place.
+
+    Args:
+        data (dict): deserialized metadata.
+        version (int): format version.
+
+    Returns:
+        dict: metadata with the "date" parsed to datetime.
+
+    """
+    if version not in (1, METADATA_FORMAT_VERSION):
+        raise ValueError("Unsupported metadata format version {}".format(version))
+
+    date = data.get("date")
+    if isinstance(date, str):
+        if version == 1:
+            data["date"] = datetime.datetime.strptime(date, LEGACY_DATE_FORMAT)
+        else:
+            data["date"] = datetime.datetime.fromisoformat(date)
+    elif isinstance(date, (int, float)):
+        data["date"] = datetime.datetime.fromtimestamp(date)
+
+    return data
+
+
+def dump_json(data):
+    """Serialize data to compact JSON with ISO 8601 dates.
+
+    Args:
+        data (dict): data.
+
+    Returns:
+        bytes: serialized data.
+
+    Raises:
+        TypeError: if the data is not serializable.
+
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=_iso_json_encoder)
+        except TypeError:
+            # orjson is stricter about the keys and the integer range
+            pass
+
+    return json.dumps(data, separators=(",", ":"), default=_iso_json_encoder).encode(
+        "utf-8"
+    )
+
+
+def load_json(content):
+    """Deserialize JSON with the fastest of the installed backends.
+
+    Args:
+        content (bytes|str): serialized data.
+
+    Returns:
+        object: deserialized data.
+
+    Raises:
+        ValueError: if the content is not valid.
+
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+
+    if ujson is not None:
+        return ujson.loads(content)
+
+    if isinstance(content, bytes):
+        content = content.decode("utf-8")
+    return json.loads(content)
+
+
 def load_hooks():
     """Load hooks stored under current package."""
     bd_hooks.load([putils.join(putils.dirname(__file__), "hooks")])
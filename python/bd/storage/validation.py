@@ -27,8 +27,24 @@ schema = Schema(
                     Optional("kwargs"): dict,
                 },
                 Optional("tag_mask"): Regex(r"^[\w\s\&\|\^\(\)]*$"),
+                Optional("catalog"): {Optional("filename"): And(Use(str), len)},
+                Optional("bundle_metadata"): bool,
+                Optional("metadata_format"): Or(1, 2),
             }
         ],
+        Optional("scheduler"): {
+            Optional("limits"): {Use(str): And(int, lambda n: n > 0)},
+            Optional("default_limit"): And(int, lambda n: n > 0),
+            Optional("bandwidth"): {Use(str): And(Use(float), lambda n: n > 0)},
+            Optional("aging_interval"): And(Use(float), lambda n: n >= 0),
+        },
+        Optional("replication"): {
+            Optional("journal"): And(Use(str), len),
+            Optional("resume"): bool,
+            Optional("max_workers"): And(int, lambda n: n > 0),
+            Optional("max_retries"): And(int, lambda n: n > 0),
+            Optional("retry_delay"): And(Use(float), lambda n: n >= 0),
+        },
     }
 )
 
@@ -0,0 +1,280 @@
+import os
+import re
+import time
+import bisect
+import threading
+
+from cachetools import LRUCache
+
+DEFAULT_TTL = 5.0
+DEFAULT_MAX_SIZE = 10000
+
+# modification times of the directories changed less than that
+# before their listing are not trusted, as the following changes
+# may not change the time at the resolution of the file system
+RACY_INTERVAL = 2.0
+
+_version_index = None
+_version_index_lock = threading.Lock()
+
+
+class _Directory(object):
+    def __init__(self, names, mtime, timestamp):
+        self.names = names
+        self.mtime = mtime
+        self.timestamp = timestamp
+        # sorted primary field values by pattern
+        self.versions = {}
+
+    def get_versions(self, pattern):
+        versions = self.versions.get(pattern)
+        if versions is None:
+            versions = self.versions[pattern] = self._match(pattern, self.names)
+        return versions
+
+    @staticmethod
+    def _match(pattern, names):
+        regex = re.compile(pattern)
+        values = set()
+        for name in names:
+            match = regex.match(name)
+            if match:
+                values.add(int(match.group(1)))
+        return sorted(values)
+
+    @staticmethod
+    def _match_max(pattern, names):
+        # single pass without collecting the values
+        regex = re.compile(pattern)
+        latest = None
+        for name in names:
+            match = regex.match(name)
+            if match:
+                value = int(match.group(1))
+                if latest is None or value > latest:
+                    latest = value
+        return latest
+
+    def add(self, names):
+        names = set(names) - self.names
+        if not names:
+            return
+
+        self.names.update(names)
+        for pattern, versions in self.versions.items():
+            for value in self._match(pattern, names):
+                index = bisect.bisect_left(versions, value)
+                if index == len(versions) or versions[index] != value:
+                    versions.insert(index, value)
+
+    def update(self, names, mtime, timestamp):
+        if self.names - names:
+            # a value may be matched by several names, so the values
+            # of the removed names are found again from scratch
+            self.names = names
+            self.versions = {}
+        else:
+            self.add(names)
+
+        self.mtime = mtime
+        self.timestamp = timestamp
+
+
+class VersionIndex(object):
+    """Cache of the primary field values found in the directory listings.
+
+    The listings are revalidated by the modification time of the
+    directory on the file systems and expire after "ttl" seconds on the
+    other accessors. When the listing changes only the new names are
+    matched, and the names written by this process are added in place.
+
+    Args:
+        ttl (float): number of seconds the listings of the accessors
+            without file system paths are valid for.
+        max_size (int): maximum number of cached directories,
+            0 disables the cache.
+
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        self._ttl = ttl
+        self._max_size = max_size
+        self._cache = LRUCache(maxsize=max(max_size, 1))
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self._max_size > 0
+
+    def _get_mtime(self, accessor, dirname):
+        filename = accessor.get_filesystem_path(dirname)
+        if not filename:
+            return
+
+        try:
+            return os.stat(filename).st_mtime
+        except OSError:
+            return
+
+    def _is_valid(self, accessor, dirname, directory, now):
+        if directory.mtime is None:
+            return now - directory.timestamp < self._ttl
+
+        if directory.mtime >= directory.timestamp - RACY_INTERVAL:
+            return False
+
+        return self._get_mtime(accessor, dirname) == directory.mtime
+
+    def _get_directory(self, accessor, dirname):
+        key = (accessor, dirname)
+        now = time.time()
+
+        with self._lock:
+            directory = self._cache.get(key)
+
+        if directory is not None and self._is_valid(accessor, dirname, directory, now):
+            return directory
+
+        # the time is taken before the listing,
+        # so the changes made during it are not missed
+        mtime = self._get_mtime(accessor, dirname)
+        names = set(accessor.list(dirname, relative=True, recursive=False))
+
+        with self._lock:
+            cached_directory = self._cache.get(key)
+            if cached_directory is not None:
+                cached_directory.update(names, mtime, now)
+                return cached_directory
+
+            directory = _Directory(names, mtime, now)
+            self._cache[key] = directory
+            return directory
+
+    def get_versions(self, accessor, dirname, pattern):
+        """Get the values matched in the names of the directory entries.
+
+        Args:
+            accessor (BaseAccessor): accessor of the directory.
+            dirname (str): relative path of the directory.
+            pattern (str): regular expression matching the beginning
+                of the entry names with the value as its first group.
+
+        Returns:
+            list[int]: sorted values.
+
+        Raises:
+            OSError: if the directory doesn't exist.
+
+        """
+        if not self.enabled:
+            names = accessor.list(dirname, relative=True, recursive=False)
+            return _Directory._match(pattern, names)
+
+        directory = self._get_directory(accessor, dirname)
+        with self._lock:
+            return list(directory.get_versions(pattern))
+
+    def get_latest(self, accessor, dirname, pattern):
+        """Get the maximum value matched in the names of the directory entries.
+
+        Args:
+            accessor (BaseAccessor): accessor of the directory.
+            dirname (str): relative path of the directory.
+            pattern (str): regular expression matching the beginning
+                of the entry names with the value as its first group.
+
+        Returns:
+            int: maximum value or None if no entry matches.
+
+        Raises:
+            OSError: if the directory doesn't exist.
+
+        """
+        if not self.enabled:
+            names = accessor.list(dirname, relative=True, recursive=False)
+            return _Directory._match_max(pattern, names)
+
+        directory = self._get_directory(accessor, dirname)
+        with self._lock:
+            versions = directory.get_versions(pattern)
+
+        if versions:
+            return versions[-1]
+
+    def add(self, accessor, rpath):
+        """Add the written path to the cached listings of its parents.
+
+        Args:
+            accessor (BaseAccessor): accessor the path was written to.
+            rpath (str): relative path.
+
+        """
+        parts = rpath.strip("/").split("/")
+        with self._lock:
+            for i in range(len(parts)):
+                directory = self._cache.get((accessor, "/".join(parts[:i])))
+                if directory is not None:
+                    directory.add([parts[i]])
+
+    def invalidate(self, accessor=None, rpath=None):
+        """Drop the cached listings.
+
+        Args:
+            accessor (BaseAccessor): accessor to drop the listings of,
+                everything is dropped if not provided.
+            rpath (str): removed relative path, the listings of its parents
+                are dropped, all the listings of the accessor if not provided.
+
+        """
+        with self._lock:
+            if accessor is None:
+                self._cache.clear()
+            elif rpath is not None:
+                parts = rpath.strip("/").split("/")
+                for i in range(len(parts)):
+                    self._cache.pop((accessor, "/".join(parts[:i])), None)
+            else:
+                for key in list(self._cache.keys()):
+                    if key[0] is accessor:
+                        self._cache.pop(key, None)
+
+
+def get_version_index():
+    """Get the index of the versions found in the directory listings.
+
+    It's configured with the "BD_STORAGE_VERSION_INDEX_SIZE" and
+    "BD_STORAGE_VERSION_INDEX_TTL" environment variables, the size
+    of 0 disables it.
+
+    Returns:
+        VersionIndex: shared index.
+
+    """
+    global _version_index
+
+    if _version_index is None:
+        with _version_index_lock:
+            if _version_index is None:
+                _version_index = VersionIndex(
+                    float(os.environ.get("BD_STORAGE_VERSION_INDEX_TTL", DEFAULT_TTL)),
+                    int(
+                        os.environ.get(
+                            "BD_STORAGE_VERSION_INDEX_SIZE", DEFAULT_MAX_SIZE
+                        )
+                    ),
+                )
+
+    return _version_index
+
+
+def set_version_index(index):
+    """Replace the index of the versions found in the directory listings.
+
+    Args:
+        index (VersionIndex): new index.
+
+    """
+    global _version_index
+
+    with _version_index_lock:
+        _version_index = index
@@ -0,0 +1,151 @@
+import io
+import os
+import sys
+import contextlib
+import collections
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+
+from bd.storage import delta
+
+Stat = collections.namedtuple("Stat", ["size", "mtime", "etag"])
+
+BLOCK_SIZE = 16
+
+
+class MemoryAccessor(object):
+    """Remote accessor keeping the data in memory, like S3 with entity tags."""
+
+    def __init__(self):
+        self.files = {}
+        self._version = 0
+
+    def read(self, rpath):
+        entry = self.files.get(rpath)
+        return entry[0] if entry else None
+
+    def write(self, rpath, data):
+        self._version += 1
+        self.files[rpath] = (data, float(self._version))
+
+    def rm(self, rpath):
+        self.files.pop(rpath, None)
+
+    def stat(self, rpath):
+        entry = self.files.get(rpath)
+        if entry:
+            data, mtime = entry
+            return Stat(len(data), mtime, "etag-{}".format(mtime))
+
+    @contextlib.contextmanager
+    def open_write(self, rpath):
+        buffer = io.BytesIO()
+        yield buffer
+        self.write(rpath, buffer.getvalue())
+
+    def open_read(self, rpath, offset=0):
+        data = self.read(rpath)
+        if data is not None:
+            return io.BytesIO(data[offset:])
+
+    def get_filesystem_path(self, rpath):
+        return
+
+
+def _publish(accessor, data):
+    accessor.write("shot.abc", data)
+    accessor.write(
+        "shot.abc" + delta.SIGNATURE_SUFFIX,
+        delta.compute_signature(io.BytesIO(data), BLOCK_SIZE).dumps(),
+    )
+
+    stat = accessor.stat("shot.abc")
+    signature = delta.Signature.loads(
+        accessor.read("shot.abc" + delta.SIGNATURE_SUFFIX)
+    )
+    signature.mtime, signature.etag = stat.mtime, stat.etag
+    accessor.write("shot.abc" + delta.SIGNATURE_SUFFIX, signature.dumps())
+
+
+def test_signature_roundtrip():
+    signature = delta.compute_signature(io.BytesIO(b"x" * 40), BLOCK_SIZE)
+    signature.mtime, signature.etag = 12.5, '"abc"'
+
+    loaded = delta.Signature.loads(signature.dumps())
+
+    assert loaded.blocks == signature.blocks
+    assert loaded.digest == signature.digest
+    assert (loaded.mtime, loaded.etag) == (12.5, '"abc"')
+
+
+def test_signature_without_state_is_not_trusted():
+    signature = delta.compute_signature(io.BytesIO(b"x" * 40), BLOCK_SIZE)
+    loaded = delta.Signature.loads(signature.dumps())
+
+    assert not loaded.matches(Stat(40, 1.0, None))
+
+
+def test_republished_data_with_same_size_is_copied(tmp_path):
+    remote = MemoryAccessor()
+    local = MemoryAccessor()
+
+    old_data = b"".join(bytes([i]) * BLOCK_SIZE for i in range(8))
+    _publish(remote, old_data)
+
+    # the remote data is replaced behind the back of the signature
+    new_data = old_data[::-1]
+    assert len(new_data) == len(old_data)
+    remote.write("shot.abc", new_data)
+
+    basis = tmp_path / "shot.abc"
+    basis.write_bytes(old_data)
+
+    assert delta.get_signature(remote, "shot.abc") is None
+    assert delta.copy(remote, "shot.abc", local, "shot.abc", str(basis)) is None
+
+    # the delta transfer works again with the refreshed signature
+    _publish(remote, new_data)
+
+    stats = delta.copy(remote, "shot.abc", local, "shot.abc", str(basis))
+    assert stats is not None
+    assert local.read("shot.abc") == new_data
+
+
+def test_write_signature_binds_to_destination(tmp_path):
+    source = tmp_path / "shot.abc"
+    source.write_bytes(b"y" * 40)
+
+    class LocalAccessor(MemoryAccessor):
+        def get_filesystem_path(self, rpath):
+            return str(tmp_path / rpath)
+
+        def stat(self, rpath):
+            return Stat(os.path.getsize(str(tmp_path / rpath)), None, None)
+
+    remote = MemoryAccessor()
+    remote.write("shot.abc", b"y" * 40)
+
+    assert delta.write_signature(LocalAccessor(), "shot.abc", remote, "shot.abc")
+    assert delta.get_signature(remote, "shot.abc") is not None
+
+    remote.write("shot.abc", b"z" * 40)
+    assert delta.get_signature(remote, "shot.abc") is None
+
+    # the outdated sidecar is removed when there is nothing to write
+    remote.write("other.abc" + delta.SIGNATURE_SUFFIX, b"outdated")
+    assert not delta.write_signature(remote, "shot.abc", remote, "other.abc")
+    assert remote.read("other.abc" + delta.SIGNATURE_SUFFIX) is None
+
+
+def test_signature_is_not_computed_on_request(tmp_path):
+    source = tmp_path / "shot.abc"
+    source.write_bytes(b"y" * 40)
+
+    class LocalAccessor(MemoryAccessor):
+        def get_filesystem_path(self, rpath):
+            return str(tmp_path / rpath)
+
+    accessor = LocalAccessor()
+
+    assert delta.get_signature(accessor, "shot.abc", BLOCK_SIZE) is not None
+    assert delta.get_signature(accessor, "shot.abc", BLOCK_SIZE, compute=False) is None